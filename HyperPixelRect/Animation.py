@@ -0,0 +1,123 @@
+# Animation.py
+# Smooth animation playback: full masks at keyframes, cheap frames in between
+
+import math
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+import numpy as np
+
+from Terminator import sun_position
+
+ANIMATION_FPS = 60                          # playback rate, independent of full-render cost
+ANIMATION_SPEED = 3600.0                    # simulated seconds per real second
+KEYFRAME_SPACING = timedelta(hours=6)       # simulated time between full masks
+KEYFRAME_CACHE = 3                          # keyframes kept (the pair in use and one spare)
+_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+class KeyframeAnimator:
+    """ Animation frames for a FrameArena without a full mask per frame.
+
+    The mask depends on two things. The declination only changes the
+    mask's shape, and it drifts less than half a degree a day. The sun's
+    longitude moves the whole mask east-west, and the blur wraps at the
+    date line, so that is an exact shift. Keyframes are full masks
+    (zenith, twilight, blur) computed with the sun over longitude 0, at
+    fixed KEYFRAME_SPACING steps of simulated time. A frame between two
+    keyframes is their per-pixel interpolation, shifted by the sun's
+    current longitude and then blended as usual, a fraction of a full
+    render's cost whatever the blur radius.
+    """
+    def __init__(self, arena, spacing=KEYFRAME_SPACING, cache=KEYFRAME_CACHE):
+        w, h = arena.size
+        self.arena = arena
+        self.spacing = spacing
+        self.keyframes_computed = 0
+        self._cache = OrderedDict()         # keyframe index -> (h, w) uint16 mask
+        self._spare = [np.empty((h, w), dtype=np.uint16) for _ in range(max(2, cache))]
+        self._a = np.empty((h, w), dtype=np.uint16)
+        self._b = np.empty((h, w), dtype=np.uint16)
+
+    def keyframe(self, i):
+        """ Mask for keyframe i, computing it (and evicting the oldest) if needed.
+        """
+        mask = self._cache.get(i)
+        if mask is not None:
+            self._cache.move_to_end(i)
+            return mask
+        if self._spare:
+            mask = self._spare.pop()
+        else:
+            _, mask = self._cache.popitem(last=False)
+        decl, _ = sun_position(_EPOCH + i * self.spacing)
+        np.copyto(mask, self.arena.solar_mask(decl, 0.0))
+        self._cache[i] = mask
+        self.keyframes_computed += 1
+        return mask
+
+    def invalidate(self):
+        """ Drop the cached keyframes, e.g. after the arena's blur radius changed.
+        """
+        while self._cache:
+            self._spare.append(self._cache.popitem()[1])
+
+    def compute_mask(self, dt_utc):
+        """ Interpolated, shifted mask for dt_utc into arena.mask.
+        """
+        w = self.arena.size[0]
+        t = (dt_utc - _EPOCH) / self.spacing
+        i = math.floor(t)
+        weight = int((t - i) * 256)         # 0..255, weight of keyframe i + 1
+        k0 = self.keyframe(i)
+        k1 = self.keyframe(i + 1)
+        a, b = self._a, self._b
+        np.multiply(k0, 256 - weight, out=a)
+        np.multiply(k1, weight, out=b)
+        np.add(a, b, out=a)                 # at most 255 * 256: fits uint16
+        np.right_shift(a, 8, out=a)
+
+        # keyframes have the sun at longitude 0; move it to where it is now
+        _, sun_lon = sun_position(dt_utc)
+        s = int(round(sun_lon / (2 * math.pi) * w)) % w
+        mask = self.arena.mask
+        mask[:, s:] = a[:, :w - s]
+        mask[:, :s] = a[:, w - s:]
+        return mask
+
+    def render(self, dt_utc, cities):
+        """ Animation frame into the arena's back surface, like arena.render().
+        """
+        self.compute_mask(dt_utc)
+        return self.arena.render_mask(dt_utc, cities)
+
+if __name__ == "__main__":
+    # Self-check: interpolated masks track full ones, and frames are cheap
+    import os, time
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    from FrameArena import FrameArena, frame_allocations, FRAME_ALLOC_BUDGET
+    from MapSettings import TWILIGHT_BLUR_RADIUS
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    arena = FrameArena((800, 400), TWILIGHT_BLUR_RADIUS)
+    animator = KeyframeAnimator(arena)
+    t0 = datetime(2025, 3, 18, 7, 13, tzinfo=timezone.utc)
+    worst = 0.0
+    for n in range(48):
+        dt = t0 + timedelta(minutes=37 * n)
+        full = arena.compute_mask(dt).astype(np.int16)
+        err = np.abs(animator.compute_mask(dt).astype(np.int16) - full).mean()
+        worst = max(worst, err)
+    print(f"mean mask error vs full render: {worst:.2f} worst")
+    assert worst < 2.0, worst
+
+    def timed(fn):
+        times = []
+        for n in range(30):
+            start = time.perf_counter()
+            fn(t0 + timedelta(seconds=ANIMATION_SPEED / ANIMATION_FPS * n), {})
+            times.append(time.perf_counter() - start)
+        return 1000 * sorted(times)[len(times) // 2]
+    print(f"full frame {timed(arena.render):.1f} ms, keyframed frame {timed(animator.render):.1f} ms")
+    sizes = frame_allocations(lambda n: animator.render(t0 + timedelta(seconds=60 * n), {}))
+    assert max(sizes) < FRAME_ALLOC_BUDGET, sizes
+    print("ok")
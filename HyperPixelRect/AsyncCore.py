@@ -0,0 +1,112 @@
+# AsyncCore.py
+# asyncio building blocks for HyperPixelApp: a thread -> loop queue bridge,
+# periodic jobs on deadlines, and a small JSON stats endpoint
+
+import asyncio, json, threading, time
+from collections import deque
+
+class AsyncQueueBridge:
+    """ Stand-in for the queue.Queue soco puts subscription events into.
+
+    soco's event listener calls put() on its own thread; the item is handed
+    to the event loop with call_soon_threadsafe, so a task awaiting get()
+    wakes exactly when an event arrives instead of polling with a timeout.
+    Items put before attach() are kept and delivered once it's called.
+    """
+    def __init__(self):
+        self._loop = None
+        self._queue = None
+        self._early = deque()
+        self._lock = threading.Lock()
+
+    def attach(self, loop):
+        with self._lock:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            while self._early:
+                self._queue.put_nowait(self._early.popleft())
+
+    def put(self, item, block=True, timeout=None):
+        with self._lock:
+            if self._loop is None:
+                self._early.append(item)
+                return
+            loop, queue = self._loop, self._queue
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            pass                            # loop already closed: shutting down
+
+    put_nowait = put
+
+    def qsize(self):
+        return self._queue.qsize() if self._queue is not None else len(self._early)
+
+    async def get(self):
+        return await self._queue.get()
+
+    def get_nowait(self):
+        """ Raises asyncio.QueueEmpty when nothing is waiting.
+        """
+        return self._queue.get_nowait()
+
+async def wait_event(event, timeout):
+    """ Wait for an asyncio.Event up to timeout seconds; True if it was set
+    (and clears it), False on timeout.
+    """
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        return False
+    event.clear()
+    return True
+
+async def every(interval, fn, delay=0.0):
+    """ Run fn() every interval seconds, on deadlines like HyperPixelApp's
+    Scheduler: the cadence holds, missed runs are not caught up.
+    """
+    loop = asyncio.get_running_loop()
+    due = loop.time() + delay
+    while True:
+        await asyncio.sleep(max(0.0, due - loop.time()))
+        fn()
+        due = max(due + interval, loop.time())
+
+async def serve_stats(stats, host="127.0.0.1", port=8765):
+    """ GET any path -> stats() as JSON. One response per connection.
+    Returns the asyncio server; close() it to stop.
+    """
+    async def handle(reader, writer):
+        try:
+            await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+            body = json.dumps(stats(), indent=1).encode("utf-8")
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         b"Content-Length: %d\r\nConnection: close\r\n\r\n" % len(body) + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+class LoopStats:
+    """ How late the loop wakes up for a timer: a busy or blocked loop shows
+    here before it shows on the panel.
+    """
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self.lag_ms = 0.0
+        self.worst_lag_ms = 0.0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag_ms = 1000 * (loop.time() - start - self.interval)
+            self.worst_lag_ms = max(self.worst_lag_ms, self.lag_ms)
+
+    def snapshot(self):
+        return {"lag_ms": round(self.lag_ms, 2), "worst_lag_ms": round(self.worst_lag_ms, 2)}
@@ -0,0 +1,165 @@
+# CityLabels.py
+# City names with live local time, drawn from a pre-rasterized glyph atlas
+
+from collections import OrderedDict
+from datetime import timezone, timedelta
+import pygame
+
+from Terminator import latlon_to_xy
+
+LABEL_FONT_SIZE = 16
+LABEL_COLOR = (255, 255, 255)
+LABEL_SHADOW = (0, 0, 0)
+LABEL_CACHE_STRINGS = 512       # rendered strings kept (names stay; clock strings cycle)
+TIME_FORMAT = "%H:%M"
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:             # Python < 3.9: longitude offsets only
+    ZoneInfo = None
+
+class GlyphAtlas:
+    """ Every glyph the labels can use, rendered once (with a 1 px drop
+    shadow) into a single surface. Strings are assembled by blitting glyph
+    areas out of it, and kept in an LRU cache, so Font.render never runs
+    while the map is up.
+    """
+    def __init__(self, chars, size=LABEL_FONT_SIZE, color=LABEL_COLOR, shadow=LABEL_SHADOW,
+                 font_path=None, max_strings=LABEL_CACHE_STRINGS):
+        if not pygame.font.get_init():
+            pygame.font.init()
+        font = pygame.font.Font(font_path, size)
+        self.height = font.get_linesize() + 1
+        chars = sorted(set(chars) | {" ", "?"})
+        glyphs = []
+        for ch in chars:
+            fill = font.render(ch, True, color)
+            dark = font.render(ch, True, shadow)
+            glyph = pygame.Surface((fill.get_width() + 1, self.height), pygame.SRCALPHA)
+            glyph.blit(dark, (1, 1))
+            glyph.blit(fill, (0, 0))
+            glyphs.append((ch, glyph, fill.get_width()))
+
+        self.atlas = pygame.Surface((sum(g.get_width() for _, g, _ in glyphs), self.height), pygame.SRCALPHA)
+        self.glyphs = {}            # char -> (area in atlas, advance)
+        x = 0
+        for ch, glyph, advance in glyphs:
+            self.atlas.blit(glyph, (x, 0))
+            self.glyphs[ch] = (pygame.Rect(x, 0, glyph.get_width(), self.height), advance)
+            x += glyph.get_width()
+        self.max_strings = max_strings
+        self._strings = OrderedDict()
+
+    def render(self, text):
+        """ Surface for text, from the cache when possible.
+        """
+        surface = self._strings.get(text)
+        if surface is not None:
+            self._strings.move_to_end(text)
+            return surface
+        missing = self.glyphs["?"]
+        parts = [self.glyphs.get(ch, missing) for ch in text]
+        width = sum(advance for _, advance in parts) + 1
+        surface = pygame.Surface((max(1, width), self.height), pygame.SRCALPHA)
+        x = 0
+        for area, advance in parts:
+            surface.blit(self.atlas, (x, 0), area)
+            x += advance
+        self._strings[text] = surface
+        if len(self._strings) > self.max_strings:
+            self._strings.popitem(last=False)
+        return surface
+
+class CityLabels:
+    """ "Name HH:MM" next to each city's cross, kept on a transparent layer
+    the size of the map.
+
+    The layer is composed once; after that only the rectangles of clock
+    strings that changed are recomposed (with whatever parts of nearby
+    labels overlap them), and they can only change when the UTC minute
+    does. Drawing onto a frame is one blit of the layer's
+    labelled area, whatever the number of cities. zones maps city names to
+    IANA zones; cities without one get their longitude's nautical offset.
+    """
+    def __init__(self, cities, zones, size, atlas=None, time_format=TIME_FORMAT):
+        w, h = size
+        self.size = size
+        self.time_format = time_format
+        if atlas is None:
+            atlas = GlyphAtlas("".join(cities) + "0123456789:-+~")
+        self.atlas = atlas
+        self.layer = pygame.Surface(size, pygame.SRCALPHA)
+        self.dirty = []             # rects redrawn by the last update()
+        self._minute = None
+        self._labels = []           # [name, tz, time_pos, time_rect, text, time surface]
+        self._names = []            # (name surface, rect), in the order they were composed
+        self.bounds = pygame.Rect(0, 0, 0, 0)
+
+        gap = 8
+        for name, (lat, lon) in cities.items():
+            x, y = latlon_to_xy(lat, lon, w, h)
+            tz = self._zone(zones.get(name), lon)
+            name_surf = atlas.render(name)
+            widest = name_surf.get_width() + atlas.render(" 00:00").get_width()
+            # to the right of the cross, or the left near the east edge
+            lx = x + gap if x + gap + widest <= w else x - gap - widest
+            ly = min(max(0, y - atlas.height // 2), h - atlas.height)
+            self.layer.blit(name_surf, (lx, ly))
+            self._names.append((name_surf, pygame.Rect((lx, ly), name_surf.get_size())))
+            extent = pygame.Rect(lx, ly, widest, atlas.height)
+            self.bounds = self.bounds.union(extent) if self.bounds.width else extent
+            time_pos = (lx + name_surf.get_width() + atlas.glyphs[" "][1], ly)
+            self._labels.append([name, tz, time_pos, pygame.Rect(time_pos, (0, 0)), None, None])
+
+    @staticmethod
+    def _zone(zone_name, lon):
+        if zone_name and ZoneInfo is not None:
+            try:
+                return ZoneInfo(zone_name)
+            except Exception as e:
+                print(f"Unknown time zone {zone_name}: {e}")
+        return timezone(timedelta(hours=round(lon / 15.0)))
+
+    def update(self, dt_utc):
+        """ Bring the clock strings up to dt_utc; returns the rects redrawn.
+        """
+        minute = dt_utc.replace(second=0, microsecond=0)
+        if minute == self._minute:
+            self.dirty = []
+            return self.dirty
+        self._minute = minute
+        dirty = []
+        for label in self._labels:
+            name, tz, pos, rect, text, _ = label
+            new = dt_utc.astimezone(tz).strftime(self.time_format)
+            if new == text:
+                continue
+            surf = self.atlas.render(new)
+            label[3:] = [pygame.Rect(pos, surf.get_size()), new, surf]
+            dirty.append(rect.union(label[3]))
+        for area in dirty:
+            self._recompose(area)
+        self.dirty = dirty
+        return dirty
+
+    def _recompose(self, area):
+        """ Clear area and draw back every name and clock string reaching
+        into it, clipped to it and in composition order, so labels that
+        overlap a changed clock keep their glyphs.
+        """
+        layer = self.layer
+        layer.fill((0, 0, 0, 0), area)
+        layer.set_clip(area)
+        for surf, rect in self._names:
+            if rect.colliderect(area):
+                layer.blit(surf, rect)
+        for label in self._labels:
+            if label[5] is not None and label[3].colliderect(area):
+                layer.blit(label[5], label[3])
+        layer.set_clip(None)
+
+    def draw(self, surface, dt_utc):
+        """ FrameArena overlay hook: update, then lay the labels over the frame.
+        """
+        self.update(dt_utc)
+        surface.blit(self.layer, self.bounds, self.bounds)
@@ -0,0 +1,326 @@
+# Compositor.py
+# The map as named layers, each invalidated on its own trigger, recomposed
+# only where something changed
+
+import math
+import pygame
+
+from Terminator import (sun_position, subsolar_point, sublunar_point, latlon_to_xy,
+                        draw_markers_on_surface, RenderCancelled)
+
+TWILIGHT_STEP_PX = 0.25         # re-blend once the terminator has moved this far (~27 s on 800 px)
+DAMAGE_MAX_RECTS = 8            # more dirty rects than this are merged into their bounding box
+MARKER_SIZE = 6                 # half-size of a cross, as Terminator.draw_markers_on_surface
+SUN_COLOR = (255, 255, 0)
+MOON_COLOR = (0, 255, 255)
+CITY_COLOR = (255, 0, 0)
+
+def cross_rect(x, y, size=MARKER_SIZE):
+    """ Area a marker cross at (x, y) covers, line width included.
+    """
+    return pygame.Rect(x - size - 1, y - size - 1, 2 * size + 3, 2 * size + 3)
+
+def merge_rects(rects, limit=DAMAGE_MAX_RECTS):
+    """ Overlapping rects joined; past limit, one bounding rect.
+    """
+    merged = []
+    for r in rects:
+        r = pygame.Rect(r)
+        i = r.collidelist(merged)
+        while i != -1:
+            r.union_ip(merged.pop(i))
+            i = r.collidelist(merged)
+        merged.append(r)
+    if len(merged) > limit:
+        merged = [merged[0].unionall(merged[1:])]
+    return merged
+
+class Layer:
+    """ One named layer. update(dt_utc) brings it up to date and returns the
+    rects (map coordinates) whose pixels changed, [] when its trigger
+    hasn't fired. compose(target, rect) draws the layer's cached pixels for
+    that rect; layers above the first are transparent.
+    """
+    name = "layer"
+
+    def __init__(self):
+        self.updates = 0
+
+    def update(self, dt_utc):
+        return []
+
+    def compose(self, target, rect):
+        pass
+
+    def invalidate(self):
+        """ Redraw on the next frame, whatever the trigger says.
+        """
+
+class TwilightLayer(Layer):
+    """ The opaque bottom layer: day and night imagery ("base") blended by
+    the twilight mask. Two triggers: the imagery changing (set_images, e.g.
+    the monthly image's blend step) and the terminator having moved
+    TWILIGHT_STEP_PX since the mask was computed. Between them the cached
+    blend is reused as is; that's where the frame time goes otherwise.
+    """
+    name = "twilight"
+
+    def __init__(self, arena, compute_mask=None, step_px=TWILIGHT_STEP_PX):
+        super().__init__()
+        self.arena = arena
+        self.compute_mask = compute_mask or arena.compute_mask  # e.g. KeyframeAnimator.compute_mask
+        self.step_px = step_px
+        self.base_updates = 0
+        self._key = None
+        self._base_key = None
+
+    def key(self, dt_utc):
+        w = self.arena.size[0]
+        decl, sun_lon = sun_position(dt_utc)
+        px = sun_lon / (2 * math.pi) * w
+        # declination in the same units: a degree of it moves the terminator about as far as a degree of longitude
+        return round(px / self.step_px), round(math.degrees(decl) / 360.0 * w / self.step_px)
+
+    def update(self, dt_utc, cancelled=None):
+        key = self.key(dt_utc)
+        base_key = self.arena._day_source
+        if key == self._key and base_key is self._base_key:
+            return []
+        self.compute_mask(dt_utc)
+        if cancelled is not None and cancelled():
+            raise RenderCancelled()
+        self.arena.blend_base()
+        if base_key is not self._base_key:
+            self.base_updates += 1
+        self._key, self._base_key = key, base_key
+        self.updates += 1
+        return [pygame.Rect((0, 0), self.arena.size)]
+
+    def compose(self, target, rect):
+        target.blit(self.arena.base_surface, rect, rect)
+
+    def invalidate(self):
+        self._key = None
+
+class CitiesLayer(Layer):
+    """ City crosses: drawn once, redrawn only by invalidate() (the city list changed).
+    """
+    name = "static"
+
+    def __init__(self, size, cities, color=CITY_COLOR):
+        super().__init__()
+        self.size = size
+        self.cities = cities
+        self.color = color
+        self.surface = pygame.Surface(size, pygame.SRCALPHA)
+        self._drawn = None          # rects drawn last time
+
+    def update(self, dt_utc):
+        if self._drawn is not None:
+            return []
+        w, h = self.size
+        self.surface.fill((0, 0, 0, 0))
+        self._drawn = []
+        for lat, lon in self.cities.values():
+            draw_markers_on_surface(self.surface, lat, lon, self.color)
+            self._drawn.append(cross_rect(*latlon_to_xy(lat, lon, w, h)))
+        self.updates += 1
+        return self._drawn or [pygame.Rect((0, 0), self.size)]
+
+    def compose(self, target, rect):
+        target.blit(self.surface, rect, rect)
+
+    def invalidate(self, cities=None):
+        if cities is not None:
+            self.cities = cities
+        self._drawn = None
+
+class MarkersLayer(Layer):
+    """ Subsolar and sublunar crosses. The trigger is either moving a whole
+    pixel; the damage is where each cross was and where it is now.
+    """
+    name = "markers"
+
+    def __init__(self, size):
+        super().__init__()
+        self.size = size
+        self.surface = pygame.Surface(size, pygame.SRCALPHA)
+        self._at = None             # ((sun x, y), (moon x, y))
+
+    def update(self, dt_utc):
+        w, h = self.size
+        at = (latlon_to_xy(*subsolar_point(dt_utc), w, h), latlon_to_xy(*sublunar_point(dt_utc), w, h))
+        if at == self._at:
+            return []
+        dirty = [cross_rect(*p) for p in self._at] if self._at else []
+        for r in dirty:
+            self.surface.fill((0, 0, 0, 0), r)
+        # the same crosses as draw_markers_on_surface, at the pixels already worked out
+        for (x, y), color in zip(at, (SUN_COLOR, MOON_COLOR)):
+            pygame.draw.line(self.surface, color, (x - MARKER_SIZE, y), (x + MARKER_SIZE, y), 2)
+            pygame.draw.line(self.surface, color, (x, y - MARKER_SIZE), (x, y + MARKER_SIZE), 2)
+            dirty.append(cross_rect(x, y))
+        self._at = at
+        self.updates += 1
+        return dirty
+
+    def compose(self, target, rect):
+        target.blit(self.surface, rect, rect)
+
+    def invalidate(self):
+        self._at = None
+        self.surface.fill((0, 0, 0, 0))
+
+class OverlayLayer(Layer):
+    """ Adapter for the FrameArena overlays (Isolines, CityLabels,
+    TimeZoneBands): each already keeps its own transparent .layer and
+    redraws it only on its own trigger; update() returning True means all
+    of it changed, a list means just those rects.
+    """
+    def __init__(self, overlay, name="hud"):
+        super().__init__()
+        self.overlay = overlay
+        self.name = name
+        self._full = pygame.Rect((0, 0), overlay.layer.get_size())
+
+    def update(self, dt_utc):
+        changed = self.overlay.update(dt_utc)
+        if not changed:
+            return []
+        self.updates += 1
+        return [self._full] if changed is True else list(changed)
+
+    def compose(self, target, rect):
+        target.blit(self.overlay.layer, rect, rect)
+
+    def invalidate(self):
+        invalidate = getattr(self.overlay, "invalidate", None)
+        if invalidate is not None:
+            invalidate()
+
+class Compositor:
+    """ Builds FrameArena frames from named layers: the twilight blend
+    (over the base imagery), city crosses, moving markers, then the HUD
+    overlays, bottom to top.
+
+    Each frame asks every layer for the rects its trigger changed. None
+    changed: render() returns None and there's nothing new to publish.
+    Otherwise only the damaged rects are recomposed, layer by layer, into
+    the arena's back buffer. The arena double-buffers, so each of its two
+    frames accumulates the damage it missed while the other was drawn.
+    """
+    def __init__(self, arena, cities, compute_mask=None):
+        self.arena = arena
+        self.twilight = TwilightLayer(arena, compute_mask)
+        self.static = CitiesLayer(arena.size, cities)
+        self.markers = MarkersLayer(arena.size)
+        self.hud = [OverlayLayer(o) for o in arena.overlays]
+        full = pygame.Rect((0, 0), arena.size)
+        self._damage = [[full], [full]]     # per arena frame: rects it hasn't caught up on
+        self.frames = 0
+        self.recomposed_px = 0
+
+    @property
+    def layers(self):
+        return [self.twilight, self.static, self.markers] + self.hud
+
+    def layer(self, name):
+        for layer in self.layers:
+            if layer.name == name:
+                return layer
+        raise KeyError(name)
+
+    def add_overlay(self, overlay, name="hud"):
+        layer = OverlayLayer(overlay, name)
+        self.hud.append(layer)
+        self._damage_all()
+        return layer
+
+    def set_overlays(self, overlays):
+        """ Replace the HUD layers, e.g. after a configuration reload.
+        """
+        self.hud = [OverlayLayer(o) for o in overlays]
+        self._damage_all()
+
+    def invalidate(self, name=None):
+        """ Force one layer (or all of them) to redraw on the next frame.
+        """
+        for layer in self.layers:
+            if name is None or layer.name == name:
+                layer.invalidate()
+        self._damage_all()
+
+    def _damage_all(self):
+        full = pygame.Rect((0, 0), self.arena.size)
+        self._damage = [[full], [full]]
+
+    def render(self, dt_utc, cancelled=None):
+        """ The arena's back surface brought up to dt_utc, or None when no
+        layer changed. Swap the arena once the frame is published.
+        """
+        dirty = self.twilight.update(dt_utc, cancelled)
+        for layer in self.layers[1:]:
+            dirty += layer.update(dt_utc)
+        index, surface = self.arena.back_surface()
+        if not dirty and not self._damage[index]:
+            return None
+        self._damage[1 - index] = merge_rects(self._damage[1 - index] + dirty)
+        damage = merge_rects(self._damage[index] + dirty)
+        layers = self.layers
+        bounds = surface.get_rect()
+        for rect in damage:
+            rect = rect.clip(bounds)
+            for layer in layers:
+                layer.compose(surface, rect)
+            self.recomposed_px += rect.width * rect.height
+        self._damage[index] = []
+        self.frames += 1
+        return surface
+
+    def stats(self):
+        stats = {layer.name: layer.updates for layer in self.layers}
+        stats["base"] = self.twilight.base_updates
+        stats["frames"] = self.frames
+        return stats
+
+if __name__ == "__main__":
+    # Self-check: composed frames match full renders, and an idle minute costs little
+    import os, sys, time
+    from datetime import datetime, timezone, timedelta
+    import numpy as np
+    from PIL import Image
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    from FrameArena import FrameArena
+    from MapSettings import TWILIGHT_BLUR_RADIUS
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    day = Image.open(sys.argv[1] if len(sys.argv) > 1 else "day.jpg").convert("RGB")
+    night = Image.open(sys.argv[2] if len(sys.argv) > 2 else "night.jpg").convert("RGB")
+    cities = {"Null Island": (0.0, 0.0), "Tokyo": (35.6895, 139.6917)}
+    t0 = datetime(2025, 3, 20, 12, tzinfo=timezone.utc)
+
+    reference = FrameArena(day.size, TWILIGHT_BLUR_RADIUS)
+    reference.set_images(day, night)
+    arena = FrameArena(day.size, TWILIGHT_BLUR_RADIUS)
+    arena.set_images(day, night)
+    comp = Compositor(arena, cities)
+
+    frames, skipped, times = 0, 0, []
+    for n in range(600):                # a minute at 10 fps
+        dt = t0 + timedelta(seconds=0.1 * n)
+        start = time.perf_counter()
+        surface = comp.render(dt)
+        times.append(time.perf_counter() - start)
+        if surface is None:
+            skipped += 1
+            continue
+        arena.swap()
+        frames += 1
+    ours = pygame.surfarray.array3d(arena._surfaces[1 - arena._back]).astype(np.int16)
+    full = pygame.surfarray.array3d(reference.render(dt, cities)).astype(np.int16)
+    err = np.abs(ours - full).mean()
+    print(f"{frames} frames composed, {skipped} skipped; mean error vs full render {err:.2f}")
+    print(f"layer updates: {comp.stats()}")
+    print(f"median {1000 * sorted(times)[len(times) // 2]:.2f} ms, worst {1000 * max(times):.1f} ms per frame")
+    assert err < 1.0, err
+    print("ok")
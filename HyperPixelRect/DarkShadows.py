@@ -1,7 +1,8 @@
 #!/home/pi/HyperPixel/.venv/bin/python3
 # DarkShadows.py
 
-import os
+import os, time
+_t_start = time.monotonic()     # for the time-to-first-pixel log
 # must set this BEFORE importing pygame
 os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
 os.environ.setdefault("SDL_VIDEO_ALLOW_SCREENSAVER", "0")
@@ -9,259 +10,519 @@ os.environ["SDL_VIDEO_WINDOW_POS"] = "0,0"
 os.environ["SDL_VIDEO_FOREIGN"] = "1"
 import pygame
 
-import sys, math, signal,time
+import sys, math, signal, json
 from datetime import datetime, timezone, timedelta
-from PIL import Image, ImageFilter, ImageDraw
 import threading
-import numpy as np
-import ephem
+from DisplayBackend import make_backend, fb_geometry
+from TimeScrub import TimeScrub
+# PIL, NumPy and ephem (via ImageCache / Terminator) are imported lazily in
+# load_assets(), after the persisted last frame is already on the panel
 
 # -----------------------
 # Configuration
 # -----------------------
-DAY_IMAGE_PATH   = "day.jpg"    # your 400x800 day image
-NIGHT_IMAGE_PATH = "night.jpg"  # your 400x800 night image
-TWILIGHT_BLUR_RADIUS = 4        # set 0 to disable
-UPDATE_FPS = 10                 # update redraws per second (10 is a good compromise)
+from MapSettings import (DAY_IMAGE_PATH, NIGHT_IMAGE_PATH, CITIES, CITY_TIMEZONES,    # shared with HyperPixelApp.py
+                         TWILIGHT_BLUR_RADIUS, UPDATE_FPS)
 NORMAL_OPS = True
 ANIMATION = not NORMAL_OPS
 ANIMATION_INTERVAL = timedelta(days=1)
-
-CITIES = {
-    "Null Island": (0.0, 0.0),
-    "Portage": (42.2012, -85.5800),
-    "Tokyo": (35.6895, 139.6917),
-    "Stockholm": (59.3293, 18.0686),
-    "Honolulu": (21.3069, -157.8583),
-    "NYC": (40.7128, -74.0060),
-    "LA": (34.0522, -118.2437),
-    "Tierra del Fuego": (-54.8019, -68.3029),
-    "Sydney": (-33.8688, 151.2093),
-    "João Pessoa": (-7.115, -34.86306),
-    "Cape Town": (-33.917419, 18.386274),
-}
+ANIMATION_KEYFRAMES = False     # smooth playback: full masks only at keyframes, interpolated frames in between
+ANIMATION_FPS = 60              # keyframed playback rate, whatever a full render costs
+ANIMATION_SPEED = 3600.0        # keyframed playback: simulated seconds per real second (replaces ANIMATION_INTERVAL)
+ANIMATION_KEYFRAME_SPACING = timedelta(hours=6)    # simulated time between full masks
+MONTHLY_DAY_IMAGES = False      # cross-blend day_01.jpg .. day_12.jpg by date (missing months use DAY_IMAGE_PATH)
+MONTHLY_DAY_IMAGE_PATTERN = "day_{month:02d}.jpg"
+IMAGE_CACHE_MB = 12             # memory bound for decoded monthly images
+STATE_DIR = os.path.expanduser("~/.cache/hyperpixel")
+LAST_FRAME_PATH = os.path.join(STATE_DIR, "darkshadows_frame.raw")     # raw RGB, shown at startup
+LAST_STATE_PATH = os.path.join(STATE_DIR, "darkshadows_state.json")    # size and ephemeris of that frame
+DISPLAY_BACKEND = "sdl"         # "sdl" (display.flip) or "fbdev" (mmap FB_DEVICE directly, no SDL video)
+FB_DEVICE = "/dev/fb0"
+PIXEL_FORMAT = "rgb888"         # "rgb565": blend and present packed 16-bit, as HyperPixel framebuffers run
+TIME_SCRUB = True               # drag across the touch panel to move through time
+SCRUB_FPS = 60                  # loop rate while scrubbing, keeps input-to-preview under 50 ms
+ISOLINES = False                # sun-elevation contours (0, -6, -12, -18, +30, +60 deg) and the noon meridian
+CITY_LABELS = False             # city names with their local time next to the crosses
+TAP_INFO = True                 # tap the map: local time, zone, sun elevation, next sunrise/sunset
+TZ_INDEX_PATH = "tz_index"      # built by TimeZoneIndex.py (.u16 + .json); nautical zones without it
+TZ_BANDS = False                # shade every other UTC-offset band (needs TZ_INDEX_PATH)
+COMPOSITOR = True               # layered frames: re-blend only when the terminator moves, recompose only damaged areas
+BLEND_SPACE = "srgb"            # "linear": day and night mixed in linear light, a brighter, cleaner twilight (rgb888 only)
+COMPUTE_BACKEND = "auto"        # "auto" (benchmark once, cached), "numpy", "numexpr" or "numba"
+FRAME_ALLOC_TRACE = False       # diagnostic: print bytes allocated per frame (tracemalloc, slow)
+OUTPUTS = []                    # more panels showing the same frames, resampled rather than rendered again:
+                                # (framebuffer device, degrees clockwise the map is turned), e.g. [("/dev/fb1", 90)]
+FRAME_SERVER_PORT = None        # e.g. 8080: http://<pi>:8080/ streams what the panel shows (FrameServer.py)
+FRAME_SERVER_HOST = "0.0.0.0"
+CONFIG_PATH = "darkshadows.json"    # JSON overrides for the LIVE_SETTINGS below, picked up while running; None to ignore
+LIVE_SETTINGS = ("CITIES", "CITY_TIMEZONES", "DAY_IMAGE_PATH", "NIGHT_IMAGE_PATH", "UPDATE_FPS",
+                 "TWILIGHT_BLUR_RADIUS", "ISOLINES", "CITY_LABELS", "TZ_BANDS", "ANIMATION_SPEED", "ANIMATION_FPS")
+
+# overrides from CONFIG_PATH go in before anything reads the settings
+live_config = None
+if CONFIG_PATH:
+    from LiveConfig import LiveConfig, ConfigWatcher, positive, non_negative
+    live_config = LiveConfig(CONFIG_PATH, globals(), LIVE_SETTINGS, ConfigWatcher(CONFIG_PATH),
+                             checks={"UPDATE_FPS": positive, "ANIMATION_FPS": positive,
+                                     "TWILIGHT_BLUR_RADIUS": non_negative})
+    live_config.load()
 
 # state
 running = True
 terminator_surface = None
+terminator_generation = 0       # TimeScrub generation the surface was rendered for
+last_rendered_dt = None         # base_dt of the newest published frame: what gets persisted
+frame_seconds = 0.0             # how long the last full frame took to render
+base_dt = None                  # time the render loop is showing, before any scrub offset
+outputs = None                  # MultiOutput for OUTPUTS
+frame_version = 0               # map frames published
+screen_version = 0              # panel updates that showed something new, for the frame server
+frame_server = None
 lock = threading.Lock()
 
 #initialize the display
+if DISPLAY_BACKEND == "fbdev":
+    # SDL only provides an offscreen surface; frames go straight to the framebuffer
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
 pygame.init()
 pygame.mouse.set_visible(False)
-screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
+if DISPLAY_BACKEND == "fbdev":
+    # the screen takes the device's depth, so presenting it is a copy (16-bit) or a pack
+    # (32-bit); SDL's dummy display ignores depths, it's only there for the event queue
+    fb_w, fb_h, fb_bpp, _ = fb_geometry(FB_DEVICE)
+    if (fb_bpp == 16) != (PIXEL_FORMAT == "rgb565"):
+        print(f"{FB_DEVICE} is {fb_bpp} bits per pixel; {PIXEL_FORMAT} frames will be converted to it")
+    pygame.display.set_mode((fb_w, fb_h))
+    screen = pygame.Surface((fb_w, fb_h), 0, fb_bpp)
+else:
+    screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
 SCREEN_SIZE = screen.get_size()
 screen_w, screen_h = SCREEN_SIZE
+backend = make_backend(DISPLAY_BACKEND, screen, FB_DEVICE)
 
 clock = pygame.time.Clock()
 
+def utc_now():
+    """ The time the map shows under NORMAL_OPS; SoakTest swaps in a virtual clock.
+    """
+    return datetime.now(timezone.utc)
+scrub = TimeScrub(screen_w) if TIME_SCRUB else None
+
 # -----------------------------
-# Load images
+# Persisted last frame
 # -----------------------------
-day_img   = Image.open(DAY_IMAGE_PATH).convert("RGB")
-night_img = Image.open(NIGHT_IMAGE_PATH).convert("RGB")
-img_w, img_h = day_img.size
-offset_x = (screen_w - img_w) // 2
-offset_y = (screen_h - img_h) // 2
-
-def subsolar_point(dt_utc):
-    """Compute the subsolar point (lat, lon) in degrees at a given UTC datetime using PyEphem."""
-    obs = ephem.Observer()
-    obs.date = dt_utc
-    obs.lon = '0'   # Greenwich
-    obs.lat = '0'   # Equator
-    sun = ephem.Sun(obs)
-
-    # Latitude of subsolar point is just the Sun's declination
-    lat_deg = math.degrees(sun.dec)
-
-    # Subsolar longitude = RA - GMST
-    ra_deg = math.degrees(sun.ra)
-    gmst_deg = math.degrees(obs.sidereal_time())
-    lon_deg = (ra_deg - gmst_deg + 540.0) % 360.0 - 180.0
-    return lat_deg, lon_deg
-
-def sublunar_point(dt_utc: datetime):
-    """Return (lat_deg, lon_deg) of the sublunar point at UTC datetime dt_utc.
-    Uses PyEphem for the Moon's apparent geocentric RA/Dec.
+def load_last_state():
+    try:
+        with open(LAST_STATE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def show_last_frame(state):
+    """ Blit the frame saved at the last shutdown, if it matches this screen.
     """
-    obs = ephem.Observer()
-    obs.date = dt_utc
-    obs.lon = '0'   # Greenwich reference
-    obs.lat = '0'   # Equator
-    moon = ephem.Moon(obs)
-
-    # Latitude of sublunar point is Moon's declination
-    lat_deg = math.degrees(moon.dec)
-
-    # Sub-lunar longitude = RA - GMST
-    ra_deg = math.degrees(moon.ra)
-    gmst_deg = math.degrees(obs.sidereal_time())
-    lon_deg = (ra_deg - gmst_deg + 540.0) % 360.0 - 180.0
-    return lat_deg, lon_deg
-
-def generate_terminator_pil(day_img: Image.Image,
-                            night_img: Image.Image,
-                            dt_utc,
-                            twilight_blur=TWILIGHT_BLUR_RADIUS):
+    if tuple(state.get("size", ())) != SCREEN_SIZE:
+        return False
+    try:
+        with open(LAST_FRAME_PATH, "rb") as f:
+            data = f.read()
+        screen.blit(pygame.image.frombuffer(data, SCREEN_SIZE, "RGB"), (0, 0))
+    except (OSError, ValueError) as e:
+        print(f"Can't restore last frame: {e}")
+        return False
+    backend.present(screen)
+    return True
+
+def save_last_frame():
+    """ Persist the composed screen and the ephemeris of the unscrubbed time
+    it was drawn at; a scrub offset is for display only and isn't saved.
     """
-    Vectorized generation of day/night terminator for 400x800 images.
-    Returns a PIL.Image with blended day/night and twilight smoothing.
-    """
-    ####print("===", datetime.now(timezone.utc))
-    w, h = day_img.size
-
-    # Create arrays for lat/lon per pixel
-    x = np.linspace(-180, 180, w)
-    y = np.linspace(90, -90, h)  # top=+90°, bottom=-90°
-    lon_grid, lat_grid = np.meshgrid(x, y)
-
-    # Compute cosine of solar zenith angle using ephem subsolar point
-    obs = ephem.Observer()
-    obs.date = dt_utc
-    sun = ephem.Sun(obs)
-    decl_rad = float(sun.dec)
-    ra_rad = float(sun.ra)
-
-    # GMST
-    jd = ephem.julian_date(dt_utc)
-    gmst_deg = (280.46061837 + 360.98564736629 * (jd - 2451545.0)) % 360
-    gmst_rad = math.radians(gmst_deg)
-
-    subsolar_lon_rad = ra_rad - gmst_rad
-
-    lat_rad = np.radians(lat_grid)
-    lon_rad = np.radians(lon_grid)
-    H = lon_rad - subsolar_lon_rad
-    cos_zenith = np.sin(lat_rad) * math.sin(decl_rad) + np.cos(lat_rad) * np.cos(decl_rad) * np.cos(H)
-
-    # Map cos_zenith to 0..255 with twilight smoothing
-    # Linear ramp from -0.02..+0.02
-    mask_array = np.clip((cos_zenith + 0.02) / 0.04, 0.0, 1.0) * 255
-    mask_array = mask_array.astype(np.uint8)
-
-    # Apply Gaussian blur for twilight transition
-    #mask_img = Image.fromarray(mask_array, mode="L")
-    mask_img = Image.fromarray(mask_array.astype("uint8"))
-    if twilight_blur > 0:
-        mask_img = mask_img.filter(ImageFilter.GaussianBlur(radius=twilight_blur))
-
-    # Blend day/night images
-    day_arr = np.array(day_img, dtype=np.uint8)
-    night_arr = np.array(night_img, dtype=np.uint8)
-    mask_arr = np.array(mask_img, dtype=np.float32) / 255.0  # normalize 0..1
-
-    blended_arr = (day_arr * mask_arr[..., None] + night_arr * (1 - mask_arr[..., None])).astype(np.uint8)
-    blended_img = Image.fromarray(blended_arr)
-    ###print("---", datetime.now(timezone.utc))
-    ###print()
-    return blended_img
-
-
-def pil_to_pygame_surface(pil_img):
-    """ Utility: center PIL image on pygame screen
-    """
-    return pygame.image.fromstring(pil_img.tobytes(), pil_img.size, pil_img.mode)
+    if last_rendered_dt is None:
+        return
+    from Terminator import subsolar_point, sublunar_point
+    state = {
+        "size": list(SCREEN_SIZE),
+        "dt_utc": last_rendered_dt.isoformat(),
+        "subsolar": subsolar_point(last_rendered_dt),
+        "sublunar": sublunar_point(last_rendered_dt),
+        "animation": ANIMATION,
+    }
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with lock:
+        data = pygame.image.tostring(screen, "RGB")
+    # write-then-rename so a kill mid-write never leaves a torn frame behind
+    for path, mode, payload in ((LAST_FRAME_PATH, "wb", data), (LAST_STATE_PATH, "w", json.dumps(state))):
+        with open(path + ".tmp", mode) as f:
+            f.write(payload)
+        os.replace(path + ".tmp", path)
+
+last_state = load_last_state()
+if show_last_frame(last_state):
+    print(f"first pixel {1000 * (time.monotonic() - _t_start):.0f} ms after start (persisted frame)")
 
-def draw_markers_on_pil(pil_img, lat, lon, color):
-    """ Draw a cross on a PIL image.
+# -----------------------------
+# Load images
+# -----------------------------
+def load_assets():
+    """ Heavy imports and image decodes, done on the render thread after the
+    persisted frame is showing.
     """
-    draw = ImageDraw.Draw(pil_img)
-    w, h = pil_img.size
-
-    x = int((lon + 180.0) / 360.0 * w)
-    y = int((90.0 - lat) / 180.0 * h)
-    size = 6
-    draw.line((x - size, y, x + size, y), fill=color, width=2)
-    draw.line((x, y - size, x, y + size), fill=color, width=2)
-    return
-
-def draw_city_crosses_on_pil(pil_img, cities):
-    """ Draw a red cross over our landmarks  on a PIL image.
+    global Image, MonthlyDayImagery, render_preview, preview_assets, RenderCancelled
+    global day_img, night_img, small_day, small_night, offset_x, offset_y, monthly_imagery, arena, animator, compositor
+    global outputs
+    from PIL import Image
+    from ImageCache import MonthlyDayImagery
+    from Terminator import render_preview, preview_assets, RenderCancelled
+    from FrameArena import FrameArena, Rgb565Arena
+    from Kernels import select_kernels, kernels_by_name
+
+    day_img   = Image.open(DAY_IMAGE_PATH).convert("RGB")
+    night_img = Image.open(NIGHT_IMAGE_PATH).convert("RGB")
+    img_w, img_h = day_img.size
+    offset_x = (screen_w - img_w) // 2
+    offset_y = (screen_h - img_h) // 2
+    small_day, small_night = preview_assets(day_img, night_img)
+
+    monthly_imagery = None
+    if MONTHLY_DAY_IMAGES:
+        monthly_imagery = MonthlyDayImagery(MONTHLY_DAY_IMAGE_PATTERN, DAY_IMAGE_PATH, size=day_img.size,
+                                            max_bytes=IMAGE_CACHE_MB * 1024 * 1024)
+        monthly_imagery.preload(utc_now())
+
+    # every buffer the render loop touches is allocated here, once
+    if PIXEL_FORMAT == "rgb565":
+        import numpy as np
+        from Rgb565 import Rgb565Blender
+        arena = Rgb565Arena(Rgb565Blender(np.asarray(day_img), np.asarray(night_img)), TWILIGHT_BLUR_RADIUS)
+    else:
+        arena = FrameArena(day_img.size, TWILIGHT_BLUR_RADIUS, linear=BLEND_SPACE == "linear")
+    arena.set_images(day_img, night_img)
+    arena.kernels = select_kernels(arena) if COMPUTE_BACKEND == "auto" else kernels_by_name(COMPUTE_BACKEND)
+    animator = None
+    if ANIMATION and ANIMATION_KEYFRAMES:
+        from Animation import KeyframeAnimator
+        animator = KeyframeAnimator(arena, ANIMATION_KEYFRAME_SPACING)
+    arena.overlays = make_overlays()
+    compositor = None
+    if COMPOSITOR:
+        from Compositor import Compositor
+        compositor = Compositor(arena, CITIES, animator.compute_mask if animator is not None else None)
+    if OUTPUTS:
+        from DisplayBackend import FramebufferBackend
+        from MultiOutput import MultiOutput, PanelOutput
+        panels = []
+        for device, rotation in OUTPUTS:
+            try:
+                panels.append(PanelOutput(FramebufferBackend(device), rotation))
+            except (OSError, ValueError) as e:
+                print(f"Output {device} unavailable: {e}")
+        outputs = MultiOutput(panels)
+
+assets_ready = threading.Event()
+
+def make_overlays(keep=()):
+    """ The overlays ISOLINES, CITY_LABELS and TZ_BANDS ask for, bottom to
+    top, reusing the instances in keep.
     """
-    for name, (lat, lon) in cities.items():
-        draw_markers_on_pil(pil_img, lat, lon, color=(255, 0, 0))
-    return
-
-def draw_subsolar_point_on_pil(pil_img, dt_utc, color=(255, 255, 0)):
-    """ Draw a yellow cross where the sun is directly overhead (subsolar point) on a PIL image.
+    kept = {type(overlay).__name__: overlay for overlay in keep}
+    overlays = []
+    if ISOLINES:
+        from Isolines import Isolines
+        overlays.append(kept.get("Isolines") or Isolines(day_img.size))
+    if CITY_LABELS:
+        from CityLabels import CityLabels
+        overlays.append(kept.get("CityLabels") or CityLabels(CITIES, CITY_TIMEZONES, day_img.size))
+    if TZ_BANDS:
+        from TimeZoneIndex import TimeZoneIndex, TimeZoneBands
+        overlays.append(kept.get("TimeZoneBands")
+                        or TimeZoneBands(TimeZoneIndex(TZ_INDEX_PATH, day_img.size), day_img.size))
+    return overlays
+
+pending_images = None           # imagery decoded off the render thread, waiting to go into the arena
+
+def decode_images(day_path, night_path):
+    """ Background decode for a reloaded DAY_IMAGE_PATH / NIGHT_IMAGE_PATH;
+    the render loop picks the result up between frames.
     """
-    lat, lon = subsolar_point(dt_utc)
-    draw_markers_on_pil(pil_img, lat, lon, color=(255, 255, 0))
-    return
-
-def draw_sublunar_point_on_pil(pil_img, dt_utc, color=(0, 255, 255)):
-    """Draw a cyan cross where the moon is directly overhead (sublunar point) on a PIL image.
+    global pending_images
+    try:
+        day = Image.open(day_path).convert("RGB")
+        night = Image.open(night_path).convert("RGB")
+    except OSError as e:
+        print(f"Can't reload imagery: {e}")
+        return
+    if day.size != day_img.size or night.size != day_img.size:
+        print(f"{day_path} and {night_path} must be {day_img.size[0]}x{day_img.size[1]} "
+              f"like the imagery loaded at startup; restart to change size")
+        return
+    blender = None
+    if PIXEL_FORMAT == "rgb565":
+        import numpy as np
+        from Rgb565 import Rgb565Blender
+        blender = Rgb565Blender(np.asarray(day), np.asarray(night))
+    imagery = None
+    if monthly_imagery:
+        # DAY_IMAGE_PATH stands in for missing months
+        imagery = MonthlyDayImagery(MONTHLY_DAY_IMAGE_PATTERN, day_path, size=day.size,
+                                    max_bytes=IMAGE_CACHE_MB * 1024 * 1024)
+        imagery.preload(utc_now())
+    pending_images = ((day_path, night_path), day, night, preview_assets(day, night), blender, imagery)
+
+def apply_pending_images():
+    global pending_images, day_img, night_img, small_day, small_night, monthly_imagery
+    (paths, day, night, previews, blender, imagery), pending_images = pending_images, None
+    if paths != (DAY_IMAGE_PATH, NIGHT_IMAGE_PATH):
+        if imagery is not None:
+            imagery.close()
+        return                  # superseded by a later reload still decoding
+    if blender is not None:
+        arena.blender = blender
+    arena.set_images(day, night)        # new day image: the compositor re-blends its base
+    if compositor is not None:
+        compositor.invalidate("twilight")   # covers a new night image under the same day image
+    with lock:
+        day_img, night_img = day, night
+        small_day, small_night = previews
+    if imagery is not None:
+        monthly_imagery.close()         # its prefetch thread and decoded months
+        monthly_imagery = imagery
+
+def apply_config(changed):
+    """ Bring the render state in line with reloaded settings, invalidating
+    only the caches each one feeds. Runs on the render thread, between
+    frames; UPDATE_FPS, ANIMATION_SPEED and ANIMATION_FPS need nothing,
+    the loops read them every frame.
     """
-    lat, lon = sublunar_point(dt_utc)
-    draw_markers_on_pil(pil_img, lat, lon, color=(0, 255, 255))
-    return
+    print(f"{CONFIG_PATH}: {', '.join(sorted(changed))} reloaded")
+    if "DAY_IMAGE_PATH" in changed or "NIGHT_IMAGE_PATH" in changed:
+        threading.Thread(target=decode_images, args=(DAY_IMAGE_PATH, NIGHT_IMAGE_PATH), daemon=True).start()
+    if "TWILIGHT_BLUR_RADIUS" in changed:
+        arena.set_twilight_blur(TWILIGHT_BLUR_RADIUS)
+        if animator is not None:
+            animator.invalidate()       # keyframes were blurred at the old radius
+        if compositor is not None:
+            compositor.invalidate("twilight")
+    if changed.keys() & {"CITIES", "CITY_TIMEZONES", "ISOLINES", "CITY_LABELS", "TZ_BANDS"}:
+        keep = arena.overlays
+        if "CITIES" in changed or "CITY_TIMEZONES" in changed:
+            keep = [overlay for overlay in keep if type(overlay).__name__ != "CityLabels"]
+        arena.overlays = make_overlays(keep)
+        if compositor is not None:
+            compositor.set_overlays(arena.overlays)
+    if "CITIES" in changed and compositor is not None:
+        compositor.static.invalidate(CITIES)
+
+def draw_frame(dt_utc, stale):
+    """ One map frame into the arena's back surface: interpolated between
+    keyframes when animating that way, a full render otherwise. With the
+    compositor, None when nothing on the map changed.
+    """
+    if compositor is not None:
+        return compositor.render(dt_utc, cancelled=stale)
+    if animator is not None:
+        return animator.render(dt_utc, CITIES)
+    return arena.render(dt_utc, CITIES, cancelled=stale)
 
 def update_terminator(surface):
-    global terminator_surface
+    global terminator_surface, terminator_generation, last_rendered_dt, base_dt, frame_seconds, frame_version
+    load_assets()
+    assets_ready.set()
+    trace = None
+    if FRAME_ALLOC_TRACE:
+        from FrameArena import AllocTrace
+        trace = AllocTrace()
     now = None
     last_dt = None
+    last_tick = next_frame = time.monotonic()
+    if ANIMATION and last_state.get("animation") and last_state.get("dt_utc"):
+        # pick the animation up where the last run left off
+        now = datetime.fromisoformat(last_state["dt_utc"])
 
     while running:
+        if live_config is not None:
+            changed = live_config.poll()
+            if changed:
+                apply_config(changed)
+        if pending_images is not None:
+            apply_pending_images()
+
+        if scrub is not None and not scrub.settled():
+            # a finger is moving: the main loop draws previews, don't compete for the CPU
+            time.sleep(0.01)
+            last_tick = time.monotonic()        # playback pauses meanwhile
+            continue
+
         if NORMAL_OPS:
-            now = datetime.now(timezone.utc)
+            now = utc_now()
 
         elif ANIMATION:
+            tick = time.monotonic()
             if now is None:
-                now = datetime.now(timezone.utc)
+                now = utc_now()
+            elif animator is not None:
+                # simulated time follows the wall clock, so a slow frame
+                # shows up as a dropped frame, not as slower motion
+                now = now + timedelta(seconds=ANIMATION_SPEED * (tick - last_tick))
             else:
                 now = now + ANIMATION_INTERVAL
+            last_tick = tick
 
         # Only recompute mask when time has advanced enough for smoothness
         # We'll recompute at UPDATE_FPS; keep CPU reasonable
-        if surface is None or last_dt is None or (now - last_dt).total_seconds() >= 1.0/UPDATE_FPS:
-            pil_for_map = generate_terminator_pil(day_img, night_img, now, twilight_blur=TWILIGHT_BLUR_RADIUS)
-            # draw crosses on a copy so the base day/night remains pristine
-            draw_city_crosses_on_pil(pil_for_map, CITIES)
-            draw_subsolar_point_on_pil(pil_for_map, now)
-            draw_sublunar_point_on_pil(pil_for_map, now)
-            surface = pil_to_pygame_surface(pil_for_map)
+        base_dt = now
+        if (surface is None or last_dt is None or animator is not None
+                or (now - last_dt).total_seconds() >= 1.0/UPDATE_FPS):
+            generation = scrub.generation if scrub is not None else 0
+            shown_dt = now + scrub.offset if scrub is not None else now
+            stale = lambda: scrub is not None and scrub.generation != generation
+            t0 = time.perf_counter()
+            try:
+                if monthly_imagery:
+                    # reloads the arena only when the blend step changes
+                    # (RGB565 assets are static, so monthly imagery doesn't apply there)
+                    arena.set_images(monthly_imagery.day_image(shown_dt))
+                if trace is not None:
+                    with trace:
+                        surf = draw_frame(shown_dt, stale)
+                    print(f"frame allocated {trace.last} bytes (worst {trace.worst})")
+                else:
+                    surf = draw_frame(shown_dt, stale)
+            except RenderCancelled:
+                continue
+            frame_seconds = time.perf_counter() - t0
+            surface = surf or surface
             last_dt = now
 
-            surf = pygame.image.fromstring(pil_for_map.tobytes(), pil_for_map.size, pil_for_map.mode)
-
             with lock:
-                terminator_surface = surf
-
-            time.sleep(1.0 / UPDATE_FPS)
+                if stale():
+                    continue    # the finger moved on while we were rendering
+                if surf is not None:
+                    if terminator_surface is None:
+                        print(f"first live frame {1000 * (time.monotonic() - _t_start):.0f} ms after start")
+                    terminator_surface = surf
+                    frame_version += 1
+                    if outputs is not None:
+                        outputs.update(surf)
+                    arena.swap()        # the next frame goes into the other buffer
+                # surf is None: the frame on screen is still right for this time
+                terminator_generation = generation
+                last_rendered_dt = now
+            if outputs is not None and surf is not None:
+                outputs.present()
+
+            if animator is not None:
+                next_frame += 1.0 / ANIMATION_FPS
+                time.sleep(max(0.0, next_frame - time.monotonic()))
+                next_frame = max(next_frame, time.monotonic() - 1.0 / ANIMATION_FPS)
+            else:
+                time.sleep(1.0 / UPDATE_FPS)
     return
 
+def show_preview():
+    """ Low-resolution frame for the current scrub offset, drawn right away.
+    """
+    if not assets_ready.is_set():
+        return
+    dt = (base_dt or utc_now()) + scrub.offset
+    surf = render_preview(small_day, small_night, dt, day_img.size)
+    with lock:
+        screen.fill((0,0,0))
+        screen.blit(surf, (offset_x, offset_y))
+        backend.present(screen)
+        screen_presented()
+
+def screen_presented():
+    """ The panel now shows something new; called holding lock.
+    """
+    global screen_version
+    screen_version += 1
+    if frame_server is not None:
+        frame_server.publish(screen_version)
+
+def screen_snapshot():
+    """ (version, size, RGB bytes) of what the panel shows, for FrameServer.
+    """
+    with lock:
+        if screen_version == 0:
+            return None
+        return screen_version, screen.get_size(), pygame.image.tobytes(screen, "RGB")
+
 # -----------------------
 # Main program
 # -----------------------
 def main():
-    # handle SIGTERM cleanly
+    global running, frame_server
+
+    # handle SIGTERM cleanly: leave the loop so the last frame gets saved
     def _sigterm(sig, frame):
-        #nonlocal running
+        global running
         running = False
     signal.signal(signal.SIGTERM, _sigterm)
 
     current_surface = None
-    global running
-    threading.Thread(target=update_terminator, kwargs={"surface": current_surface}, daemon=True).start()
+    renderer = threading.Thread(target=update_terminator, kwargs={"surface": current_surface}, daemon=True)
+    renderer.start()
+    tap_info = None
+    shown = None                # (map frame, tap card, screen_version) last presented
+    if FRAME_SERVER_PORT:
+        from FrameServer import FrameServer
+        try:
+            frame_server = FrameServer(screen_snapshot, FRAME_SERVER_HOST, FRAME_SERVER_PORT).start()
+        except OSError as e:
+            print(f"Frame server unavailable: {e}")
 
     while running:
+        if TAP_INFO and tap_info is None and assets_ready.is_set():
+            from TapInfo import TapInfo
+            tap_info = TapInfo(TZ_INDEX_PATH, (offset_x, offset_y, *day_img.size))
+
         for ev in pygame.event.get():
+            if tap_info is not None:
+                tap_info.handle(ev)
             if ev.type == pygame.QUIT:
                 running = False
             elif ev.type == pygame.KEYDOWN:
                 if ev.key in (pygame.K_q, pygame.K_ESCAPE):
                     running = False
+            elif scrub is not None and scrub.handle(ev) and scrub.dragging:
+                show_preview()
 
-        if terminator_surface:
+        if scrub is not None and scrub.tick():
+            show_preview()
+
+        # a full frame for an older scrub position would undo the preview
+        current = scrub is None or terminator_generation == scrub.generation
+        if terminator_surface and current:
             with lock:
                 # draw centered with black background
                 screen.fill((0,0,0))
                 screen.blit(terminator_surface, (offset_x, offset_y))
-                pygame.display.flip()
-
-        clock.tick(UPDATE_FPS)
-
+                if tap_info is not None:
+                    tap_info.draw(screen, (base_dt or utc_now()) + (scrub.offset if scrub is not None else timedelta(0)))
+                backend.present(screen)
+                # a preview drawn since (screen_version moved on) was just covered up too
+                if (frame_version, tap_info and tap_info.card, screen_version) != shown:
+                    screen_presented()
+                    shown = (frame_version, tap_info and tap_info.card, screen_version)
+
+        if scrub is not None and scrub.active:
+            clock.tick(SCRUB_FPS)
+        else:
+            clock.tick(ANIMATION_FPS if ANIMATION and ANIMATION_KEYFRAMES else UPDATE_FPS)
+
+    # let the render thread finish its frame before pygame goes away under it
+    renderer.join(timeout=2.0)
+    try:
+        save_last_frame()
+    except Exception as e:
+        print(f"Can't save last frame: {e}")
+    if live_config is not None:
+        live_config.close()
+    if outputs is not None:
+        outputs.close()
+    if frame_server is not None:
+        frame_server.close()
+    backend.close()
     pygame.quit()
     sys.exit(0)
 
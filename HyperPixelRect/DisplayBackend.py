@@ -0,0 +1,241 @@
+# DisplayBackend.py
+# Where composed frames go: SDL (display.flip) or straight into a memory-mapped /dev/fbN
+
+import os, re, mmap, struct
+import pygame
+
+np = None   # NumPy is only imported when the framebuffer backend is used
+
+FBIOGET_VSCREENINFO = 0x4600
+FBIOGET_FSCREENINFO = 0x4602
+_VAR_SCREENINFO_SIZE = 160                  # struct fb_var_screeninfo: 40 u32
+_FIX_SCREENINFO = struct.Struct("16sL4I3HIL2IH2H")     # struct fb_fix_screeninfo, native alignment
+# ((offset, length) of red, green, blue) packed by default, and by a device that doesn't say
+CHANNELS = {32: ((16, 8), (8, 8), (0, 8)), 16: ((11, 5), (5, 6), (0, 5))}
+
+def fb_screeninfo(device="/dev/fb0"):
+    """ (width, height, bits_per_pixel, stride, channels) of a framebuffer
+    from its FBIOGET_VSCREENINFO / FBIOGET_FSCREENINFO ioctls: the visible
+    resolution, and channels as in CHANNELS. OSError if device isn't one.
+    """
+    import fcntl
+    fd = os.open(device, os.O_RDONLY)
+    try:
+        var = fcntl.ioctl(fd, FBIOGET_VSCREENINFO, bytes(_VAR_SCREENINFO_SIZE))
+        fix = fcntl.ioctl(fd, FBIOGET_FSCREENINFO, bytes(_FIX_SCREENINFO.size))
+    finally:
+        os.close(fd)
+    # xres, yres, xres_virtual, yres_virtual, xoffset, yoffset, bits_per_pixel,
+    # grayscale, then (offset, length, msb_right) for red, green, blue
+    v = struct.unpack_from("=17I", var)
+    channels = tuple((v[i], v[i + 1]) for i in (8, 11, 14))
+    return v[0], v[1], v[6], _FIX_SCREENINFO.unpack(fix)[9], channels
+
+def fb_channels(device="/dev/fb0"):
+    """ The device's channel layout as in CHANNELS, or None if it can't be asked.
+    """
+    try:
+        return fb_screeninfo(device)[4]
+    except OSError:
+        return None
+
+def fb_geometry(device="/dev/fb0", sysfs_root="/sys/class/graphics"):
+    """ (width, height, bits_per_pixel, stride) of a framebuffer's visible
+    area: from the device's ioctls, else sysfs (the current mode, or
+    virtual_size without one, which can be taller than the panel).
+    """
+    try:
+        return fb_screeninfo(device)[:4]
+    except OSError:
+        pass
+    base = os.path.join(sysfs_root, os.path.basename(device))
+    def read(name):
+        with open(os.path.join(base, name)) as f:
+            return f.read().strip()
+    try:
+        w, h = (int(v) for v in re.search(r"(\d+)x(\d+)", read("modes")).groups())
+    except (OSError, AttributeError):
+        w, h = (int(v) for v in read("virtual_size").split(","))
+    bpp = int(read("bits_per_pixel"))
+    try:
+        stride = int(read("stride"))
+    except OSError:
+        stride = w * bpp // 8
+    return w, h, bpp, stride
+
+class PygameBackend:
+    """ The usual SDL path: the screen surface is the frame.
+    """
+    def __init__(self, screen):
+        self.screen = screen
+        self.size = screen.get_size()
+
+    def present(self, frame=None, dirty=None):
+        if frame is not None and frame is not self.screen:
+            self.screen.blit(frame, (0, 0))
+        if dirty:
+            pygame.display.update(dirty)
+        else:
+            pygame.display.flip()
+
+    def close(self):
+        pass
+
+class FramebufferBackend:
+    """ Writes frames into a memory-mapped framebuffer through a NumPy view,
+    bypassing SDL's surfaces and copies.
+
+    Frames are packed into the device's pixel format (32 bits with 8-bit
+    channels in any order, or RGB565 with ordered dithering) in a
+    preallocated buffer, compared against a
+    shadow of what is already on the device, and only rows that changed are
+    written. Any file of the right
+    size works in place of /dev/fb0, which is how this is tested off a Pi;
+    channels is asked of the device unless given, and is CHANNELS[bpp]
+    for a file.
+    """
+    def __init__(self, device="/dev/fb0", geometry=None, sysfs_root="/sys/class/graphics", channels=None):
+        global np
+        import numpy as np
+
+        self.device = device
+        w, h, bpp, stride = geometry or fb_geometry(device, sysfs_root)
+        if bpp not in (16, 32):
+            raise ValueError(f"{device}: unsupported {bpp} bits per pixel")
+        channels = tuple(channels or fb_channels(device) or CHANNELS[bpp])
+        if bpp == 16:
+            supported = channels == CHANNELS[16]    # what Rgb565Packer and 16-bit surfaces hold
+        else:
+            offsets = {offset for offset, length in channels if length == 8 and offset in (0, 8, 16, 24)}
+            supported = len(offsets) == 3
+        if not supported:
+            raise ValueError(f"{device}: unsupported {bpp}-bit channel layout {channels}")
+        self.channels = channels
+        self.size = (w, h)
+        self.bpp = bpp
+        dtype = np.uint16 if bpp == 16 else np.uint32
+
+        self._fd = os.open(device, os.O_RDWR)
+        self._mm = mmap.mmap(self._fd, stride * h, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self.fb = np.ndarray((h, stride // (bpp // 8)), dtype=dtype, buffer=self._mm)[:, :w]
+
+        self._packed = np.empty((h, w), dtype=dtype)
+        self._shadow = np.array(self.fb)          # what is on the device right now
+        self._tmp = np.empty((h, w), dtype=dtype)
+        self._neq = np.empty((h, w), dtype=bool)
+        self._rows = np.empty(h, dtype=bool)
+        self.rows_written = 0
+        self._packer = None
+        if bpp == 16:
+            from Rgb565 import Rgb565Packer
+            self._packer = Rgb565Packer(self.size)     # ordered dither, no banding
+
+    def pack(self, rgb, out):
+        """ (h, w, 3) uint8 RGB -> device pixels, into out.
+        """
+        r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+        tmp = self._tmp
+        if self.bpp == 32:
+            (ro, _), (go, _), (bo, _) = self.channels
+            np.left_shift(r, ro, out=out, dtype=out.dtype)
+            for channel, offset in ((g, go), (b, bo)):
+                if offset:
+                    np.left_shift(channel, offset, out=tmp, dtype=tmp.dtype)
+                    channel = tmp
+                np.bitwise_or(out, channel, out=out)
+        else:
+            self._packer.pack(rgb, out)
+        return out
+
+    def present(self, frame, dirty=None):
+        """ frame: a Surface, an (h, w, 3) uint8 array, or an (h, w) array
+        already in the device format. dirty is accepted for API parity; the
+        row diff finds the changed region by itself.
+        """
+        if isinstance(frame, pygame.Surface) and frame.get_bitsize() == 16 and self.bpp == 16:
+            # an RGB565 surface is already in the device format
+            view = pygame.surfarray.pixels2d(frame)
+            np.copyto(self._packed, view.T)
+            del view
+            packed = self._packed
+        elif isinstance(frame, pygame.Surface):
+            view = pygame.surfarray.pixels3d(frame)       # (w, h, 3), no copy
+            self.pack(view.transpose(1, 0, 2), self._packed)
+            del view
+            packed = self._packed
+        elif frame.ndim == 3:
+            packed = self.pack(frame, self._packed)
+        else:
+            packed = frame
+
+        np.not_equal(packed, self._shadow, out=self._neq)
+        np.any(self._neq, axis=1, out=self._rows)
+        changed = np.flatnonzero(self._rows)
+        if changed.size == 0:
+            return 0
+        # copy contiguous runs of changed rows in one slice each
+        breaks = np.flatnonzero(np.diff(changed) != 1)
+        starts = np.concatenate(([changed[0]], changed[breaks + 1]))
+        ends = np.concatenate((changed[breaks], [changed[-1]])) + 1
+        for a, b in zip(starts, ends):
+            self.fb[a:b] = packed[a:b]
+            self._shadow[a:b] = packed[a:b]
+        self.rows_written += int(changed.size)
+        return int(changed.size)
+
+    def close(self):
+        self.fb = None
+        self._mm.close()
+        os.close(self._fd)
+
+def make_backend(kind, screen=None, device="/dev/fb0"):
+    if kind == "fbdev":
+        return FramebufferBackend(device)
+    return PygameBackend(screen)
+
+if __name__ == "__main__":
+    # Self-check against a regular file standing in for /dev/fb0
+    import tempfile
+    import numpy
+    w, h = 64, 32
+    for bpp in (32, 16):
+        with tempfile.NamedTemporaryFile() as f:
+            f.truncate(w * h * bpp // 8)
+            fb = FramebufferBackend(f.name, geometry=(w, h, bpp, w * bpp // 8))
+            frame = numpy.zeros((h, w, 3), dtype=numpy.uint8)
+            frame[:, :, 0] = 255
+            assert fb.present(frame) == h                 # every row changes
+            assert fb.present(frame) == 0                 # nothing to do
+            frame[10:12, 5] = (0, 255, 0)
+            assert fb.present(frame) == 2                 # only the touched rows
+            expected = 0xF800 if bpp == 16 else 0xFF0000
+            assert int(fb.fb[0, 0]) == expected and int(fb.fb[10, 5]) == (0x07E0 if bpp == 16 else 0x00FF00)
+            fb.close()
+
+    # BGR order on a 32-bit device
+    with tempfile.NamedTemporaryFile() as f:
+        f.truncate(w * h * 4)
+        fb = FramebufferBackend(f.name, geometry=(w, h, 32, w * 4), channels=((0, 8), (8, 8), (16, 8)))
+        fb.present(numpy.full((h, w, 3), (255, 0, 0), dtype=numpy.uint8))
+        assert int(fb.fb[0, 0]) == 0x0000FF
+        fb.close()
+        try:
+            FramebufferBackend(f.name, geometry=(w, h, 16, w * 2), channels=((0, 5), (5, 6), (11, 5)))
+            raise AssertionError("BGR565 should be refused")
+        except ValueError:
+            pass
+
+    # sysfs fallback (a file has no ioctls): the visible mode, not the
+    # double-height virtual size
+    with tempfile.TemporaryDirectory() as root:
+        os.mkdir(os.path.join(root, "fb9"))
+        for name, value in (("modes", "U:800x480p-0\n"), ("virtual_size", "800,960\n"),
+                            ("bits_per_pixel", "32\n"), ("stride", "3200\n")):
+            with open(os.path.join(root, "fb9", name), "w") as f:
+                f.write(value)
+        assert fb_geometry(os.path.join(root, "fb9"), root) == (800, 480, 32, 3200)
+        os.remove(os.path.join(root, "fb9", "modes"))
+        assert fb_geometry(os.path.join(root, "fb9"), root) == (800, 960, 32, 3200)
+    if os.path.exists("/dev/fb0"):
+        print("/dev/fb0:", fb_screeninfo("/dev/fb0"))
+    print("ok")
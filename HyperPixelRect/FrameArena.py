@@ -0,0 +1,321 @@
+# FrameArena.py
+# Steady-state map rendering out of buffers allocated once per size
+
+import math, tracemalloc
+import numpy as np
+import pygame
+
+from Terminator import (sun_position, subsolar_point, sublunar_point, draw_markers_on_surface,
+                        RenderCancelled)
+from Kernels import NumpyKernels
+from LinearLight import linearize
+
+BLUR_PASSES = 3                 # three box passes approximate a Gaussian
+# bytes a steady-state frame may allocate: NumPy's fixed-size ufunc buffers for
+# strided operands, ephem and small Python objects; nothing scales with the frame
+FRAME_ALLOC_BUDGET = 128 * 1024
+
+def box_radius(sigma, passes=BLUR_PASSES):
+    """ Box radius whose repeated passes match a Gaussian of this sigma.
+    """
+    return max(1, int(round((math.sqrt(12.0 * sigma * sigma / passes + 1) - 1) / 2)))
+
+class FrameArena:
+    """ Every buffer the map render loop needs, allocated at startup (or
+    when the size changes) and reused for each frame.
+
+    The cosine of the solar zenith angle is separable,
+    sin(lat) sin(decl) + cos(lat) cos(decl) cos(lon - sun_lon),
+    so a frame is one (h, 1) x (w,) outer product instead of meshgrids and
+    radian arrays. The twilight blur is a separable box blur (wrapping
+    east-west, clamped at the poles), and the day/night blend is integer
+    math into a NumPy array that two pygame Surfaces share memory with.
+    The math itself is done by a kernel set from Kernels.py, NumPy unless
+    another is given.
+
+    With linear=True the imagery is converted to linear light (uint16, see
+    LinearLight.py) once in set_images(), the blend runs on those values in
+    int32, and the result is re-encoded with one 4096-entry table lookup.
+    Twilight then fades through physically mixed light instead of the
+    darker, muddier average of two gamma-encoded images.
+
+    There are two output frames: render() draws into the one that isn't
+    being shown, and swap() is called once that frame has been published.
+    A consumer must blit the published surface while holding the lock it
+    was published under.
+    """
+    kernel_blend = True         # the kernels' blend() makes the frames (Kernels.benchmark times it)
+
+    def __init__(self, size, twilight_blur, kernels=None, linear=False):
+        w, h = size
+        self.size = size
+        self.twilight_blur = twilight_blur
+        self.linear = linear
+        self.kernels = kernels or NumpyKernels()
+        self.passes = BLUR_PASSES
+
+        # same pixel centres as Terminator.terminator_mask
+        lat = np.radians(np.linspace(90, -90, h, dtype=np.float32))[:, None]
+        self._sin_lat = np.sin(lat)
+        self._cos_lat = np.cos(lat)
+        self._lon = np.radians(np.linspace(-180, 180, w, dtype=np.float32))
+        self._a = np.empty((h, 1), dtype=np.float32)
+        self._b = np.empty((h, 1), dtype=np.float32)
+        self._c = np.empty(w, dtype=np.float32)
+
+        self.mask_f = np.empty((h, w), dtype=np.float32)
+        self._mask_f3 = self.mask_f[..., None]
+        self.mask = np.empty((h, w), dtype=np.uint8)          # 255 = day, as terminator_mask returns
+        self.set_twilight_blur(twilight_blur)
+        self._day_source = None
+        self._back = 0
+        self.base_surface = None    # bare blended map for Compositor.py, allocated on first use
+        self.overlays = []      # drawn over every frame: overlay.draw(surface, dt_utc)
+        self._allocate_frames()
+
+    def _allocate_frames(self):
+        """ Imagery, blend scratch and the two output frames.
+        """
+        w, h = self.size
+        linear = self.linear
+        # sRGB: int16 throughout. Linear: uint16 images, int32 where diff (up
+        # to +-65535) is multiplied by k (up to 128), and the result in intp,
+        # the index type np.take would otherwise convert it to every frame
+        image, math_dtype = (np.uint16, np.int32) if linear else (np.int16, np.int16)
+        self._k = np.empty((h, w), dtype=math_dtype)
+        self._k3 = self._k[..., None]
+        self._day = np.empty((h, w, 3), dtype=image)
+        self._night = np.empty((h, w, 3), dtype=image)
+        self._diff = np.empty((h, w, 3), dtype=math_dtype)
+        self._tmp = np.empty((h, w, 3), dtype=np.intp if linear else np.int16)
+
+        # two frames, each a pixel array with a Surface over the same memory
+        self._pixels = [np.zeros((h, w, 3), dtype=np.uint8) for _ in range(2)]
+        self._surfaces = [pygame.image.frombuffer(p, self.size, "RGB") for p in self._pixels]
+        self._base_pixels = None
+
+    def set_twilight_blur(self, twilight_blur):
+        """ (Re)size the blur buffers for a new radius; takes effect on the
+        next mask. Call it between frames, from the thread that renders.
+        """
+        w, h = self.size
+        self.twilight_blur = twilight_blur
+        self.r = r = box_radius(twilight_blur) if twilight_blur > 0 else 0
+        self._hpad = np.empty((h, w + 2 * r), dtype=np.float32)
+        self._hsum = np.empty((h, w + 2 * r), dtype=np.float32)
+        self._vpad = np.empty((h + 2 * r, w), dtype=np.float32)
+        self._vsum = np.zeros((h + 2 * r + 1, w), dtype=np.float32)
+
+    def set_images(self, day_img, night_img=None):
+        """ Load day (and night) imagery into the arena; a no-op when the day
+        image is the one already loaded.
+        """
+        load = linearize if self.linear else lambda img, out: np.copyto(out, img, casting="unsafe")
+        if night_img is not None:
+            load(np.asarray(night_img), out=self._night)
+        elif day_img is self._day_source:
+            return
+        self._day_source = day_img
+        load(np.asarray(day_img), out=self._day)
+        np.subtract(self._day, self._night, out=self._diff, dtype=self._diff.dtype)
+
+    def compute_mask(self, dt_utc):
+        """ Day/night mask for dt_utc into self.mask, (h, w) uint8.
+        """
+        return self.solar_mask(*sun_position(dt_utc))
+
+    def solar_mask(self, decl, sun_lon):
+        """ Mask for a sun at declination decl over longitude sun_lon (radians).
+        """
+        np.multiply(self._sin_lat, math.sin(decl), out=self._a)
+        np.multiply(self._cos_lat, math.cos(decl), out=self._b)
+        np.subtract(self._lon, sun_lon, out=self._c)
+        np.cos(self._c, out=self._c)
+        self.kernels.zenith(self)
+        self.kernels.twilight(self)
+        return self.mask
+
+    def blend(self, out):
+        """ Day/night blend by the current mask into out, (h, w, 3) uint8.
+        """
+        return self.kernels.blend(self, out)
+
+    def swap(self):
+        """ The last rendered frame is now the one being shown.
+        """
+        self._back = 1 - self._back
+
+    def back_surface(self):
+        """ (index, surface) of the frame the next render draws into.
+        """
+        return self._back, self._surfaces[self._back]
+
+    def blend_base(self):
+        """ Blend the current mask into base_surface: the map without markers
+        or overlays, which Compositor.py keeps between frames.
+        """
+        if self.base_surface is None:
+            w, h = self.size
+            self._base_pixels = np.zeros((h, w, 3), dtype=np.uint8)
+            self.base_surface = pygame.image.frombuffer(self._base_pixels, self.size, "RGB")
+        self.blend(self._base_pixels)
+        return self.base_surface
+
+    def render(self, dt_utc, cities, cancelled=None):
+        """ Full map frame into the back surface, which is returned. It stays
+        the back surface (and the next render overwrites it) until swap().
+        """
+        self.compute_mask(dt_utc)
+        if cancelled is not None and cancelled():
+            raise RenderCancelled()
+        return self.render_mask(dt_utc, cities)
+
+    def render_mask(self, dt_utc, cities):
+        """ Back-surface frame from whatever self.mask holds (see Animation.py).
+        """
+        i = self._back
+        self.blend(self._pixels[i])
+        surface = self._surfaces[i]
+        self.decorate(surface, dt_utc, cities)
+        return surface
+
+    def decorate(self, surface, dt_utc, cities):
+        """ Crosses, then each of self.overlays (e.g. CityLabels) on top.
+        """
+        for name, (lat, lon) in cities.items():
+            draw_markers_on_surface(surface, lat, lon, (255, 0, 0))
+        draw_markers_on_surface(surface, *subsolar_point(dt_utc), (255, 255, 0))
+        draw_markers_on_surface(surface, *sublunar_point(dt_utc), (0, 255, 255))
+        for overlay in self.overlays:
+            overlay.draw(surface, dt_utc)
+
+class Rgb565Arena(FrameArena):
+    """ The same loop with the blend done packed (Rgb565.Rgb565Blender) into
+    two 16-bit surfaces. Only the mask and blur buffers are shared with the
+    RGB arena; the imagery lives in the blender.
+    """
+    kernel_blend = False
+
+    def __init__(self, blender, twilight_blur, kernels=None):
+        self.blender = blender
+        super().__init__(blender.size, twilight_blur, kernels)
+
+    def _allocate_frames(self):
+        from Rgb565 import rgb565_surface
+        self._pixels = None
+        self._surfaces = [rgb565_surface(self.size) for _ in range(2)]
+
+    def set_images(self, day_img, night_img=None):
+        """ Only notes which day image the blender was built from (Compositor
+        keys its base layer on it); new imagery means a new self.blender.
+        """
+        self._day_source = day_img
+
+    def render_mask(self, dt_utc, cities):
+        surface = self._surfaces[self._back]
+        self._blend_into(surface)
+        self.decorate(surface, dt_utc, cities)
+        return surface
+
+    def blend_base(self):
+        if self.base_surface is None:
+            from Rgb565 import rgb565_surface
+            self.base_surface = rgb565_surface(self.size)
+        self._blend_into(self.base_surface)
+        return self.base_surface
+
+    def _blend_into(self, surface):
+        pixels = pygame.surfarray.pixels2d(surface)
+        np.copyto(pixels, self.blender.blend(self.mask).T, casting="unsafe")
+        del pixels
+
+class AllocTrace:
+    """ Diagnostic: bytes allocated (peak above the starting point) while
+    each frame renders, via tracemalloc. Slows rendering down; leave off
+    outside of measurements.
+
+        trace = AllocTrace()
+        with trace:
+            arena.render(dt, cities)
+        trace.last, trace.worst
+    """
+    def __init__(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.last = 0
+        self.worst = 0
+        self.frames = 0
+        self._start = 0
+
+    def __enter__(self):
+        tracemalloc.reset_peak()
+        self._start = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *exc):
+        self.last = tracemalloc.get_traced_memory()[1] - self._start
+        self.worst = max(self.worst, self.last)
+        self.frames += 1
+        return False
+
+def frame_allocations(render, frames=10, warmup=2):
+    """ Bytes allocated by each of `frames` calls to render(i), after a few
+    warm-up calls; what the zero-allocation checks assert on.
+    """
+    for i in range(warmup):
+        render(i)
+    trace = AllocTrace()
+    sizes = []
+    for i in range(frames):
+        with trace:
+            render(warmup + i)
+        sizes.append(trace.last)
+    return sizes
+
+if __name__ == "__main__":
+    # Self-check: matches the PIL pipeline closely and allocates ~nothing per frame
+    import sys
+    from datetime import datetime, timezone, timedelta
+    from PIL import Image
+    from Terminator import render_map, terminator_mask
+    from MapSettings import TWILIGHT_BLUR_RADIUS
+
+    os_env = __import__("os").environ
+    os_env.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    day = Image.open(sys.argv[1] if len(sys.argv) > 1 else "day.jpg").convert("RGB")
+    night = Image.open(sys.argv[2] if len(sys.argv) > 2 else "night.jpg").convert("RGB")
+    cities = {"Null Island": (0.0, 0.0), "Tokyo": (35.6895, 139.6917)}
+    t0 = datetime(2025, 3, 20, 12, tzinfo=timezone.utc)
+
+    arena = FrameArena(day.size, TWILIGHT_BLUR_RADIUS)
+    arena.set_images(day, night)
+    mask = arena.compute_mask(t0).astype(np.int16)
+    err = np.abs(mask - terminator_mask(day.size, t0, TWILIGHT_BLUR_RADIUS)).mean()
+    assert err < 2.0, err
+
+    def render(i):
+        arena.render(t0 + timedelta(minutes=10 * i), cities)
+        arena.swap()
+    sizes = frame_allocations(render)
+    print(f"arena: {max(sizes)} bytes/frame worst, {int(np.median(sizes))} median")
+    assert max(sizes) < FRAME_ALLOC_BUDGET, sizes
+    old = frame_allocations(lambda i: render_map(day, night, t0 + timedelta(minutes=10 * i), cities,
+                                                 TWILIGHT_BLUR_RADIUS), frames=3)
+    print(f"PIL pipeline: {max(old)} bytes/frame")
+
+    # linear light: same mask, output matches the float reference blend
+    from Terminator import generate_terminator_pil
+    lin = FrameArena(day.size, TWILIGHT_BLUR_RADIUS, linear=True)
+    lin.set_images(day, night)
+    lin.compute_mask(t0)
+    out = lin.blend(np.empty((day.size[1], day.size[0], 3), dtype=np.uint8))
+    ref = generate_terminator_pil(day, night, t0, TWILIGHT_BLUR_RADIUS, linear=True)
+    ref = np.asarray(ref, dtype=np.int16)
+    err = np.abs(out.astype(np.int16) - ref).mean()
+    assert err < 2.0, err
+    sizes = frame_allocations(lambda i: lin.render(t0 + timedelta(minutes=10 * i), cities))
+    print(f"linear arena: {max(sizes)} bytes/frame worst")
+    assert max(sizes) < FRAME_ALLOC_BUDGET, sizes
+    print("ok")
@@ -0,0 +1,265 @@
+# FrameServer.py
+# What the panel shows, over HTTP: JPEG/PNG snapshots and an MJPEG stream,
+# each frame version encoded at most once however many clients watch
+
+import io, time, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from PIL import Image
+
+FRAME_SERVER_FPS = 5            # most frames encoded per second
+FRAME_SERVER_CPU = 0.25         # share of one core encoding may use, on average
+JPEG_QUALITY = 80
+PNG_COMPRESS_LEVEL = 3          # zlib level: 3 is a fraction of the default's time, a little larger
+MAX_CLIENTS = 8                 # requests served at once; more get 503
+CLIENT_TIMEOUT = 10.0           # a client that takes longer than this to accept a frame is dropped
+FIRST_FRAME_TIMEOUT = 2.0       # how long a request waits for a frame to exist
+CONTENT_TYPES = {"jpeg": "image/jpeg", "png": "image/png"}
+BOUNDARY = b"hyperpixelframe"
+INDEX_PAGE = b"""<!doctype html>
+<title>HyperPixel</title>
+<body style="margin:0;background:#000"><img src="/stream.mjpg" style="max-width:100%">
+"""
+
+class FrameEncoder:
+    """ Encodes frames on its own thread, only when a client asks and only
+    once per frame version.
+
+    publish(version) is all the render side does: note that a newer frame
+    exists. Nothing is copied or encoded until frame() asks for a format
+    whose cached encoding is older; the encoder then calls snapshot() (the
+    caller's function returning (version, size, RGB bytes), taking
+    whatever lock guards the frame), encodes, and wakes every client
+    waiting on that format. Clients that already have the newest frame
+    just sleep; only a format falling behind wakes the encoder. Runs are spaced at least 1/fps apart and by
+    enough idle time to keep encoding within cpu of one core.
+    """
+    def __init__(self, snapshot, fps=FRAME_SERVER_FPS, cpu=FRAME_SERVER_CPU, quality=JPEG_QUALITY):
+        self.snapshot = snapshot
+        self.fps = fps
+        self.cpu = cpu
+        self.quality = quality
+        self.encodes = dict.fromkeys(CONTENT_TYPES, 0)
+        self.encode_seconds = 0.0
+        lock = threading.Lock()
+        self._cond = threading.Condition(lock)     # clients: a new encoding is cached
+        self._work = threading.Condition(lock)     # the encoder: some format is behind
+        self._latest = 0                # newest version published
+        self._cache = {}                # format -> (version, bytes)
+        self._waiting = dict.fromkeys(CONTENT_TYPES, 0)     # clients blocked in frame(), per format
+        self._next_run = 0.0
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="frame-encoder", daemon=True)
+        self._thread.start()
+
+    def publish(self, version):
+        with self._cond:
+            self._latest = version
+            if self._stale():
+                self._work.notify()
+
+    def frame(self, fmt, newer_than=-1, timeout=None):
+        """ (version, encoded bytes) of the newest frame, once one newer
+        than newer_than is encoded; the newest there is after timeout, or
+        None if there's none at all.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._waiting[fmt] += 1
+            try:
+                while self._running:
+                    cached = self._cache.get(fmt)
+                    if cached is not None and cached[0] > newer_than and cached[0] >= self._latest:
+                        return cached
+                    if cached is None or cached[0] < self._latest:
+                        self._work.notify()
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return cached if cached is not None and cached[0] > newer_than else None
+                    self._cond.wait(remaining)
+                return None
+            finally:
+                self._waiting[fmt] -= 1
+
+    def _stale(self):
+        """ Formats someone is waiting on whose encoding is behind.
+        """
+        return [fmt for fmt, waiting in self._waiting.items()
+                if waiting and (fmt not in self._cache or self._cache[fmt][0] < self._latest)]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._stale():
+                    self._work.wait()
+                if not self._running:
+                    return
+            # pace outside the lock, so publish() and new clients never wait on it
+            time.sleep(max(0.0, self._next_run - time.monotonic()))
+            with self._cond:
+                formats = self._stale()
+            start, cpu = time.monotonic(), time.thread_time()
+            got = self.snapshot()
+            if got is None:
+                with self._cond:
+                    self._work.wait(0.1)    # no frame yet
+                continue
+            version, size, rgb = got
+            image = Image.frombytes("RGB", size, rgb)
+            encoded = {}
+            for fmt in formats:
+                if self._cache.get(fmt, (-1,))[0] == version:
+                    continue            # the frame didn't actually change
+                buf = io.BytesIO()
+                if fmt == "jpeg":
+                    image.save(buf, "JPEG", quality=self.quality)
+                else:
+                    image.save(buf, "PNG", compress_level=PNG_COMPRESS_LEVEL)
+                encoded[fmt] = (version, buf.getvalue())
+                self.encodes[fmt] += 1
+            spent = time.thread_time() - cpu
+            self.encode_seconds += spent
+            self._next_run = start + max(1.0 / self.fps, spent / self.cpu)
+            with self._cond:
+                self._cache.update(encoded)
+                self._latest = max(self._latest, version)
+                self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+            self._work.notify()
+        self._thread.join(timeout=2.0)
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "HyperPixel"
+    timeout = CLIENT_TIMEOUT            # socket timeout: a stalled client is dropped, not buffered for
+
+    def do_GET(self):
+        server = self.server
+        if not server.slots.acquire(blocking=False):
+            self.send_error(503, "Too many clients")
+            return
+        try:
+            path = self.path.split("?")[0]
+            if path == "/":
+                self._send(200, "text/html; charset=utf-8", INDEX_PAGE)
+            elif path in ("/frame.jpg", "/frame.png"):
+                fmt = "jpeg" if path.endswith(".jpg") else "png"
+                frame = server.encoder.frame(fmt, timeout=FIRST_FRAME_TIMEOUT)
+                if frame is None:
+                    self.send_error(503, "No frame yet")
+                else:
+                    self._send(200, CONTENT_TYPES[fmt], frame[1])
+            elif path == "/stream.mjpg":
+                self._stream(server.encoder)
+            else:
+                self.send_error(404)
+        except (ConnectionError, TimeoutError):
+            pass                        # client went away or stopped reading
+        finally:
+            server.slots.release()
+
+    def _send(self, code, content_type, body):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, encoder):
+        """ Each part is whatever frame is newest when the client is ready
+        for one: a slow client just sees fewer of them.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=" + BOUNDARY.decode())
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        version = -1
+        while not self.server.closing:
+            frame = encoder.frame("jpeg", newer_than=version, timeout=1.0)
+            if frame is None:
+                continue
+            version, body = frame
+            self.wfile.write(b"--%s\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n"
+                             % (BOUNDARY, len(body)) + body + b"\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+class FrameServer(ThreadingHTTPServer):
+    """ GET / (a page showing the stream), /frame.jpg, /frame.png and
+    /stream.mjpg on a thread of its own; snapshot as for FrameEncoder.
+    """
+    daemon_threads = True
+
+    def __init__(self, snapshot, host="0.0.0.0", port=8080, **encoder_args):
+        super().__init__((host, port), _Handler)
+        self.encoder = FrameEncoder(snapshot, **encoder_args)
+        self.slots = threading.BoundedSemaphore(MAX_CLIENTS)
+        self.closing = False
+        self._thread = None
+
+    def publish(self, version):
+        self.encoder.publish(version)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="frame-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.closing = True
+        self.shutdown()
+        self.server_close()
+        self.encoder.close()
+
+if __name__ == "__main__":
+    # Self-check: several clients on one stream cost one encode per frame
+    import urllib.request
+    w, h = 800, 400
+    state = {"version": 0}
+    lock = threading.Lock()
+    def snapshot():
+        with lock:
+            v = state["version"]
+        return v, (w, h), bytes([v % 256]) * (w * h * 3)
+
+    server = FrameServer(snapshot, "127.0.0.1", 0, fps=20, cpu=0.5).start()
+    url = "http://127.0.0.1:%d" % server.server_address[1]
+    assert urllib.request.urlopen(url + "/frame.png").read()[:4] == b"\x89PNG"
+
+    received = [0] * 4
+    def watch(i, slow):
+        with urllib.request.urlopen(url + "/stream.mjpg") as r:
+            for _ in range(200):
+                line = r.readline()
+                if line.startswith(b"Content-Length"):
+                    r.readline()
+                    r.read(int(line.split(b":")[1]))
+                    received[i] += 1
+                    if slow:
+                        time.sleep(0.5)
+    clients = [threading.Thread(target=watch, args=(i, i == 3), daemon=True) for i in range(4)]
+    for c in clients:
+        c.start()
+    for _ in range(30):                 # 30 new frames at 30 fps
+        time.sleep(1 / 30)
+        with lock:
+            state["version"] += 1
+        server.publish(state["version"])
+    time.sleep(0.5)
+    # caught-up clients on an unchanging frame should cost nothing
+    cpu = time.process_time()
+    time.sleep(1.0)
+    idle = time.process_time() - cpu
+    encoder = server.encoder
+    print(f"{encoder.encodes['jpeg']} JPEG encodes for {state['version']} frames, "
+          f"frames received per client {received}; {1000 * encoder.encode_seconds:.0f} ms encoding")
+    assert encoder.encodes["jpeg"] <= state["version"] + 1
+    assert received[3] < max(received[:3])      # the slow client skipped frames
+    print(f"{len(clients)} idle stream clients: {1000 * idle:.0f} ms CPU in 1 s")
+    assert idle < 0.05, idle
+    server.close()
+    print("ok")
@@ -0,0 +1,497 @@
+#!/home/pi/HyperPixel/.venv/bin/python3
+# HyperPixelApp.py
+# One long-running app: the terminator map, with Sonos album art taking over
+# the panel while a zone is playing. The map keeps rendering in the background
+# at a reduced rate, so switching back is instant.
+#
+# Everything is scheduled by one asyncio event loop (EVENT_LOOP = "threads"
+# brings back the original display loop with its worker threads).
+
+import os
+# must set this BEFORE importing pygame
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+os.environ.setdefault("SDL_VIDEO_ALLOW_SCREENSAVER", "0")
+os.environ["SDL_VIDEO_WINDOW_POS"] = "0,0"
+os.environ["SDL_VIDEO_FOREIGN"] = "1"
+import pygame
+
+import sys, signal, time, heapq, itertools, asyncio, queue, threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from PIL import Image
+
+from Terminator import TerminatorRenderer
+from SonosArt import ArtCache, ArtFetcher, ArtWorker, ART_READY, ART_COALESCE_SECONDS, FetchCancelled, zone_art
+from Transitions import Transition, TRANSITION_FPS
+from AsyncCore import AsyncQueueBridge, LoopStats, wait_event, every, serve_stats
+from LiveConfig import LiveConfig, ConfigWatcher, CONFIG_POLL_SECONDS, positive, non_negative
+
+# -----------------------
+# Configuration
+# -----------------------
+from MapSettings import (DAY_IMAGE_PATH, NIGHT_IMAGE_PATH, CITIES,    # shared with DarkShadows.py
+                         TWILIGHT_BLUR_RADIUS, UPDATE_FPS)
+ZONE_NAMES = ["Basement"]       # empty list: map only
+BACKGROUND_MAP_FPS = 1.0 / 30   # map refresh while album art owns the panel
+STATS_INTERVAL = 300            # seconds between stats lines
+EVENT_LOOP = "asyncio"          # "asyncio": one event loop schedules everything; "threads": the original loop
+INPUT_POLL_SECONDS = 0.05       # pygame has no awaitable input, so the loop checks it this often
+STATS_PORT = None               # e.g. 8765: GET http://127.0.0.1:8765/ returns the stats as JSON
+STATS_HOST = "127.0.0.1"
+CONFIG_PATH = "hyperpixel.json"     # JSON overrides for the LIVE_SETTINGS below, picked up while running; None to ignore
+LIVE_SETTINGS = ("CITIES", "DAY_IMAGE_PATH", "NIGHT_IMAGE_PATH", "ZONE_NAMES", "UPDATE_FPS",
+                 "BACKGROUND_MAP_FPS", "TWILIGHT_BLUR_RADIUS")
+
+MODE_MAP = "map"
+MODE_ART = "art"
+
+# -----------------------
+# Scheduler
+# -----------------------
+class Scheduler:
+    """ Deadline-ordered periodic jobs, run from the threaded display loop.
+    """
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+
+    def every(self, interval, fn, delay=0.0):
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), interval, fn))
+
+    def run_due(self, now=None):
+        now = time.monotonic() if now is None else now
+        while self._heap and self._heap[0][0] <= now:
+            due, _, interval, fn = heapq.heappop(self._heap)
+            fn()
+            # keep the cadence, but don't try to catch up on missed runs
+            heapq.heappush(self._heap, (max(due + interval, now), next(self._seq), interval, fn))
+
+    def until_next(self, now=None):
+        now = time.monotonic() if now is None else now
+        return max(0.0, self._heap[0][0] - now) if self._heap else 1.0
+
+# -----------------------
+# App
+# -----------------------
+class App:
+    """ clock and monitor replace the wall clock and the Sonos ZoneMonitor,
+    for driving the app headlessly (SoakTest.py). A monitor for the asyncio
+    loop must be built with events=AsyncQueueBridge() (see zone_events()).
+    """
+    def __init__(self, clock=None, monitor=None):
+        pygame.init()
+        pygame.mouse.set_visible(False)
+        self.screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
+        self.size = self.screen.get_size()
+        self.running = True
+        self.mode = MODE_MAP
+        self.scheduler = Scheduler()
+        self.transition = Transition(self.screen)
+        self.map_frame = pygame.Surface(self.size, 0, self.screen)
+        self.map_version = -1
+        self.art_surface = None
+        self.art_worker = None          # threaded loop
+        self._art_generation = 0        # asyncio loop: latest art request
+        self._art_task = None
+        self._wake_render = None        # asyncio.Events, set once the loop runs
+        self._wake_display = None
+        self.loop_stats = None
+        self._loop = None               # the asyncio loop, while it runs
+        self._io_pool = None
+        self._zones = None              # asyncio task following self.monitor
+        self._stopped = None            # asyncio.Event ending _run_async
+        self._failure = None            # exception that ended a task, re-raised by run()
+        self._handoffs = queue.Queue()  # threaded loop: (fn, args) from worker threads
+        self.config = None
+        if CONFIG_PATH:
+            self.config = LiveConfig(CONFIG_PATH, globals(), LIVE_SETTINGS, ConfigWatcher(CONFIG_PATH),
+                                     checks={"UPDATE_FPS": positive, "BACKGROUND_MAP_FPS": positive,
+                                             "TWILIGHT_BLUR_RADIUS": non_negative})
+            self.config.load()
+
+        day_img = Image.open(DAY_IMAGE_PATH).convert("RGB")
+        night_img = Image.open(NIGHT_IMAGE_PATH).convert("RGB")
+        self.map_offset = ((self.size[0] - day_img.size[0]) // 2, (self.size[1] - day_img.size[1]) // 2)
+        self.renderer = TerminatorRenderer(day_img, night_img, CITIES, UPDATE_FPS, TWILIGHT_BLUR_RADIUS,
+                                           clock=clock)
+
+        self.monitor = monitor
+        self.fetcher = ArtFetcher()
+        self.art_cache = ArtCache(self.size, fetch=self.fetcher.fetch)
+        if ZONE_NAMES and monitor is None:
+            try:
+                from SonosZones import ZoneMonitor
+                self.monitor = ZoneMonitor(ZONE_NAMES, events=zone_events())
+            except Exception as e:
+                print(f"Sonos unavailable, map only: {e}")
+
+        self.scheduler.every(1.0 / UPDATE_FPS, self._refresh_map)
+        self.scheduler.every(STATS_INTERVAL, self._log_stats, delay=STATS_INTERVAL)
+        if self.config is not None:
+            self.scheduler.every(CONFIG_POLL_SECONDS, self._reload_config, delay=CONFIG_POLL_SECONDS)
+
+    def _load_art(self, zone_name, cancelled):
+        return zone_art(self.monitor.zones[zone_name], self.art_cache, self.fetcher, cancelled)
+
+    # --- map ---
+    def _compose_map(self):
+        # under the renderer's lock: the surface is one of its two reused buffers
+        with self.renderer.lock:
+            surface, version = self.renderer.surface, self.renderer.version
+            if surface is None or version == self.map_version:
+                return False
+            self.map_frame.fill((0, 0, 0))
+            self.map_frame.blit(surface, self.map_offset)
+        self.map_version = version
+        return True
+
+    def _refresh_map(self):
+        if self.mode == MODE_MAP and not self.transition.active and self._compose_map():
+            self.screen.blit(self.map_frame, (0, 0))
+            pygame.display.flip()
+
+    def _set_map_fps(self, fps):
+        faster = fps > self.renderer.fps
+        self.renderer.set_fps(fps)
+        if faster and self._wake_render is not None:
+            self._wake_render.set()     # as TerminatorRenderer.set_fps: only a higher rate renders right away
+
+    def _start_transition(self, surface):
+        self.transition.start(surface)
+        if self._wake_display is not None:
+            self._wake_display.set()
+
+    # --- mode switching ---
+    def _follow_zones(self, updates):
+        active = self.monitor.active_zone() if self.monitor is not None else None
+        if active is None:
+            if self.mode == MODE_ART:
+                self.mode = MODE_MAP
+                self.art_surface = None
+                self._set_map_fps(UPDATE_FPS)
+                self._compose_map()
+                self._start_transition(self.map_frame)
+            return
+        changed = {name for name, variables in updates
+                   if "transport_state" in variables or "current_track_meta_data" in variables}
+        if self.mode == MODE_MAP or active in changed:
+            self._submit_art(active)
+
+    def _submit_art(self, zone_name):
+        if self.art_worker is not None:
+            self.art_worker.submit(zone_name)
+            return
+        # latest request wins: a newer one cancels this task's coalesce wait,
+        # or makes its fetch give up at the next chunk
+        self._art_generation += 1
+        if self._art_task is not None:
+            self._art_task.cancel()
+        self._art_task = self._watch(asyncio.get_running_loop().create_task(
+            self._fetch_art(self._art_generation, zone_name), name="fetch_art"))
+
+    async def _fetch_art(self, generation, zone_name):
+        await asyncio.sleep(ART_COALESCE_SECONDS)
+        cancelled = lambda: generation != self._art_generation
+        loop = asyncio.get_running_loop()
+        try:
+            surface = await loop.run_in_executor(self._io_pool, partial(self._load_art, zone_name, cancelled))
+        except FetchCancelled:
+            return
+        except Exception as e:
+            print(f"Error loading album art: {e}")
+            surface = None
+        if not cancelled():
+            self._show_art(zone_name, surface)
+
+    def _show_art(self, zone_name, surface):
+        # the monitor may have been swapped out (or dropped) while the art loaded
+        if surface is None or self.monitor is None or self.monitor.active_zone() != zone_name:
+            return
+        if self.mode == MODE_MAP:
+            self.mode = MODE_ART
+            self._set_map_fps(BACKGROUND_MAP_FPS)
+        if surface is not self.art_surface:
+            self.art_surface = surface
+            self._start_transition(surface)
+
+    def stats(self):
+        stats = {"mode": self.mode, "map_frame_ms": round(1000 * self.renderer.frame_seconds, 1),
+                 "map_version": self.renderer.version,
+                 "art_cache": {"hits": self.art_cache.hits, "misses": self.art_cache.misses},
+                 "fetch": dict(self.fetcher.stats)}
+        if self.loop_stats is not None:
+            stats["loop"] = self.loop_stats.snapshot()
+        return stats
+
+    def _reload_config(self):
+        """ Apply a rewritten CONFIG_PATH: each setting goes to the one
+        place that uses it, the renderer picking its changes up between
+        frames.
+        """
+        changed = self.config.poll()
+        if not changed:
+            return
+        print(f"{CONFIG_PATH}: {', '.join(sorted(changed))} reloaded")
+        if "CITIES" in changed:
+            self.renderer.cities = CITIES
+        if "DAY_IMAGE_PATH" in changed or "NIGHT_IMAGE_PATH" in changed:
+            self._in_background(self._load_images, DAY_IMAGE_PATH, NIGHT_IMAGE_PATH)
+        if "ZONE_NAMES" in changed:
+            self._in_background(self._load_monitor, list(ZONE_NAMES))
+        if "TWILIGHT_BLUR_RADIUS" in changed:
+            self.renderer.set_twilight_blur(TWILIGHT_BLUR_RADIUS)
+        if "UPDATE_FPS" in changed or "BACKGROUND_MAP_FPS" in changed:
+            self._set_map_fps(BACKGROUND_MAP_FPS if self.mode == MODE_ART else UPDATE_FPS)
+
+    def _in_background(self, fn, *args):
+        """ Decodes and Sonos discovery block: keep them off the loop thread.
+        """
+        if self._io_pool is not None:
+            self._io_pool.submit(fn, *args)
+        else:
+            threading.Thread(target=fn, args=args, daemon=True).start()
+
+    def _hand_over(self, fn, *args):
+        """ Run fn(*args) on the loop thread, from any thread.
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(fn, *args)
+        else:
+            self._handoffs.put((fn, args))
+
+    def _load_images(self, day_path, night_path):
+        try:
+            day_img = Image.open(day_path).convert("RGB")
+            night_img = Image.open(night_path).convert("RGB")
+            if (day_path, night_path) == (DAY_IMAGE_PATH, NIGHT_IMAGE_PATH):     # not superseded meanwhile
+                self.renderer.set_images(day_img, night_img)
+        except (OSError, ValueError) as e:
+            print(f"Imagery not reloaded: {e}")
+
+    def _load_monitor(self, zone_names):
+        monitor = None
+        if zone_names:
+            try:
+                from SonosZones import ZoneMonitor
+                monitor = ZoneMonitor(zone_names, events=zone_events())
+            except Exception as e:
+                print(f"Sonos zones {zone_names} unavailable, keeping the current ones: {e}")
+                return
+        self._hand_over(self._swap_monitor, monitor)
+
+    def _swap_monitor(self, monitor):
+        """ Follow monitor's zones from now on (None: map only). Loop thread.
+        """
+        old, self.monitor = self.monitor, monitor
+        if self._zones is not None:
+            self._zones.cancel()
+            self._zones = None
+        if monitor is not None and self._loop is not None:
+            monitor.events.attach(self._loop)
+            self._zones = self._watch(self._loop.create_task(self._zones_task(monitor), name="zones"))
+        if old is not None:
+            self._in_background(old.unsubscribe)
+        active = monitor.active_zone() if monitor is not None else None
+        if active is None:
+            self._follow_zones([])
+        else:
+            self._submit_art(active)
+
+    def _log_stats(self):
+        s = self.stats()
+        print(f"mode={s['mode']} map_frame={s['map_frame_ms']:.0f}ms "
+              f"art_cache={self.art_cache.hits}/{self.art_cache.misses} fetch={s['fetch']}"
+              + (f" loop_lag={s['loop']['lag_ms']}ms" if "loop" in s else ""))
+
+    def _handle_input(self):
+        for ev in pygame.event.get():
+            if ev.type == pygame.QUIT:
+                self.running = False
+            elif ev.type == pygame.KEYDOWN and ev.key in (pygame.K_q, pygame.K_ESCAPE):
+                self.running = False
+            elif ev.type == ART_READY and self.art_worker is not None:
+                if self.art_worker.is_current(ev.generation):
+                    self._show_art(ev.args[0], ev.surface)
+
+    # --- loop ---
+    def run(self):
+        if EVENT_LOOP == "asyncio":
+            asyncio.run(self._run_async())
+        else:
+            self._run_threads()
+
+    def _run_threads(self):
+        self.renderer.start()
+        self.art_worker = ArtWorker(self._load_art)
+        if self.monitor is not None and self.monitor.active_zone() is not None:
+            self.art_worker.submit(self.monitor.active_zone())
+        try:
+            while self.running:
+                self._handle_input()
+                while not self._handoffs.empty():
+                    fn, args = self._handoffs.get_nowait()
+                    fn(*args)
+
+                if self.transition.active:
+                    self.transition.step()
+                    pygame.display.flip()
+                    wait = 1.0 / TRANSITION_FPS
+                else:
+                    wait = min(self.scheduler.until_next(), 0.1)
+
+                if self.monitor is not None:
+                    updates = self.monitor.poll(timeout=wait)
+                    if updates or self.mode == MODE_ART:
+                        self._follow_zones(updates)
+                else:
+                    time.sleep(wait)
+
+                self.scheduler.run_due()
+        finally:
+            self.shutdown()
+
+    async def _run_async(self):
+        """ Every job is a task on this loop. Rendering runs in a one-thread
+        executor (it's CPU-bound NumPy, which releases the GIL), art fetches
+        and decodes in a small I/O pool; display, input, Sonos events and
+        stats stay on the loop thread, which is also the one pygame needs.
+        """
+        loop = self._loop = asyncio.get_running_loop()
+        self._render_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="terminator")
+        self._io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="art")
+        self._wake_render = asyncio.Event()
+        self._wake_display = asyncio.Event()
+        self.loop_stats = LoopStats()
+        stopped = self._stopped = asyncio.Event()
+        tasks = [self._render_task(), self._display_task(), self._input_task(stopped),
+                 every(STATS_INTERVAL, self._log_stats, delay=STATS_INTERVAL), self.loop_stats.run()]
+        if self.monitor is not None:
+            if not isinstance(self.monitor.events, AsyncQueueBridge):
+                raise RuntimeError("the asyncio loop needs a ZoneMonitor built with events=zone_events()")
+            self.monitor.events.attach(loop)
+            self._zones = self._watch(loop.create_task(self._zones_task(self.monitor), name="zones"))
+            if self.monitor.active_zone() is not None:
+                self._submit_art(self.monitor.active_zone())
+        watching = self.config is not None and self.config.watcher.fileno() is not None
+        if watching:
+            loop.add_reader(self.config.watcher.fileno(), self._reload_config)    # wakes only on a write
+        elif self.config is not None:
+            tasks.append(every(CONFIG_POLL_SECONDS, self._reload_config, delay=CONFIG_POLL_SECONDS))
+        server = None
+        if STATS_PORT:
+            try:
+                server = await serve_stats(self.stats, STATS_HOST, STATS_PORT)
+            except OSError as e:
+                print(f"Stats endpoint unavailable: {e}")
+        tasks = [self._watch(loop.create_task(t, name=t.__name__.strip("_"))) for t in tasks]
+        try:
+            await stopped.wait()
+        finally:
+            tasks += [task for task in (self._art_task, self._zones) if task is not None]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if watching:
+                loop.remove_reader(self.config.watcher.fileno())
+            if server is not None:
+                server.close()
+            self._render_pool.shutdown(wait=True)     # the arena must be idle before pygame quits
+            self._io_pool.shutdown(wait=False)
+            self._loop = None
+            self.shutdown()
+        if self._failure is not None:
+            raise self._failure
+
+    def _watch(self, task):
+        """ A task that ends with an exception stops the app, the way one
+        raised in the threaded loop does, instead of leaving the map
+        frozen or the zones unheard.
+        """
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task):
+        if task.cancelled() or task.exception() is None:
+            return
+        print(f"Task {task.get_name()} failed, stopping")
+        if self._failure is None:
+            self._failure = task.exception()
+        self.running = False
+        self._stopped.set()
+
+    async def _render_task(self):
+        """ Frame deadlines at the renderer's rate; a finished frame goes
+        on the panel right away, with no separate refresh timer.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            deadline = loop.time() + 1.0 / self.renderer.fps
+            await loop.run_in_executor(self._render_pool, self.renderer.render_once)
+            self._refresh_map()
+            # set_fps() raising the rate cuts the wait short
+            await wait_event(self._wake_render, max(0.0, deadline - loop.time()))
+
+    async def _display_task(self):
+        """ Steps transitions at TRANSITION_FPS, and sleeps while there are none.
+        """
+        while True:
+            await self._wake_display.wait()
+            self._wake_display.clear()
+            while self.transition.active:
+                self.transition.step()
+                pygame.display.flip()
+                await asyncio.sleep(1.0 / TRANSITION_FPS)
+            self._refresh_map()
+
+    async def _input_task(self, stopped):
+        while self.running:
+            self._handle_input()
+            await asyncio.sleep(INPUT_POLL_SECONDS)
+        stopped.set()
+
+    async def _zones_task(self, monitor):
+        """ Wakes only when soco delivers an event; bursts are handled as one.
+        """
+        events = monitor.events
+        while True:
+            batch = [await events.get()]
+            while True:
+                try:
+                    batch.append(events.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            updates = [u for u in map(monitor.record, batch) if u is not None]
+            self._follow_zones(updates)
+
+    def shutdown(self):
+        self.renderer.stop()
+        if self.art_worker is not None:
+            self.art_worker.stop()
+        if self.monitor is not None:
+            self.monitor.close()
+        self.fetcher.close()
+        if self.config is not None:
+            self.config.close()
+        pygame.quit()
+
+def zone_events():
+    """ The event queue a ZoneMonitor needs for the configured EVENT_LOOP.
+    """
+    return AsyncQueueBridge() if EVENT_LOOP == "asyncio" else None
+
+# -----------------------
+# Main program
+# -----------------------
+def main():
+    app = App()
+
+    def _stop(sig, frame):
+        app.running = False
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    app.run()
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main()
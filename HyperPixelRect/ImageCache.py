@@ -0,0 +1,198 @@
+# ImageCache.py
+# Memory-bounded image cache and monthly day imagery for the terminator scripts
+
+import os, math, threading, queue, calendar
+from collections import OrderedDict
+from PIL import Image
+
+# -----------------------
+# LRU cache
+# -----------------------
+def image_nbytes(value):
+    """ Rough in-memory size of a PIL image, pygame Surface or NumPy array.
+    """
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if hasattr(value, "get_bytesize"):
+        w, h = value.get_size()
+        return w * h * value.get_bytesize()
+    if hasattr(value, "size") and hasattr(value, "mode"):
+        w, h = value.size
+        return w * h * len(value.getbands())
+    return 0
+
+class LRUCache:
+    """ Thread-safe LRU bounded by total bytes rather than by entry count.
+    """
+    def __init__(self, max_bytes, sizeof=image_nbytes):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return default
+            self._items.move_to_end(key)
+            return item[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._items[key] = (value, size)
+            self.bytes += size
+            # evict oldest, but always keep the entry we just added
+            while self.bytes > self.max_bytes and len(self._items) > 1:
+                _, (_, old_size) = self._items.popitem(last=False)
+                self.bytes -= old_size
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is None:
+                return default
+            self.bytes -= item[1]
+            return item[0]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+# -----------------------
+# Monthly day imagery
+# -----------------------
+class MonthlyDayImagery:
+    """ Twelve monthly day images, cross-blended by date.
+
+    Decoding happens on a background thread ahead of need; the render thread
+    only ever reads from the cache and falls back to whatever is already
+    decoded (or the static day image) rather than stalling on a JPEG decode.
+    close() stops that thread and drops the cache.
+    """
+    BLEND_STEPS = 32    # blend weight quantization, keeps blended frames cacheable
+
+    def __init__(self, pattern, fallback_path, size=None, max_bytes=12 * 1024 * 1024, lookahead=2):
+        self.paths = {}
+        for month in range(1, 13):
+            path = pattern.format(month=month)
+            self.paths[month] = path if os.path.exists(path) else fallback_path
+        self.fallback_path = fallback_path
+        self.size = size
+        self.lookahead = lookahead
+        self.cache = LRUCache(max_bytes)
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._blend = None
+        self._fallback = self._decode(fallback_path)
+        threading.Thread(target=self._worker, name="imagery-prefetch", daemon=True).start()
+
+    def _decode(self, path):
+        img = Image.open(path).convert("RGB")
+        if self.size is not None and img.size != tuple(self.size):
+            img = img.resize(self.size, Image.LANCZOS)
+        img.load()
+        return img
+
+    def _worker(self):
+        while True:
+            path = self._queue.get()
+            if path is None:
+                return
+            try:
+                if path not in self.cache:
+                    self.cache.put(path, self._decode(path))
+            except Exception as e:
+                print(f"Error decoding {path}: {e}")
+            finally:
+                with self._pending_lock:
+                    self._pending.discard(path)
+
+    def close(self):
+        self._queue.put(None)       # after anything already queued
+        self.cache.clear()
+        self._blend = None
+
+    def _request(self, path):
+        if path in self.cache:
+            return
+        with self._pending_lock:
+            if path in self._pending:
+                return
+            self._pending.add(path)
+        self._queue.put(path)
+
+    @staticmethod
+    def month_position(dt):
+        """ Return (month_a, month_b, t): dt lies a fraction t of the way from
+        the middle of month_a to the middle of month_b.
+        """
+        days = calendar.monthrange(dt.year, dt.month)[1]
+        frac = (dt.day - 1 + (dt.hour * 3600 + dt.minute * 60 + dt.second) / 86400.0) / days
+        pos = (dt.month - 1) + frac - 0.5
+        base = math.floor(pos)
+        return base % 12 + 1, (base + 1) % 12 + 1, pos - base
+
+    def prefetch(self, dt):
+        """ Queue the months needed around dt for background decoding.
+        """
+        month_a, _, _ = self.month_position(dt)
+        for i in range(self.lookahead + 2):
+            self._request(self.paths[(month_a - 1 + i) % 12 + 1])
+
+    def preload(self, dt):
+        """ Decode the images needed for dt before the first frame (startup only).
+        """
+        month_a, month_b, _ = self.month_position(dt)
+        for month in (month_a, month_b):
+            path = self.paths[month]
+            if path not in self.cache:
+                self.cache.put(path, self._decode(path))
+        self.prefetch(dt)
+
+    def _decoded(self, month):
+        path = self.paths[month]
+        img = self.cache.get(path)
+        if img is None:
+            self._request(path)
+        return img
+
+    def day_image(self, dt):
+        """ Return the blended day image for dt without ever blocking on a decode.
+        """
+        self.prefetch(dt)
+        month_a, month_b, t = self.month_position(dt)
+        step = int(round(t * self.BLEND_STEPS))
+        if step == self.BLEND_STEPS:
+            month_a, step = month_b, 0
+
+        img_a = self._decoded(month_a)
+        img_b = self._decoded(month_b) if step else img_a
+        if img_a is None or img_b is None:
+            # not decoded yet: use whichever side is ready, else the static image
+            ready = img_a if img_a is not None else img_b
+            return ready if ready is not None else self._fallback
+        if step == 0 or self.paths[month_a] == self.paths[month_b]:
+            return img_a
+
+        # keep only the latest blend so blended frames never evict decoded months
+        key = (self.paths[month_a], self.paths[month_b], step)
+        if self._blend is None or self._blend[0] != key:
+            self._blend = (key, Image.blend(img_a, img_b, step / self.BLEND_STEPS))
+        return self._blend[1]
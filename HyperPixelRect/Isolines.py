@@ -0,0 +1,191 @@
+# Isolines.py
+# Sun-elevation contours and the noon meridian as a map overlay
+
+import math
+from collections import OrderedDict, defaultdict
+import numpy as np
+import pygame
+
+from Terminator import sun_position
+
+# (elevation in degrees, RGBA): horizon, civil/nautical/astronomical twilight, high sun
+ISOLINE_LEVELS = (
+    (0, (255, 200, 80, 200)),
+    (-6, (150, 170, 255, 160)),
+    (-12, (110, 130, 230, 130)),
+    (-18, (80, 90, 200, 110)),
+    (30, (255, 230, 120, 110)),
+    (60, (255, 250, 180, 110)),
+)
+NOON_COLOR = (255, 255, 0, 140)
+ISOLINE_STEP = 4                # contour grid spacing in map pixels
+DECL_BUCKET_DEG = 0.25          # declination moves < 0.5 deg/day: a bucket lasts hours
+ISOLINE_CACHE = 16              # declination buckets kept (scrubbing walks through them)
+
+def _segments(f, level, step):
+    """ Vectorized marching squares over the node grid f (ny, nx).
+    Returns (edge_a, edge_b, point_a, point_b) arrays, one row per segment.
+    Edges are numbered 2 * node for the horizontal edge to the node's
+    right and 2 * node + 1 for the vertical edge below it, so neighbouring
+    cells name their shared edge the same way.
+    """
+    ny, nx = f.shape
+    v00, v01 = f[:-1, :-1], f[:-1, 1:]
+    v10, v11 = f[1:, :-1], f[1:, 1:]
+    b00, b01, b10, b11 = v00 > level, v01 > level, v10 > level, v11 > level
+    crossed = np.stack([b00 != b01, b01 != b11, b10 != b11, b00 != b10], axis=-1)   # top, right, bottom, left
+    count = crossed.sum(axis=-1)
+    ii, jj = np.nonzero(count >= 2)
+    if ii.size == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty((0, 2)), np.empty((0, 2))
+
+    node = ii * nx + jj
+    ids = np.stack([2 * node, 2 * (node + 1) + 1, 2 * (node + nx), 2 * node + 1], axis=-1)
+
+    def t(a, b):
+        d = b - a
+        return np.where(d != 0, (level - a) / np.where(d != 0, d, 1), 0.5)
+    a00, a01, a10, a11 = v00[ii, jj], v01[ii, jj], v10[ii, jj], v11[ii, jj]
+    x, y = jj * float(step), ii * float(step)
+    tt, tr, tb, tl = t(a00, a01), t(a01, a11), t(a10, a11), t(a00, a10)
+    pts = np.stack([np.stack([x + tt * step, y], -1),
+                    np.stack([x + step, y + tr * step], -1),
+                    np.stack([x + tb * step, y + step], -1),
+                    np.stack([x, y + tl * step], -1)], axis=1)          # (n, 4, 2)
+
+    cell = np.arange(ii.size)
+    simple = count[ii, jj] == 2
+    # the two crossed edges of each ordinary cell, in edge order
+    order = np.argsort(~crossed[ii, jj], axis=-1, kind="stable")
+    ea, eb = order[simple, 0], order[simple, 1]
+    sc = cell[simple]
+    edge_a, edge_b = [ids[sc, ea]], [ids[sc, eb]]
+    pa, pb = [pts[sc, ea]], [pts[sc, eb]]
+
+    saddle = cell[~simple]
+    if saddle.size:
+        # the centre decides which pair of opposite corners is cut off
+        centre = (a00 + a01 + a10 + a11)[saddle] / 4 > level
+        cut01 = centre == (a00[saddle] > level)
+        first = np.zeros(saddle.size, dtype=np.int64), np.where(cut01, 1, 3)   # top-right or top-left
+        second = np.where(cut01, 2, 1), np.where(cut01, 3, 2)       # bottom-left or bottom-right
+        for a, b in (first, second):
+            edge_a.append(ids[saddle, a])
+            edge_b.append(ids[saddle, b])
+            pa.append(pts[saddle, a])
+            pb.append(pts[saddle, b])
+    return np.concatenate(edge_a), np.concatenate(edge_b), np.concatenate(pa), np.concatenate(pb)
+
+def _join(edge_a, edge_b, pa, pb):
+    """ Chain segments sharing an edge into polylines, (n, 2) arrays.
+    """
+    point = {}
+    nbrs = defaultdict(list)
+    for a, b, p, q in zip(edge_a.tolist(), edge_b.tolist(), pa.tolist(), pb.tolist()):
+        point[a], point[b] = p, q
+        nbrs[a].append(b)
+        nbrs[b].append(a)
+
+    seen = set()
+    def walk(start):
+        chain = [start]
+        seen.add(start)
+        cur = start
+        while True:
+            nxt = [n for n in nbrs[cur] if n not in seen]
+            if not nxt:
+                break
+            cur = nxt[0]
+            seen.add(cur)
+            chain.append(cur)
+        if len(chain) > 2 and start in nbrs[cur]:
+            chain.append(start)         # closed loop
+        return np.array([point[e] for e in chain])
+
+    lines = [walk(e) for e, n in nbrs.items() if len(n) == 1 and e not in seen]     # open ends first
+    lines += [walk(e) for e in nbrs if e not in seen]
+    return lines
+
+def isolines(size, decl, levels=ISOLINE_LEVELS, step=ISOLINE_STEP):
+    """ Polylines per level for declination decl (radians), in map pixels
+    relative to the sun: the subsolar meridian is at x = w / 2.
+    """
+    w, h = size
+    xs = np.arange(0, w + step, step, dtype=np.float64)
+    ys = np.arange(0, h + step, step, dtype=np.float64)
+    hour_angle = np.radians(360.0 * (xs - w / 2) / w)
+    lat = np.radians(90.0 - 180.0 * ys / h)[:, None]
+    # same separable field as FrameArena's mask, in elevation terms: sin(elev)
+    f = np.sin(lat) * math.sin(decl) + np.cos(lat) * math.cos(decl) * np.cos(hour_angle)
+    return [(color, _join(*_segments(f, math.sin(math.radians(elev)), step)))
+            for elev, color in levels]
+
+class Isolines:
+    """ Elevation contours (ISOLINE_LEVELS) and the noon meridian.
+
+    The elevation field only slides east-west as the Earth turns; its shape
+    depends on the declination alone. Polylines are extracted once per
+    declination bucket, kept relative to the subsolar meridian, and
+    translated by the sun's longitude. They are rasterized into a
+    transparent layer only when that shift moves a whole pixel (about every
+    2 minutes on an 800 px map). Other frames just blit the layer.
+    """
+    def __init__(self, size, levels=ISOLINE_LEVELS, step=ISOLINE_STEP,
+                 bucket_deg=DECL_BUCKET_DEG, noon=True):
+        self.size = size
+        self.levels = levels
+        self.step = step
+        self.bucket_deg = bucket_deg
+        self.noon = noon
+        self.layer = pygame.Surface(size, pygame.SRCALPHA)
+        self.rasterized = 0
+        self._key = None
+        self._lines = OrderedDict()     # declination bucket -> [(color, polylines)]
+
+    def lines(self, decl):
+        bucket = round(math.degrees(decl) / self.bucket_deg)
+        lines = self._lines.get(bucket)
+        if lines is None:
+            lines = isolines(self.size, math.radians(bucket * self.bucket_deg), self.levels, self.step)
+            self._lines[bucket] = lines
+            if len(self._lines) > ISOLINE_CACHE:
+                self._lines.popitem(last=False)
+        else:
+            self._lines.move_to_end(bucket)
+        return bucket, lines
+
+    def update(self, dt_utc):
+        """ Re-rasterize the layer if the field has moved; True if it did.
+        """
+        w, h = self.size
+        decl, sun_lon = sun_position(dt_utc)
+        sun_lon = (sun_lon + math.pi) % (2 * math.pi) - math.pi
+        sun_x = int(round((math.degrees(sun_lon) + 180.0) / 360.0 * w))
+        bucket, lines = self.lines(decl)
+        if (bucket, sun_x) == self._key:
+            return False
+        self._key = (bucket, sun_x)
+
+        layer = self.layer
+        layer.fill((0, 0, 0, 0))
+        dx = sun_x - w // 2
+        # each line is drawn twice, one copy shifted a map width, so the
+        # part pushed past one edge comes back in at the other
+        shifts = (dx, dx - w) if dx > 0 else (dx, dx + w)
+        for color, polylines in lines:
+            for line in polylines:
+                if len(line) < 2:
+                    continue
+                for shift in shifts:
+                    pygame.draw.lines(layer, color, False, (line + (shift, 0)).tolist())
+        if self.noon:
+            pygame.draw.line(layer, NOON_COLOR, (sun_x % w, 0), (sun_x % w, h - 1))
+        self.rasterized += 1
+        return True
+
+    def draw(self, surface, dt_utc):
+        """ FrameArena overlay hook.
+        """
+        self.update(dt_utc)
+        surface.blit(self.layer, (0, 0))
@@ -0,0 +1,319 @@
+# Kernels.py
+# Mask, twilight and blend kernels for FrameArena: NumPy always, numexpr and
+# Numba when installed, with the fastest picked once per CPU and resolution
+
+import os, json, time, platform
+from datetime import datetime, timezone
+import numpy as np
+
+from LinearLight import ENCODE_LUT, ENCODE_SHIFT
+
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None
+try:
+    import numba
+    if "NUMBA_THREADING_LAYER_PRIORITY" not in os.environ:
+        # kernels run on the render thread, and a TBB pool started from a
+        # non-main thread can keep the interpreter from exiting
+        numba.config.THREADING_LAYER_PRIORITY = ["omp", "workqueue", "tbb"]
+except ImportError:
+    numba = None
+
+KERNEL_CACHE_PATH = os.path.expanduser("~/.cache/hyperpixel/kernels.json")
+BENCH_FRAMES = 5                # timed frames per backend
+BENCH_MAX_ERROR = 2             # a backend may differ from NumPy by this much per channel
+BENCH_DT = datetime(2025, 3, 20, 9, tzinfo=timezone.utc)     # twilight crosses the whole map
+RAMP_SCALE = 255 / 0.04         # cos zenith -0.02..+0.02 -> 0..255
+
+class NumpyKernels:
+    """ In-place NumPy ufuncs on the arena's buffers. Always available.
+
+    Each kernel reads and writes FrameArena buffers only:
+      zenith:   _a (h, 1), _b (h, 1), _c (w,) -> mask_f, ramped and clipped to 0..255
+      twilight: mask_f blurred in place (if arena.r) -> mask, uint8
+      blend:    mask, _day/_night/_diff -> out, (h, w, 3) uint8; in linear
+                light (then re-encoded) when arena.linear
+    """
+    name = "numpy"
+
+    def zenith(self, arena):
+        m = arena.mask_f
+        np.multiply(arena._b, arena._c, out=m)
+        np.add(m, arena._a, out=m)
+        np.add(m, 0.02, out=m)
+        np.multiply(m, RAMP_SCALE, out=m)
+        np.clip(m, 0, 255, out=m)
+
+    def twilight(self, arena):
+        m = arena.mask_f
+        for _ in range(arena.passes if arena.r else 0):
+            self._box_rows(arena, m)
+            self._box_cols(arena, m)
+        np.copyto(arena.mask, m, casting="unsafe")
+
+    def _box_rows(self, arena, m):
+        r, w = arena.r, arena.size[0]
+        pad, cs = arena._hpad, arena._hsum
+        pad[:, r:r + w] = m
+        pad[:, :r] = m[:, w - r:]          # the map wraps at the date line
+        pad[:, r + w:] = m[:, :r]
+        np.cumsum(pad, axis=1, out=cs)
+        m[:, 0] = cs[:, 2 * r]
+        np.subtract(cs[:, 2 * r + 1:], cs[:, :w - 1], out=m[:, 1:])
+        np.multiply(m, 1.0 / (2 * r + 1), out=m)
+
+    def _box_cols(self, arena, m):
+        r, h = arena.r, arena.size[1]
+        pad, cs = arena._vpad, arena._vsum
+        pad[r:r + h] = m
+        pad[:r] = m[:1]                    # the poles don't
+        pad[r + h:] = m[h - 1:]
+        np.cumsum(pad, axis=0, out=cs[1:])
+        np.subtract(cs[2 * r + 1:], cs[:h], out=m)
+        np.multiply(m, 1.0 / (2 * r + 1), out=m)
+
+    def blend(self, arena, out):
+        """ night + (day - night) * k >> 7, k = (mask + mask >> 7) >> 1 (0..128).
+        """
+        k, tmp, mask = arena._k, arena._tmp, arena.mask
+        np.right_shift(mask, 7, out=k)
+        np.add(k, mask, out=k)
+        np.right_shift(k, 1, out=k)
+        np.multiply(arena._diff, arena._k3, out=tmp)
+        np.right_shift(tmp, 7, out=tmp)
+        np.add(tmp, arena._night, out=tmp)
+        if arena.linear:
+            # uint16 linear -> encode table index -> sRGB byte
+            np.right_shift(tmp, ENCODE_SHIFT, out=tmp)
+            np.take(ENCODE_LUT, tmp, out=out, mode="clip")
+        else:
+            np.copyto(out, tmp, casting="unsafe")
+        return out
+
+class NumexprKernels(NumpyKernels):
+    """ numexpr evaluates each expression in one multi-threaded pass over
+    cache-sized blocks, without full-frame temporaries. The blur needs
+    cumulative sums, which numexpr lacks, so it stays NumPy.
+    """
+    name = "numexpr"
+
+    def zenith(self, arena):
+        ne.evaluate("(b * c + a + 0.02) * s",
+                    local_dict={"a": arena._a, "b": arena._b, "c": arena._c, "s": np.float32(RAMP_SCALE)},
+                    out=arena.mask_f, casting="unsafe")
+        np.clip(arena.mask_f, 0, 255, out=arena.mask_f)
+
+    def blend(self, arena, out):
+        if arena.linear:
+            return super().blend(arena, out)    # numexpr has no uint16 arrays
+        ne.evaluate("night + diff * (m * s)",
+                    local_dict={"night": arena._night, "diff": arena._diff, "m": arena._mask_f3,
+                                "s": np.float32(1 / 255)},
+                    out=out, casting="unsafe")
+        return out
+
+if numba is not None:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _nb_zenith(a, b, c, scale, out):
+        h, w = out.shape
+        for y in numba.prange(h):
+            ay = a[y, 0]
+            by = b[y, 0]
+            for x in range(w):
+                v = (by * c[x] + ay + 0.02) * scale
+                out[y, x] = min(max(v, 0.0), 255.0)
+
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _nb_box(m, hpad, vpad, r, passes, mask):
+        h, w = m.shape
+        inv = 1.0 / (2 * r + 1)
+        for _ in range(passes):
+            # rows: running sum, wrapping east-west
+            for y in numba.prange(h):
+                p = hpad[y]
+                for x in range(w):
+                    p[r + x] = m[y, x]
+                for x in range(r):
+                    p[x] = m[y, w - r + x]
+                    p[r + w + x] = m[y, x]
+                s = 0.0
+                for x in range(2 * r + 1):
+                    s += p[x]
+                m[y, 0] = s * inv
+                for x in range(1, w):
+                    s += p[x + 2 * r] - p[x - 1]
+                    m[y, x] = s * inv
+            # columns: clamped at the poles, summed a row at a time so the
+            # inner loop runs along memory
+            for y in numba.prange(h + 2 * r):
+                src = min(max(y - r, 0), h - 1)
+                for x in range(w):
+                    vpad[y, x] = m[src, x]
+            for y in numba.prange(h):
+                for x in range(w):
+                    s = 0.0
+                    for j in range(2 * r + 1):
+                        s += vpad[y + j, x]
+                    m[y, x] = s * inv
+        for y in numba.prange(h):
+            for x in range(w):
+                mask[y, x] = np.uint8(m[y, x])
+
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _nb_blend(mask, night, diff, out):
+        h, w = mask.shape
+        for y in numba.prange(h):
+            for x in range(w):
+                k = (np.int32(mask[y, x]) + (np.int32(mask[y, x]) >> 7)) >> 1
+                for ch in range(3):
+                    out[y, x, ch] = np.uint8(night[y, x, ch] + ((np.int32(diff[y, x, ch]) * k) >> 7))
+
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _nb_blend_linear(mask, night, diff, lut, shift, out):
+        h, w = mask.shape
+        top = lut.shape[0] - 1
+        for y in numba.prange(h):
+            for x in range(w):
+                k = (np.int32(mask[y, x]) + (np.int32(mask[y, x]) >> 7)) >> 1
+                for ch in range(3):
+                    v = (np.int32(night[y, x, ch]) + ((diff[y, x, ch] * k) >> 7)) >> shift
+                    out[y, x, ch] = lut[min(max(v, 0), top)]
+
+class NumbaKernels(NumpyKernels):
+    """ Compiled, multi-threaded loops, each kernel one fused pass per row.
+    Compilation is cached next to this file, so only the first start pays.
+    """
+    name = "numba"
+
+    def zenith(self, arena):
+        _nb_zenith(arena._a, arena._b, arena._c, np.float32(RAMP_SCALE), arena.mask_f)
+
+    def twilight(self, arena):
+        _nb_box(arena.mask_f, arena._hpad, arena._vpad, arena.r, arena.passes if arena.r else 0, arena.mask)
+
+    def blend(self, arena, out):
+        if arena.linear:
+            _nb_blend_linear(arena.mask, arena._night, arena._diff, ENCODE_LUT, ENCODE_SHIFT, out)
+        else:
+            _nb_blend(arena.mask, arena._night, arena._diff, out)
+        return out
+
+def available_kernels():
+    """ Kernel sets whose libraries imported, NumPy first.
+    """
+    kernels = [NumpyKernels()]
+    if ne is not None:
+        kernels.append(NumexprKernels())
+    if numba is not None:
+        kernels.append(NumbaKernels())
+    return kernels
+
+def kernels_by_name(name):
+    for kernels in available_kernels():
+        if kernels.name == name:
+            return kernels
+    raise ValueError(f"compute backend {name!r} is not available")
+
+def _cpu_model():
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.split(":")[0].strip() in ("model name", "Model", "Hardware"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+def _cache_key(arena):
+    libs = [f"numpy {np.__version__}"]
+    if ne is not None:
+        libs.append(f"numexpr {ne.__version__}")
+    if numba is not None:
+        libs.append(f"numba {numba.__version__}")
+    w, h = arena.size
+    return "|".join([platform.machine(), _cpu_model(), f"{os.cpu_count()} cpus",
+                     f"{w}x{h} r{arena.r}" + (" linear" if arena.linear else "")
+                     + ("" if arena.kernel_blend else " mask only")] + libs)
+
+def benchmark(arena, kernels, frames=BENCH_FRAMES):
+    """ Median seconds per mask + twilight + blend frame for a kernel set;
+    None if its output doesn't match NumPy's. Arenas that blend some other
+    way (Rgb565Arena) time the mask alone.
+
+    Mask and blend are checked separately, the blend on NumPy's mask: in
+    linear light one mask level can move a dark pixel several sRGB steps,
+    which would fail a backend whose kernels are both fine.
+    """
+    blend = arena.kernel_blend
+    if blend:
+        out = np.empty(arena.size[::-1] + (3,), dtype=np.uint8)
+        reference = np.empty_like(out)
+    saved = arena.kernels
+    try:
+        arena.kernels = NumpyKernels()
+        arena.compute_mask(BENCH_DT)
+        reference_mask = arena.mask.copy()
+        if blend:
+            arena.kernels.blend(arena, reference)
+
+        arena.kernels = kernels
+        if blend:
+            kernels.blend(arena, out)           # warm up (and compile)
+            if np.abs(out.astype(np.int16) - reference).max() > BENCH_MAX_ERROR:
+                return None
+        arena.compute_mask(BENCH_DT)
+        if np.abs(arena.mask.astype(np.int16) - reference_mask).max() > BENCH_MAX_ERROR:
+            return None
+        times = []
+        for _ in range(frames):
+            t0 = time.perf_counter()
+            arena.compute_mask(BENCH_DT)
+            if blend:
+                kernels.blend(arena, out)
+            times.append(time.perf_counter() - t0)
+        return sorted(times)[len(times) // 2]
+    finally:
+        arena.kernels = saved
+
+def select_kernels(arena, cache_path=KERNEL_CACHE_PATH):
+    """ The fastest kernel set for this CPU and arena size. The choice is
+    cached on disk, keyed by CPU, core count, resolution and library
+    versions, so only the first start on a given setup benchmarks.
+    """
+    key = _cache_key(arena)
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    name = cache.get(key, {}).get("backend")
+    if name is not None:
+        try:
+            return kernels_by_name(name)
+        except ValueError:
+            pass            # library went away since; benchmark again
+
+    results = {}
+    for kernels in available_kernels():
+        try:
+            seconds = benchmark(arena, kernels)
+        except Exception as e:
+            print(f"{kernels.name} kernels failed: {e}")
+            continue
+        if seconds is not None:
+            results[kernels.name] = seconds
+    best = min(results, key=results.get) if results else NumpyKernels.name
+    print("compute backends: " + ", ".join(f"{n} {1000 * s:.1f} ms" for n, s in results.items())
+          + f" -> {best}")
+
+    cache[key] = {"backend": best, "ms": {n: round(1000 * s, 2) for n, s in results.items()}}
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path + ".tmp", "w") as f:
+            json.dump(cache, f, indent=1)
+        os.replace(cache_path + ".tmp", cache_path)
+    except OSError as e:
+        print(f"Can't cache compute backend choice: {e}")
+    return kernels_by_name(best)
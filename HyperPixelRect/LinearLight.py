@@ -0,0 +1,46 @@
+# LinearLight.py
+# sRGB <-> linear light through lookup tables, for blending in linear space
+
+import numpy as np
+
+LINEAR_MAX = 65535              # linear light is kept at uint16 precision
+ENCODE_BITS = 12                # the encode table has 2 ** 12 = 4096 entries
+ENCODE_SHIFT = 16 - ENCODE_BITS # linear uint16 -> encode table index
+
+def srgb_to_linear(v):
+    """ sRGB transfer function inverse, floats 0..1 -> 0..1.
+    """
+    v = np.asarray(v, dtype=np.float64)
+    return np.where(v <= 0.04045, v / 12.92, ((v + 0.055) / 1.055) ** 2.4)
+
+def linear_to_srgb(v):
+    v = np.asarray(v, dtype=np.float64)
+    return np.where(v <= 0.0031308, v * 12.92, 1.055 * np.power(v, 1 / 2.4) - 0.055)
+
+# sRGB byte -> linear uint16, and linear >> ENCODE_SHIFT -> sRGB byte. Encode
+# entries sit at the middle of their bin, since the index truncates.
+DECODE_LUT = np.round(srgb_to_linear(np.arange(256) / 255.0) * LINEAR_MAX).astype(np.uint16)
+ENCODE_LUT = np.round(linear_to_srgb((np.arange(1 << ENCODE_BITS) + 0.5) / (1 << ENCODE_BITS)) * 255).astype(np.uint8)
+
+def linearize(rgb, out=None):
+    """ sRGB bytes (any shape) -> linear uint16, one table lookup per value.
+    Static imagery goes through this once, when it's loaded.
+    """
+    return np.take(DECODE_LUT, np.asarray(rgb, dtype=np.uint8), out=out, mode="clip")
+
+def encode(linear, out=None):
+    """ Linear values in 0..LINEAR_MAX (any integer dtype) -> sRGB bytes.
+    Shifts `linear` down in place when it's writable and out is given.
+    """
+    index = np.right_shift(linear, ENCODE_SHIFT, out=linear if out is not None else None)
+    return np.take(ENCODE_LUT, index, out=out, mode="clip")
+
+if __name__ == "__main__":
+    # Self-check: every sRGB byte survives the round trip through linear
+    v = np.arange(256, dtype=np.uint8)
+    back = encode(linearize(v).astype(np.int32))
+    assert np.array_equal(back, v), np.nonzero(back != v)
+    # a 50/50 blend of black and white is about 187 in sRGB, not 127
+    mid = encode(np.array([(int(DECODE_LUT[0]) + int(DECODE_LUT[255])) // 2]))
+    print(f"linear midpoint of black and white: {int(mid[0])}")
+    print("ok")
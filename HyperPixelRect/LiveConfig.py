@@ -0,0 +1,192 @@
+# LiveConfig.py
+# Configuration overrides from a JSON file, reloaded while the display runs
+
+import os, json, time, struct, ctypes, ctypes.util
+
+CONFIG_POLL_SECONDS = 2.0       # stat() interval when inotify isn't available
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO    = 0x00000080
+IN_DELETE      = 0x00000200
+IN_NONBLOCK    = 0o4000
+IN_CLOEXEC     = 0o2000000
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len; then len bytes of name
+
+def _inotify():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        return libc if hasattr(libc, "inotify_init1") else None
+    except OSError:
+        return None
+
+class ConfigWatcher:
+    """ Tells whether a file has been rewritten since the last call.
+
+    With inotify (Linux, through ctypes) the file's directory is watched,
+    so editors that save by writing a new file and renaming it over the old
+    one are seen too, and so is the file being deleted; changed() is then
+    one non-blocking read, and fileno() can go into a select() or an
+    asyncio add_reader(). Elsewhere it falls back to comparing stat()
+    results every poll_seconds.
+    """
+    def __init__(self, path, poll_seconds=CONFIG_POLL_SECONDS, use_inotify=True):
+        self.path = os.path.abspath(path)
+        self.poll_seconds = poll_seconds
+        self._fd = None
+        self._name = os.path.basename(self.path).encode()
+        self._stat = self._signature()
+        self._checked = time.monotonic()
+        libc = _inotify() if use_inotify else None
+        if libc is not None:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                wd = libc.inotify_add_watch(fd, os.path.dirname(self.path).encode(), IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE)
+                if wd >= 0:
+                    self._fd = fd
+                else:
+                    os.close(fd)
+        self.mode = "inotify" if self._fd is not None else "polling"
+
+    def _signature(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size, st.st_ino
+        except OSError:
+            return None
+
+    def fileno(self):
+        """ The inotify descriptor (readable when something happened), or None.
+        """
+        return self._fd
+
+    def changed(self):
+        if self._fd is not None:
+            hit = False
+            while True:
+                try:
+                    data = os.read(self._fd, 4096)
+                except BlockingIOError:
+                    break
+                offset = 0
+                while offset + _EVENT.size <= len(data):
+                    _, _, _, length = _EVENT.unpack_from(data, offset)
+                    name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+                    hit = hit or name == self._name
+                    offset += _EVENT.size + length
+            return hit
+        now = time.monotonic()
+        if now - self._checked < self.poll_seconds:
+            return False
+        self._checked = now
+        signature = self._signature()
+        if signature == self._stat:
+            return False
+        self._stat = signature
+        return True
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+def _coerce(current, value):
+    """ value shaped like current (JSON has lists where the code has tuples),
+    or TypeError if it's the wrong kind of thing.
+    """
+    if isinstance(current, bool):
+        if not isinstance(value, bool):
+            raise TypeError(f"expected true/false, got {value!r}")
+        return value
+    if isinstance(current, (int, float)):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise TypeError(f"expected a number, got {value!r}")
+        return value
+    if isinstance(current, tuple):
+        if not isinstance(value, list) or (current and len(value) != len(current)):
+            raise TypeError(f"expected a list of {len(current)}, got {value!r}")
+        return tuple(_coerce(c, v) for c, v in zip(current, value)) if current else tuple(value)
+    if isinstance(current, dict):
+        if not isinstance(value, dict):
+            raise TypeError(f"expected an object, got {value!r}")
+        sample = next(iter(current.values()), None)
+        return {k: _coerce(sample, v) if sample is not None else v for k, v in value.items()}
+    if isinstance(current, list):
+        if not isinstance(value, list):
+            raise TypeError(f"expected a list, got {value!r}")
+        return list(value)
+    if isinstance(current, str) and not isinstance(value, str):
+        raise TypeError(f"expected a string, got {value!r}")
+    return value
+
+def positive(value):
+    """ Check for rates and intervals: a 0 would end up dividing by zero.
+    """
+    if value <= 0:
+        raise ValueError(f"must be more than 0, got {value!r}")
+
+def non_negative(value):
+    if value < 0:
+        raise ValueError(f"can't be negative, got {value!r}")
+
+class LiveConfig:
+    """ Overrides for a module's configuration constants from a JSON object
+    whose keys are the constants' names, e.g.
+
+        {"UPDATE_FPS": 5, "CITIES": {"Oslo": [59.91, 10.75]}}
+
+    Only names in keys are accepted, and each value has to have the type of
+    the constant it replaces and pass its check from checks, if it has one
+    (a function raising ValueError, e.g. positive()). load() applies the file to namespace (the
+    module's globals()) and returns {name: new value} for what actually
+    changed, so the caller can invalidate just the caches those feed. Names
+    left out of the file (or the file being deleted) go back to the values
+    the module started with. A file that doesn't parse or doesn't check
+    out changes nothing.
+    """
+    def __init__(self, path, namespace, keys, watcher=None, checks=None):
+        self.path = path
+        self.namespace = namespace
+        self.keys = set(keys)
+        self.defaults = {name: namespace[name] for name in self.keys}
+        self.watcher = watcher
+        self.checks = checks or {}
+        self.reloads = 0
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError("expected a JSON object")
+            values = dict(self.defaults)
+            for name, value in data.items():
+                if name not in self.keys:
+                    print(f"{self.path}: {name} can't be set here, ignored")
+                    continue
+                try:
+                    values[name] = _coerce(self.defaults[name], value)
+                    if name in self.checks:
+                        self.checks[name](values[name])
+                except (TypeError, ValueError) as e:
+                    raise ValueError(f"{name}: {e}")
+        except FileNotFoundError:
+            values = dict(self.defaults)
+        except (OSError, ValueError) as e:
+            print(f"{self.path} not applied: {e}")
+            return {}
+        changed = {name: value for name, value in values.items() if self.namespace[name] != value}
+        self.namespace.update(changed)
+        self.reloads += 1
+        return changed
+
+    def poll(self):
+        """ load() if the file was rewritten since the last poll, else {}.
+        """
+        if self.watcher is None:
+            self.watcher = ConfigWatcher(self.path)
+        return self.load() if self.watcher.changed() else {}
+
+    def close(self):
+        if self.watcher is not None:
+            self.watcher.close()
@@ -0,0 +1,36 @@
+# MapSettings.py
+# What the map shows and how it's rendered, shared by DarkShadows.py and
+# HyperPixelApp.py so the two can't drift apart (either can still override
+# them live, see LiveConfig.py)
+
+DAY_IMAGE_PATH   = "day.jpg"    # your 800x400 day image
+NIGHT_IMAGE_PATH = "night.jpg"  # your 800x400 night image
+TWILIGHT_BLUR_RADIUS = 4        # set 0 to disable
+UPDATE_FPS = 10                 # update redraws per second (10 is a good compromise)
+
+CITIES = {
+    "Null Island": (0.0, 0.0),
+    "Portage": (42.2012, -85.5800),
+    "Tokyo": (35.6895, 139.6917),
+    "Stockholm": (59.3293, 18.0686),
+    "Honolulu": (21.3069, -157.8583),
+    "NYC": (40.7128, -74.0060),
+    "LA": (34.0522, -118.2437),
+    "Tierra del Fuego": (-54.8019, -68.3029),
+    "Sydney": (-33.8688, 151.2093),
+    "João Pessoa": (-7.115, -34.86306),
+    "Cape Town": (-33.917419, 18.386274),
+}
+CITY_TIMEZONES = {              # for CITY_LABELS; cities left out use their longitude's offset
+    "Null Island": "UTC",
+    "Portage": "America/Detroit",
+    "Tokyo": "Asia/Tokyo",
+    "Stockholm": "Europe/Stockholm",
+    "Honolulu": "Pacific/Honolulu",
+    "NYC": "America/New_York",
+    "LA": "America/Los_Angeles",
+    "Tierra del Fuego": "America/Argentina/Ushuaia",
+    "Sydney": "Australia/Sydney",
+    "João Pessoa": "America/Fortaleza",
+    "Cape Town": "Africa/Johannesburg",
+}
@@ -0,0 +1,211 @@
+# MultiOutput.py
+# One rendered map frame shown on several panels of different sizes and
+# orientations, each derived by a cached index map instead of a render
+
+import functools
+import numpy as np
+import pygame
+
+ROTATIONS = (0, 90, 180, 270)   # degrees clockwise the map is turned on a panel
+_PIXEL = {2: np.uint16, 3: np.dtype("V3"), 4: np.uint32}
+
+def fit_map(map_size, panel_size, rotation=0):
+    """ (size, offset) of the map turned by rotation and scaled to fit
+    panel_size, centred.
+    """
+    w, h = map_size if rotation in (0, 180) else map_size[::-1]
+    pw, ph = panel_size
+    scale = min(pw / w, ph / h)
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return size, ((pw - size[0]) // 2, (ph - size[1]) // 2)
+
+@functools.lru_cache(maxsize=16)
+def resample_index(src_size, src_stride, dst_size, dst_stride, rotation=0):
+    """ For every destination pixel, the flat index of the source pixel it
+    shows (nearest pixel centre, after turning the source by rotation),
+    as a read-only (dst_h, dst_stride) intp array. Strides are in pixels;
+    columns past dst_size's width only pad rows out to the stride.
+    """
+    if rotation not in ROTATIONS:
+        raise ValueError(f"rotation must be one of {ROTATIONS}, got {rotation}")
+    sw, sh = src_size
+    dw, dh = dst_size
+    rw, rh = (sw, sh) if rotation in (0, 180) else (sh, sw)
+    u = np.minimum((2 * np.arange(dst_stride) + 1) * rw // (2 * dw), rw - 1)[None, :]
+    v = ((2 * np.arange(dh) + 1) * rh // (2 * dh))[:, None]
+    if rotation == 0:
+        x, y = u, v
+    elif rotation == 90:
+        x, y = v, sh - 1 - u
+    elif rotation == 180:
+        x, y = sw - 1 - u, sh - 1 - v
+    else:
+        x, y = sw - 1 - v, u
+    index = (y * src_stride + x).astype(np.intp)
+    index.flags.writeable = False
+    return index
+
+def pixel_view(surface):
+    """ (flat array with one element per pixel, row stride in pixels) over
+    the surface's own memory. The surface stays locked, so not blittable,
+    until the array is released.
+    """
+    bpp, pitch = surface.get_bytesize(), surface.get_pitch()
+    if bpp not in _PIXEL or pitch % bpp:
+        raise ValueError(f"can't index {8 * bpp}-bit rows of {pitch} bytes by pixel")
+    return np.frombuffer(surface.get_buffer(), dtype=_PIXEL[bpp]), pitch // bpp
+
+class PanelOutput:
+    """ A panel (anything with a DisplayBackend's size and present())
+    showing the master frame turned by rotation and scaled to fit.
+
+    The resampling and the rotation are one gather through an index map
+    computed once per master size, so a panel costs a copy of its own
+    pixels per frame, whatever the master took to render. Nearest-pixel
+    sampling keeps it a copy: best with a master at least as large as the
+    map on any panel.
+    """
+    def __init__(self, backend, rotation=0, background=(0, 0, 0)):
+        self.backend = backend
+        self.rotation = rotation
+        self.size = backend.size
+        self.background = background
+        # what the backend gets, in a framebuffer's own depth
+        self.frame = pygame.Surface(self.size, 0, getattr(backend, "bpp", 0))
+        self.offset = (0, 0)
+        self._map = None
+        self._map_pixels = None
+        self._index = None
+        self._master = None                         # (size, bytes per pixel) the index map is for
+
+    def _allocate(self, master):
+        map_size, self.offset = fit_map(master.get_size(), self.size, self.rotation)
+        if master.get_bytesize() == 3:
+            # pygame pads 24-bit rows to 4 bytes; frombuffer rows stay w * 3
+            self._map_pixels = np.zeros((map_size[1], map_size[0], 3), dtype=np.uint8)
+            self._map = pygame.image.frombuffer(self._map_pixels, map_size, "RGB")
+        else:
+            self._map = pygame.Surface(map_size, 0, master)
+        src, src_stride = pixel_view(master)
+        dst, dst_stride = pixel_view(self._map)
+        del src, dst
+        self._index = resample_index(master.get_size(), src_stride, map_size, dst_stride, self.rotation)
+        self._master = (master.get_size(), master.get_bytesize())
+        self.frame.fill(self.background)
+
+    def update(self, master):
+        """ Resample a published master frame into this panel's map. Brief;
+        hold whatever lock the master was published under.
+        """
+        if self._master != (master.get_size(), master.get_bytesize()):
+            self._allocate(master)
+        src, _ = pixel_view(master)
+        dst, _ = pixel_view(self._map)
+        np.take(src, self._index, out=dst.reshape(self._index.shape), mode="clip")
+        del src, dst
+
+    def present(self):
+        if self._map is None:
+            return
+        self.frame.blit(self._map, self.offset)
+        self.backend.present(self.frame)
+
+    def close(self):
+        self.backend.close()
+
+class MultiOutput:
+    """ Several PanelOutputs fed from one render: update() every panel from
+    a new master frame (under its lock), then present() them outside it.
+    """
+    def __init__(self, outputs):
+        self.outputs = list(outputs)
+        self.frames = 0
+
+    def update(self, master):
+        for output in self.outputs:
+            output.update(master)
+        self.frames += 1
+
+    def present(self):
+        for output in self.outputs:
+            output.present()
+
+    def close(self):
+        for output in self.outputs:
+            output.close()
+
+if __name__ == "__main__":
+    # Self-check: one render shown on an 800x480 and a 720x720 panel and on
+    # an 800x480 panel turned portrait, against a full render per panel
+    import os, sys, time, tempfile
+    from datetime import datetime, timezone
+    from PIL import Image
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    from FrameArena import FrameArena
+    from MapSettings import TWILIGHT_BLUR_RADIUS
+    from DisplayBackend import FramebufferBackend
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    day = Image.open(sys.argv[1] if len(sys.argv) > 1 else "day.jpg").convert("RGB")
+    night = Image.open(sys.argv[2] if len(sys.argv) > 2 else "night.jpg").convert("RGB")
+    dt = datetime(2025, 6, 21, 18, tzinfo=timezone.utc)
+    cities = {"Null Island": (0.0, 0.0)}
+    panels = [((800, 480), 0), ((480, 800), 90), ((720, 720), 0)]
+
+    files, outputs = [], []
+    for (w, h), rotation in panels:
+        f = tempfile.NamedTemporaryFile()
+        f.truncate(w * h * 4)
+        files.append(f)
+        outputs.append(PanelOutput(FramebufferBackend(f.name, geometry=(w, h, 32, w * 4)), rotation))
+    multi = MultiOutput(outputs)
+    master = FrameArena(day.size, TWILIGHT_BLUR_RADIUS)
+    master.set_images(day, night)
+    own = []
+    for output in outputs:
+        size, _ = fit_map(day.size, output.size, output.rotation)
+        if output.rotation in (90, 270):
+            size = size[::-1]       # rendered upright, turned when shown
+        arena = FrameArena(size, TWILIGHT_BLUR_RADIUS)
+        arena.set_images(day.resize(size, Image.LANCZOS), night.resize(size, Image.LANCZOS))
+        own.append(arena)
+
+    def timed(fn, n=20):
+        fn()
+        start = time.perf_counter()
+        for _ in range(n):
+            fn()
+        return 1000 * (time.perf_counter() - start) / n
+
+    def shared():
+        multi.update(master.render(dt, cities))
+        multi.present()
+
+    def separate():
+        for output, arena in zip(outputs, own):
+            surface = arena.render(dt, cities)
+            if output.rotation:
+                surface = pygame.transform.rotate(surface, -output.rotation)
+            output.frame.blit(surface, output.offset)
+            output.backend.present(output.frame)
+
+    one = timed(lambda: master.render(dt, cities))
+    frame = master.render(dt, cities)
+    print(f"one render {one:.1f} ms, then per panel {timed(lambda: outputs[2].update(frame)):.2f} ms "
+          f"to resample and {timed(outputs[2].present):.2f} ms to present")
+    print(f"{len(outputs)} panels: shared {timed(shared):.1f} ms, a render each {timed(separate):.1f} ms")
+
+    multi.update(master.render(dt, cities))
+    source = pygame.surfarray.array3d(master._surfaces[master._back]).transpose(1, 0, 2)
+    turned = pygame.surfarray.array3d(outputs[1]._map).transpose(1, 0, 2)
+    assert np.array_equal(turned, np.rot90(source, -1)), "portrait panel should be the frame turned clockwise"
+    for output, arena in zip(outputs, own):
+        ours = pygame.surfarray.array3d(output._map).astype(np.int16)
+        full = arena.render(dt, cities)
+        if output.rotation:
+            full = pygame.transform.rotate(full, -output.rotation)
+        err = np.abs(ours - pygame.surfarray.array3d(full)).mean()
+        print(f"{output.size[0]}x{output.size[1]} turned {output.rotation}: mean error vs its own render {err:.2f}")
+        assert err < 4.0, err
+    multi.close()
+    print("ok")
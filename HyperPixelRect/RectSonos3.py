@@ -1,14 +1,15 @@
 from soco.discovery import by_name
-import requests
-from PIL import Image
-from io import BytesIO
-import os, time
+from soco.events import event_listener
+from queue import Empty
+import os, signal
 
 # --- hide pygame banner ---
 os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
 os.environ["SDL_VIDEODRIVER"] = "x11"  # GUI terminal
 import pygame
 
+from SonosArt import ArtCache, ArtFetcher, track_art_uri
+
 running = True
 
 # --- initialize pygame ---
@@ -17,6 +18,18 @@ pygame.mouse.set_visible(False)
 
 # --- open fullscreen surface ---
 screen = pygame.display.set_mode((800, 480), pygame.FULLSCREEN)
+clock = pygame.time.Clock()
+
+# decoded, screen-sized art keyed by URI; bytes come from a pooled session
+# backed by an on-disk cache
+fetcher = ArtFetcher()
+art_cache = ArtCache(screen.get_size(), fetch=fetcher.fetch)
+
+def stop(sig, frame):
+    global running
+    running = False
+signal.signal(signal.SIGTERM, stop)
+signal.signal(signal.SIGINT, stop)
 
 # Get the speaker object by zone name
 zoneName= "Basement"
@@ -24,66 +37,61 @@ zone = by_name(zoneName)
 if zone is None:
     raise RuntimeError(f"Sonos '{zoneName}' zone not found")
 
-while running:
-    #pygame.time.wait(500)  # .5 seconds
-
-    info = zone.get_current_transport_info()
-    state = info['current_transport_state']
+sub = zone.avTransport.subscribe(auto_renew=True)
 
+def surface_for(state, variables=None):
+    """ What to show for a transport state: art while playing (whatever is
+    already up if the art can't be had), otherwise black.
+    """
     if state == 'PLAYING':
-        # Get track info
-        track_info = zone.get_current_track_info()
-        album_art_uri = track_info.get("album_art")
-
-        if album_art_uri:
-            try:
-                # If Sonos returns a relative path, prepend the speaker’s base URL
-                if album_art_uri.startswith("/"):
-                    base_url = f"http://{zone.ip_address}:1400"
-                    album_art_url = base_url + album_art_uri
-                else:
-                    album_art_url = album_art_uri
-
-                # Fetch and load into PIL
-                response = requests.get(album_art_url)
-                response.raise_for_status()
-
-                # --- load Image via PIL ---
-                img = Image.open(BytesIO(response.content))
-                img = img.convert("RGB")
-                img = img.resize(screen.get_size())  # scale to fit screen
-                data = img.tobytes()
-                surf = pygame.image.fromstring(data, img.size, img.mode)
-                screen.blit(surf, (0,0))
-
-            except Exception as e:
-                # # fallback: show sonos logo if image fails
-                # img = Image.open("sonos.png")
-                # img = img.convert("RGB")
-                # img = img.resize(screen.get_size())  # scale to fit screen
-                # data = img.tobytes()
-                # surf = pygame.image.fromstring(data, img.size, img.mode)
-                # screen.blit(surf, (0, 0))
-
-                # log this error the try again
-                # if error count gets too high, show the sonos screen, so figure out how to do that
-                pass
-        elif state == 'STOPPED' or state == 'PAUSED':
-            # # fallback: show sonos logo if image fails
-            img = Image.open("sonos.png")
-            img = img.convert("RGB")
-            img = img.resize(screen.get_size())  # scale to fit screen
-            data = img.tobytes()
-            surf = pygame.image.fromstring(data, img.size, img.mode)
-            screen.blit(surf, (0, 0))
-
-        # --- update display ---
-        pygame.display.flip()
+        surf = art_cache.art(track_art_uri(zone, variables))
+        fetcher.prefetch_next(zone, then=art_cache.warm)
+        return surf if surf is not None else shown
+    return None
 
-    else:
-        # not playing; show a black screen
+def show(surf):
+    if surf is None:
         screen.fill((0, 0, 0))
-        pygame.display.flip()
-
-pygame.quit()
-
+    else:
+        screen.blit(surf, (0, 0))
+    pygame.display.flip()
+
+# initial frame, then only redraw when an event changes what's on screen
+state = zone.get_current_transport_info()['current_transport_state']
+shown = None                # black until there's art
+shown = surface_for(state)
+show(shown)
+
+try:
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE or event.unicode.lower() == 'q':
+                    running = False
+
+        try:
+            # wait on the subscription instead of polling the speaker, briefly
+            # enough that quit and ESC are handled right away
+            variables = sub.events.get(timeout=0.1).variables
+        except Empty:
+            continue
+
+        state = variables.get('transport_state', state)
+        if 'transport_state' in variables or 'current_track_meta_data' in variables:
+            surf = surface_for(state, variables)
+            if surf is not shown:
+                shown = surf
+                show(shown)
+
+        clock.tick(10)
+
+finally:
+    try:
+        sub.unsubscribe()
+    except Exception:
+        pass
+    event_listener.stop()
+    fetcher.close()
+    pygame.quit()
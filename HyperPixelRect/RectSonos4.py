@@ -10,12 +10,12 @@ import soco
 from soco.discovery import by_name
 from soco.events import event_listener
 from queue import Empty
-import requests
-from PIL import Image
-from io import BytesIO
 import signal
 import sys
 
+from SonosArt import ArtCache, ArtFetcher, ArtWorker, ART_READY, zone_art
+from Transitions import Transition, TRANSITION_FPS
+
 # --- setup Pygame fullscreen ---
 pygame.init()
 screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
@@ -24,6 +24,13 @@ pygame.mouse.set_visible(False)   # hide cursor
 clock = pygame.time.Clock()
 BLACK = (0, 0, 0)
 
+# pooled, disk-cached art downloads and decoded screen-sized surfaces
+fetcher = ArtFetcher()
+art_cache = ArtCache(screen.get_size(), fetch=fetcher.fetch)
+
+# crossfade between covers instead of hard cuts
+transition = Transition(screen)
+
 # --- handle Ctrl-C gracefully ---
 running = True
 def signal_handler(sig, frame):
@@ -32,27 +39,19 @@ def signal_handler(sig, frame):
 signal.signal(signal.SIGINT, signal_handler)
 
 # --- functions ---
-def fetch_album_art(zone):
-    """Fetch current album art as a pygame Surface."""
-    info = zone.get_current_track_info()
-    art_uri = info.get("album_art")
-    if not art_uri:
+def fetch_album_art(zone, cancelled=lambda: False):
+    """Fetch current album art as a pygame Surface (runs on the art worker)."""
+    return zone_art(zone, art_cache, fetcher, cancelled)
+
+def load_for_state(state, cancelled):
+    """Art worker job: the surface to show for a transport state."""
+    if state != "PLAYING":
         return None
-    if art_uri.startswith("/"):
-        art_uri = f"http://{zone.ip_address}:1400{art_uri}"
-    resp = requests.get(art_uri, timeout=5)
-    resp.raise_for_status()
-    img = Image.open(BytesIO(resp.content)).convert("RGB")
-    img = img.resize(screen.get_size(), Image.LANCZOS)
-    return pygame.image.fromstring(img.tobytes(), img.size, img.mode)
+    return fetch_album_art(zone, cancelled)
 
 def show_album_art(surface):
-    """Display the image or blank screen if None."""
-    if surface:
-        screen.blit(surface, (0, 0))
-    else:
-        screen.fill(BLACK)
-    pygame.display.flip()
+    """Fade to the image, or to a blank screen if None; the main loop steps it."""
+    transition.start(surface)
 
 # --- connect to Sonos ---
 zone = by_name("Basement")
@@ -61,10 +60,15 @@ if not zone:
 
 sub = zone.avTransport.subscribe(auto_renew=True)
 
+# Art is fetched off the display loop; bursts of events coalesce and a newer
+# request cancels the fetch for a track that has already been skipped
+art_worker = ArtWorker(load_for_state)
+
 # Initialize display
 state = zone.get_current_transport_info()["current_transport_state"]
-current_surface = fetch_album_art(zone) if state == "PLAYING" else None
+current_surface = None
 show_album_art(current_surface)
+art_worker.submit(state)
 
 # --- main loop ---
 try:
@@ -77,36 +81,51 @@ try:
                 # Exit on ESC or Q/q
                 if event.key == pygame.K_ESCAPE or event.unicode.lower() == 'q':
                     running = False
+            elif event.type == ART_READY:
+                # a result can be overtaken by a newer request after it was posted
+                if not art_worker.is_current(event.generation):
+                    continue
+                if event.args[0] != "PLAYING":
+                    current_surface = None
+                elif event.surface is not None:
+                    current_surface = event.surface
+                show_album_art(current_surface)
 
         if running:
-            # handle Sonos events
+            # handle Sonos events: drain everything queued, hand the worker only the latest;
+            # don't block while a transition is playing, it's stepped below
             try:
-                sonos_event = sub.events.get(timeout=0.1)
-                vars = sonos_event.variables
-
-                if "transport_state" in vars:
-                    state = vars["transport_state"]
-                    if state == "PLAYING":
-                        new_surface = fetch_album_art(zone)
-                        if new_surface:
-                            current_surface = new_surface
-                    else:
-                        current_surface = None
-                    show_album_art(current_surface)
-
-                elif "current_track_meta_data" in vars and state == "PLAYING":
-                    new_surface = fetch_album_art(zone)
-                    if new_surface:
-                        current_surface = new_surface
-                        show_album_art(current_surface)
+                sonos_event = sub.events.get(block=not transition.active, timeout=0.1)
+                while sonos_event is not None:
+                    vars = sonos_event.variables
+
+                    if "transport_state" in vars:
+                        state = vars["transport_state"]
+                        if state != "PLAYING":
+                            # clear right away; there is nothing to fetch
+                            current_surface = None
+                            show_album_art(current_surface)
+                        art_worker.submit(state)
+
+                    elif "current_track_meta_data" in vars and state == "PLAYING":
+                        art_worker.submit(state)
+
+                    sonos_event = sub.events.get_nowait()
 
             except Empty:
                 pass
 
-        clock.tick(30)
+        if transition.active:
+            transition.step()
+            pygame.display.flip()
+            clock.tick(TRANSITION_FPS)
+        else:
+            clock.tick(30)
 
 finally:
+    art_worker.stop()
     sub.unsubscribe()
     event_listener.stop()
+    fetcher.close()
     pygame.quit()
     sys.exit(0)
@@ -1,5 +1,4 @@
 import pygame
-import requests
 import io
 import signal
 import sys
@@ -8,6 +7,9 @@ from soco.discovery import by_name
 from soco.events import event_listener
 import queue
 
+from SonosArt import ArtFetcher, art_url
+from Transitions import Transition, TRANSITION_FPS
+
 # -------------------
 # Setup Sonos
 # -------------------
@@ -19,6 +21,9 @@ if zone is None:
 
 sub = zone.avTransport.subscribe(auto_renew=True)
 
+# pooled, disk-cached art downloads
+fetcher = ArtFetcher()
+
 # -------------------
 # Setup Pygame
 # -------------------
@@ -31,6 +36,9 @@ clock = pygame.time.Clock()
 running = True
 need_redraw = True
 
+# crossfade between covers instead of hard cuts
+transition = Transition(screen)
+
 # -------------------
 # Graceful Exit Handler
 # -------------------
@@ -45,6 +53,7 @@ def cleanup_and_exit(*args):
         event_listener.stop()
     except Exception:
         pass
+    fetcher.close()
     pygame.quit()
     sys.exit(0)
 
@@ -57,15 +66,9 @@ signal.signal(signal.SIGINT, cleanup_and_exit)
 def get_album_art_image(uri):
     if not uri:
         return None
-    if uri.startswith("http"):
-        url = uri
-    else:
-        url = f"http://{zone.ip_address}:1400{uri}"
 
     try:
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        image = Image.open(io.BytesIO(response.content))
+        image = Image.open(io.BytesIO(fetcher.fetch(art_url(zone, uri))))
         image = image.resize(screen.get_size(), Image.LANCZOS)
         return pygame.image.fromstring(image.tobytes(), image.size, image.mode).convert()
     except Exception as e:
@@ -77,19 +80,19 @@ def get_album_art_image(uri):
 # -------------------
 while running:
     try:
-        sonos_event = sub.events.get(timeout=0.5)
+        # don't block on Sonos while a transition is playing; it's stepped below
+        sonos_event = sub.events.get(block=not transition.active, timeout=0.5)
         if sonos_event is not None:
             state = sonos_event.variables.get("transport_state")
 
             if state in ("PLAYING", "TRANSITIONING"):
                 track = zone.get_current_track_info()
                 image = get_album_art_image(track["album_art"])
+                fetcher.prefetch_next(zone, track)
                 if image:
-                    screen.blit(image, (0, 0))
-                need_redraw = True
+                    transition.start(image)
             else:
-                screen.fill((0, 0, 0))
-                need_redraw = True
+                transition.start(None)
     except queue.Empty:
         pass
 
@@ -100,8 +103,12 @@ while running:
             if event.key == pygame.K_ESCAPE or event.unicode.lower() == 'q':
                 cleanup_and_exit()
 
-    if need_redraw:
+    if transition.active:
+        transition.step()
         pygame.display.flip()
-        need_redraw = False
-
-    clock.tick(10)
+        clock.tick(TRANSITION_FPS)
+    else:
+        if need_redraw:
+            pygame.display.flip()
+            need_redraw = False
+        clock.tick(10)
@@ -0,0 +1,134 @@
+import os
+# must set this BEFORE importing pygame
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+os.environ.setdefault("SDL_VIDEO_ALLOW_SCREENSAVER", "0")
+os.environ["SDL_VIDEO_WINDOW_POS"] = "0,0"
+os.environ["SDL_VIDEO_FOREIGN"] = "1"
+import pygame
+
+import signal
+import sys
+
+from SonosArt import ArtCache, ArtFetcher, ArtWorker, ART_READY, zone_art
+from SonosZones import ZoneMonitor, ZONE_POLICY_ACTIVE, ZONE_POLICY_TILES, tile_rects
+
+# -------------------
+# Configuration
+# -------------------
+ZONE_NAMES = ["Basement", "Kitchen", "Living Room"]
+ZONE_POLICY = ZONE_POLICY_ACTIVE     # or ZONE_POLICY_TILES
+
+# -------------------
+# Setup Pygame
+# -------------------
+pygame.init()
+pygame.display.set_caption("Sonos Album Art")
+screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
+pygame.mouse.set_visible(False)
+clock = pygame.time.Clock()
+BLACK = (0, 0, 0)
+
+running = True
+def signal_handler(sig, frame):
+    global running
+    running = False
+signal.signal(signal.SIGINT, signal_handler)
+signal.signal(signal.SIGTERM, signal_handler)
+
+# -------------------
+# Zones, shared caches and per-panel workers
+# -------------------
+monitor = ZoneMonitor(ZONE_NAMES)
+fetcher = ArtFetcher()
+
+if ZONE_POLICY == ZONE_POLICY_TILES:
+    rects = dict(zip(ZONE_NAMES, tile_rects(len(ZONE_NAMES), screen.get_size())))
+else:
+    rects = {name: (0, 0) + screen.get_size() for name in ZONE_NAMES}
+
+# tiles are all the same size, so every zone shares one cache of decoded art
+art_cache = ArtCache(next(iter(rects.values()))[2:], fetch=fetcher.fetch)
+
+def load_zone(name, state, cancelled):
+    if state != "PLAYING":
+        return None
+    return zone_art(monitor.zones[name], art_cache, fetcher, cancelled)
+
+# one latest-wins worker per panel: tiles fetch independently, while a single
+# followed panel cancels the previous zone's fetch when another zone takes over
+if ZONE_POLICY == ZONE_POLICY_TILES:
+    workers = {name: ArtWorker(load_zone) for name in ZONE_NAMES}
+else:
+    workers = dict.fromkeys(ZONE_NAMES, ArtWorker(load_zone))
+
+surfaces = dict.fromkeys(ZONE_NAMES)
+shown_zone = monitor.active_zone()
+
+def draw():
+    if ZONE_POLICY == ZONE_POLICY_TILES:
+        for name, (x, y, w, h) in rects.items():
+            if surfaces[name] is not None:
+                screen.blit(surfaces[name], (x, y))
+            else:
+                screen.fill(BLACK, (x, y, w, h))
+    elif shown_zone is not None and surfaces[shown_zone] is not None:
+        screen.blit(surfaces[shown_zone], (0, 0))
+    else:
+        screen.fill(BLACK)
+    pygame.display.flip()
+
+draw()
+if ZONE_POLICY == ZONE_POLICY_TILES:
+    for name in ZONE_NAMES:
+        workers[name].submit(name, monitor.states[name])
+elif shown_zone is not None:
+    workers[shown_zone].submit(shown_zone, "PLAYING")
+
+# -------------------
+# Main loop
+# -------------------
+try:
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE or event.unicode.lower() == 'q':
+                    running = False
+            elif event.type == ART_READY:
+                name, state = event.args
+                if not workers[name].is_current(event.generation):
+                    continue
+                if state != "PLAYING":
+                    surfaces[name] = None
+                elif event.surface is not None:
+                    surfaces[name] = event.surface
+                draw()
+
+        # route each zone's updates to its tile, or to the followed panel
+        changed = set()
+        for name, variables in monitor.poll(timeout=0.1):
+            if "transport_state" in variables or "current_track_meta_data" in variables:
+                changed.add(name)
+
+        if ZONE_POLICY == ZONE_POLICY_TILES:
+            for name in changed:
+                workers[name].submit(name, monitor.states[name])
+        else:
+            active = monitor.active_zone()
+            if active != shown_zone or active in changed:
+                shown_zone = active
+                if active is None:
+                    draw()
+                else:
+                    workers[active].submit(active, "PLAYING")
+
+        clock.tick(30)
+
+finally:
+    for worker in set(workers.values()):
+        worker.stop()
+    monitor.close()
+    fetcher.close()
+    pygame.quit()
+    sys.exit(0)
@@ -0,0 +1,115 @@
+# Rgb565.py
+# Packed 16-bit RGB565 pixels: dithered packing and blending without unpacking
+
+import numpy as np
+
+# 4x4 Bayer matrix, values 0..15
+BAYER4 = np.array([[ 0,  8,  2, 10],
+                   [12,  4, 14,  6],
+                   [ 3, 11,  1,  9],
+                   [15,  7, 13,  5]], dtype=np.uint16)
+
+# 565 pixel spread into a uint32 as 00000GGGGGG00000RRRRR000000BBBBB so all
+# three channels can be scaled by one multiply without carrying into each other
+SPREAD_MASK = np.uint32(0x07E0F81F)
+ALPHA_MAX = 32
+
+def bayer_tile(size, scale):
+    """ Bayer thresholds tiled to (h, w), scaled to 0..scale-1.
+    """
+    w, h = size
+    tile = (BAYER4 * scale) // 16
+    return np.tile(tile, ((h + 3) // 4, (w + 3) // 4))[:h, :w].astype(np.uint16)
+
+class Rgb565Packer:
+    """ Vectorized RGB888 -> RGB565 with ordered dithering, all into
+    buffers allocated once for a given size.
+    """
+    def __init__(self, size, dither=True):
+        w, h = size
+        self.size = size
+        self.dither = dither
+        self._d5 = bayer_tile(size, 8)      # 8 input levels per 5-bit step
+        self._d6 = bayer_tile(size, 4)      # 4 per 6-bit step
+        self._c = np.empty((h, w), dtype=np.uint16)
+
+    def _channel(self, src, dither, bits, shift, out, first):
+        c = self._c
+        np.copyto(c, src, casting="unsafe")
+        if self.dither:
+            np.add(c, dither, out=c)
+            np.minimum(c, 255, out=c)
+        np.right_shift(c, 8 - bits, out=c)
+        if shift:
+            np.left_shift(c, shift, out=c)
+        if first:
+            np.copyto(out, c)
+        else:
+            np.bitwise_or(out, c, out=out)
+
+    def pack(self, rgb, out=None):
+        """ (h, w, 3) uint8 -> (h, w) uint16 RGB565.
+        """
+        if out is None:
+            out = np.empty(rgb.shape[:2], dtype=np.uint16)
+        self._channel(rgb[..., 0], self._d5, 5, 11, out, True)
+        self._channel(rgb[..., 1], self._d6, 6, 5, out, False)
+        self._channel(rgb[..., 2], self._d5, 5, 0, out, False)
+        return out
+
+def spread(p565):
+    """ (h, w) uint16 RGB565 -> uint32 spread form for blend().
+    """
+    p = p565.astype(np.uint32)
+    return (p | (p << 16)) & SPREAD_MASK
+
+class Rgb565Blender:
+    """ Day/night blend carried out entirely on packed RGB565.
+
+    The two assets are dithered to 565 and spread once; each frame is then
+    out = (day * a + night * (32 - a)) >> 5 on the spread words, with the
+    0..255 mask ordered-dithered down to the 33 alpha levels so the twilight
+    gradient doesn't band.
+    """
+    def __init__(self, day_rgb, night_rgb, dither=True):
+        h, w = day_rgb.shape[:2]
+        self.size = (w, h)
+        packer = Rgb565Packer(self.size, dither)
+        self.day = spread(packer.pack(day_rgb))
+        self.night = spread(packer.pack(night_rgb))
+        self._da = bayer_tile(self.size, 8)           # 256 / 32 mask levels per alpha step
+        self._a = np.empty((h, w), dtype=np.uint32)
+        self._t = np.empty((h, w), dtype=np.uint32)
+        self._acc = np.empty((h, w), dtype=np.uint32)
+        self.out = np.empty((h, w), dtype=np.uint16)
+
+    def blend(self, mask, out=None):
+        """ mask: (h, w) uint8, 255 = day. Returns (h, w) uint16 RGB565.
+        """
+        out = self.out if out is None else out
+        a, t, acc = self._a, self._t, self._acc
+        # a = (mask + mask >> 7 + dither) >> 3: 0..255 stretched to 0..256, then 0..32
+        np.add(mask, self._da, out=a, dtype=np.uint32)
+        np.right_shift(mask, 7, out=t, dtype=np.uint32)
+        np.add(a, t, out=a)
+        np.right_shift(a, 3, out=a)
+        np.minimum(a, ALPHA_MAX, out=a)
+
+        np.multiply(self.day, a, out=acc)
+        np.subtract(ALPHA_MAX, a, out=t)
+        np.multiply(self.night, t, out=t)
+        np.add(acc, t, out=acc)
+        np.right_shift(acc, 5, out=acc)
+        np.bitwise_and(acc, SPREAD_MASK, out=acc)
+
+        # fold back: out = (acc | acc >> 16) & 0xffff
+        np.right_shift(acc, 16, out=t)
+        np.bitwise_or(acc, t, out=acc)
+        np.copyto(out, acc, casting="unsafe")
+        return out
+
+def rgb565_surface(size):
+    """ A 16-bit pygame Surface laid out as RGB565.
+    """
+    import pygame
+    return pygame.Surface(size, 0, 16, (0xF800, 0x07E0, 0x001F, 0))
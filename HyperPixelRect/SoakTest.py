@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# SoakTest.py — long-run stability of the display pipeline on a virtual clock
+#
+#   python3 SoakTest.py --target darkshadows --duration 3600 --virtual-days 365
+#   python3 SoakTest.py --target app --duration 600 --json soak.json    # exits 1 on growth
+#
+# Runs the real render loop headlessly on SDL's dummy driver with time
+# compressed: under NORMAL_OPS the map follows a virtual clock, so an hour
+# covers a year of sun positions and monthly imagery. RSS, threads, open fds
+# and frame time are sampled throughout, and growth between the start and the
+# end of the run beyond the thresholds fails it (RSS only once the bounded
+# image caches have filled). The app target also plays
+# mock Sonos zones through ZoneMonitor, soaking the subscription queue, the
+# art worker and the map/art mode switches.
+
+import os
+# must set this BEFORE importing pygame
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+
+import sys, time, json, argparse, tempfile, threading, queue, platform, subprocess, statistics
+from datetime import datetime, timezone, timedelta
+from types import SimpleNamespace
+from PIL import Image
+
+# -----------------------
+# Virtual time and process metrics
+# -----------------------
+class VirtualClock:
+    """ UTC time running speed times faster than the wall clock.
+    """
+    def __init__(self, start, speed):
+        self.start = start
+        self.speed = speed
+        self._t0 = time.monotonic()
+
+    def now(self):
+        return self.start + timedelta(seconds=(time.monotonic() - self._t0) * self.speed)
+
+def rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss      # peak, not current, off Linux
+
+def thread_count():
+    try:
+        return len(os.listdir("/proc/self/task"))      # native threads too (SDL, kernel pools)
+    except OSError:
+        return threading.active_count()
+
+def fd_count():
+    for path in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(path))
+        except OSError:
+            pass
+    return -1
+
+class Sampler:
+    """ Process metrics, plus whatever extra() returns, every interval seconds.
+    """
+    def __init__(self, interval, clock, extra=dict):
+        self.interval = interval
+        self.clock = clock
+        self.extra = extra
+        self.samples = []
+        self._t0 = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="soak-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def sample(self):
+        s = {"t": round(time.monotonic() - self._t0, 2), "virtual": self.clock.now().isoformat(),
+             "rss_kb": rss_kb(), "threads": thread_count(), "fds": fd_count()}
+        s.update(self.extra())
+        self.samples.append(s)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+# -----------------------
+# Targets
+# -----------------------
+def monthly_images(directory, day_path):
+    """ day_01.jpg .. day_12.jpg, tinted apart so the monthly blend has work to do.
+    """
+    day = Image.open(day_path).convert("RGB")
+    for month in range(1, 13):
+        tint = Image.new("RGB", day.size, (20 * month, 128, 255 - 20 * month))
+        Image.blend(day, tint, 0.15).save(os.path.join(directory, f"day_{month:02d}.jpg"), quality=90)
+    return os.path.join(directory, "day_{month:02d}.jpg")
+
+def soak_darkshadows(args, clock, state_dir):
+    """ DarkShadows.py as deployed: update_terminator thread, main loop and
+    persisted state, with monthly imagery on.
+    """
+    import DarkShadows as D         # restores its persisted frame from HOME, see main()
+    D.utc_now = clock.now
+    D.MONTHLY_DAY_IMAGES = True
+    D.MONTHLY_DAY_IMAGE_PATTERN = monthly_images(state_dir, D.DAY_IMAGE_PATH)
+
+    sampler = Sampler(args.sample_interval, clock, lambda: {
+        "frame_ms": round(1000 * D.frame_seconds, 2),
+        "cache_kb": D.monthly_imagery.cache.bytes // 1024 if D.monthly_imagery else 0})
+    threading.Timer(args.duration, lambda: setattr(D, "running", False)).start()
+    sampler.start()
+    try:
+        D.main()
+    except SystemExit:
+        pass
+    sampler.stop()
+    return sampler.samples
+
+class SoakZone:
+    """ A mock speaker (SonosBench.MockZone) whose subscriptions feed the
+    queue they are given, like soco's, and count how many are live.
+    """
+    def __init__(self, name, art, tracks, soap_latency):
+        from SonosBench import MockZone
+        self.zone = MockZone(art, tracks, soap_latency)
+        self.zone.player_name = name
+        self.zone.get_current_transport_info = lambda: {"current_transport_state": self.state}
+        self.zone.avTransport = SimpleNamespace(subscribe=self.subscribe)
+        self.state = "STOPPED"
+        self.live_subscriptions = 0
+        self._subs = 0
+
+    def subscribe(self, auto_renew=False, event_queue=None):
+        self.live_subscriptions += 1
+        self._subs += 1
+        def unsubscribe():
+            self.live_subscriptions -= 1
+        self.sub = SimpleNamespace(sid=f"uuid:soak-{self._subs}", unsubscribe=unsubscribe,
+                                   events=event_queue if event_queue is not None else queue.Queue())
+        return self.sub
+
+    def emit(self, track, state):
+        self.state = state
+        self.zone.position = track
+        meta = SimpleNamespace(album_art_uri=self.zone.art.url(track))
+        self.sub.events.put(SimpleNamespace(
+            sid=self.sub.sid, service=self.zone.avTransport, timestamp=time.monotonic(),
+            variables={"transport_state": state, "current_track_meta_data": meta}))
+
+def sonos_sessions(zone, args, stop):
+    """ Listening sessions: a few tracks, then the map for a while, forever.
+    """
+    track = 0
+    while not stop.is_set():
+        for _ in range(args.session_tracks):
+            track = (track + 1) % args.tracks
+            zone.emit(track, "PLAYING")
+            if stop.wait(args.track_seconds):
+                return
+        zone.emit(track, "STOPPED")
+        if stop.wait(args.idle_seconds):
+            return
+
+def soak_app(args, clock, state_dir):
+    """ HyperPixelApp.App with a mock zone: map rendering, album art fetches
+    and decodes, transitions and mode switches.
+    """
+    import HyperPixelApp as H
+    from SonosBench import ArtServer
+    from SonosZones import ZoneMonitor
+
+    art = ArtServer(args.art_size, args.art_latency_ms / 1000.0)
+    zone = SoakZone("Soak", art, args.tracks, soap_latency=0.005)
+    monitor = ZoneMonitor(["Soak"], zones={"Soak": zone.zone}, events=H.zone_events())
+    app = H.App(clock=clock.now, monitor=monitor)
+
+    stop = threading.Event()
+    sampler = Sampler(args.sample_interval, clock, lambda: {
+        "frame_ms": round(1000 * app.renderer.frame_seconds, 2), "mode": app.mode,
+        "cache_kb": app.art_cache.cache.bytes // 1024,
+        "events_queued": monitor.events.qsize(), "subscriptions": zone.live_subscriptions})
+    threading.Thread(target=sonos_sessions, args=(zone, args, stop), name="soak-sonos", daemon=True).start()
+    threading.Timer(args.duration, lambda: setattr(app, "running", False)).start()
+    sampler.start()
+    try:
+        app.run()
+    finally:
+        stop.set()
+        sampler.stop()
+        art.close()
+    return sampler.samples
+
+TARGETS = {"darkshadows": soak_darkshadows, "app": soak_app}
+
+# -----------------------
+# Evaluation
+# -----------------------
+def window_medians(samples, key, warmup, window):
+    """ Medians of the first and last window (fractions of the run) of a
+    metric, ignoring the warm-up fraction at the start.
+    """
+    values = [s[key] for s in samples if key in s]
+    values = values[int(len(values) * warmup):]
+    if not values:
+        return None, None
+    n = max(1, int(round(len(values) * window)))
+    return statistics.median(values[:n]), statistics.median(values[-n:])
+
+def caches_filled(samples, key="cache_kb"):
+    """ Samples from the first one at which the bounded image caches held
+    the most they did in the run: memory they take while filling isn't growth.
+    """
+    sizes = [s.get(key, 0) for s in samples]
+    return samples[sizes.index(max(sizes)):] if sizes else samples
+
+def evaluate(samples, args):
+    limits = [
+        ("rss_kb", "delta", args.max_rss_growth_mb * 1024),
+        ("threads", "delta", args.max_thread_growth),
+        ("fds", "delta", args.max_fd_growth),
+        ("frame_ms", "ratio", args.max_frame_drift),
+        ("events_queued", "delta", args.max_queue_growth),
+        ("subscriptions", "delta", 0),
+    ]
+    checks = []
+    for key, kind, limit in limits:
+        first, last = window_medians(caches_filled(samples) if key == "rss_kb" else samples,
+                                     key, args.warmup, args.window)
+        if first is None:
+            continue
+        if kind == "ratio":
+            growth = last / first if first else 1.0
+        else:
+            growth = last - first
+        checks.append({"metric": key, "kind": kind, "first": first, "last": last,
+                       "growth": round(growth, 3), "limit": limit, "ok": growth <= limit})
+    return checks
+
+def git_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak the display pipeline on a virtual clock")
+    parser.add_argument("--target", choices=sorted(TARGETS), default="darkshadows")
+    parser.add_argument("--duration", type=float, default=3600.0, help="real seconds to run")
+    parser.add_argument("--virtual-days", type=float, default=365.0, help="virtual time covered by the run")
+    parser.add_argument("--start", help="virtual start, ISO 8601 UTC (default now)")
+    parser.add_argument("--sample-interval", type=float, default=10.0, help="seconds between samples")
+    parser.add_argument("--warmup", type=float, default=0.1, help="fraction of samples ignored at the start")
+    parser.add_argument("--window", type=float, default=0.2, help="fraction of samples compared at each end")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=16.0)
+    parser.add_argument("--max-thread-growth", type=int, default=0)
+    parser.add_argument("--max-fd-growth", type=int, default=0)
+    parser.add_argument("--max-frame-drift", type=float, default=1.5, help="last/first frame time ratio")
+    parser.add_argument("--max-queue-growth", type=int, default=8, help="undrained Sonos events (app)")
+    parser.add_argument("--tracks", type=int, default=40, help="mock playlist length (app)")
+    parser.add_argument("--session-tracks", type=int, default=5, help="tracks per listening session (app)")
+    parser.add_argument("--track-seconds", type=float, default=4.0, help="real seconds per track (app)")
+    parser.add_argument("--idle-seconds", type=float, default=20.0, help="map time between sessions (app)")
+    parser.add_argument("--art-size", type=int, default=600)
+    parser.add_argument("--art-latency-ms", type=float, default=30.0)
+    parser.add_argument("--json", help="write the report here")
+    args = parser.parse_args()
+
+    start = datetime.fromisoformat(args.start) if args.start else datetime.now(timezone.utc)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    clock = VirtualClock(start, args.virtual_days * 86400.0 / args.duration)
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        # set before the targets are imported: the ~/.cache paths they persist
+        # frames and art under are computed at import and must not be the real ones
+        os.environ["HOME"] = state_dir
+        samples = TARGETS[args.target](args, clock, state_dir)
+
+    checks = evaluate(samples, args)
+    report = {
+        "target": args.target,
+        "version": git_version(),
+        "platform": {"machine": platform.machine(), "python": platform.python_version(),
+                     "pygame": pygame.version.ver, "cpus": os.cpu_count()},
+        "config": vars(args),
+        "speed": clock.speed,
+        "virtual_span": [samples[0]["virtual"], samples[-1]["virtual"]] if samples else None,
+        "checks": checks,
+        "ok": bool(samples) and all(c["ok"] for c in checks),
+        "samples": samples,
+    }
+
+    print(f"{args.target}: {len(samples)} samples at {clock.speed:.0f}x")
+    for c in checks:
+        print(f"  {c['metric']:>14}: {c['first']} -> {c['last']} ({c['kind']} {c['growth']}, "
+              f"limit {c['limit']}) {'ok' if c['ok'] else 'FAIL'}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if report["ok"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+# SonosArt.py
+# Album art helpers shared by the RectSonos scripts
+
+import os, json, time, hashlib, threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image
+from io import BytesIO
+import pygame
+
+from ImageCache import LRUCache
+
+ART_CACHE_MB = 32       # decoded, screen-sized surfaces (800x480x4 is ~1.5 MB each)
+ART_CACHE_DIR = os.path.expanduser("~/.cache/hyperpixel/art")
+ART_FRESH_SECONDS = 3600  # serve from disk without revalidating for this long
+ART_COALESCE_SECONDS = 0.15   # event bursts within this window become one fetch
+ART_READY = pygame.USEREVENT + 1
+
+class FetchCancelled(Exception):
+    """ Raised when a newer request supersedes an in-flight fetch.
+    """
+
+def art_url(zone, uri):
+    """ Sonos often returns a path relative to the speaker; make it absolute.
+    """
+    if not uri:
+        return None
+    if uri.startswith("http"):
+        return uri
+    return f"http://{zone.ip_address}:1400{uri}"
+
+def track_art_uri(zone, variables=None):
+    """ Album art URI for the current track, taken from the event metadata when
+    present so we don't have to ask the speaker again.
+    """
+    meta = (variables or {}).get("current_track_meta_data")
+    uri = getattr(meta, "album_art_uri", None)
+    if uri:
+        return art_url(zone, uri)
+    return art_url(zone, zone.get_current_track_info().get("album_art"))
+
+def decode_art(data, size):
+    """ Decode image bytes and scale to the panel, returning a pygame Surface.
+    """
+    img = Image.open(BytesIO(data)).convert("RGB")
+    if img.size != tuple(size):
+        img = img.resize(size, Image.LANCZOS)
+    surf = pygame.image.fromstring(img.tobytes(), img.size, img.mode)
+    return surf.convert() if pygame.display.get_surface() else surf
+
+def next_track_art_uri(zone, track_info=None):
+    """ Art URI of the next item in the queue, or None (radio, end of queue).
+    """
+    try:
+        info = track_info or zone.get_current_track_info()
+        position = int(info.get("playlist_position") or 0)   # 1-based
+        if position <= 0:
+            return None
+        items = zone.get_queue(start=position, max_items=1)  # 0-based, so this is the next one
+        if not items:
+            return None
+        return art_url(zone, getattr(items[0], "album_art_uri", None))
+    except Exception as e:
+        print(f"Error reading Sonos queue: {e}")
+        return None
+
+class ArtFetcher:
+    """ Album art over a pooled keep-alive session, persisted on disk by URI
+    and revalidated with ETag / Last-Modified.
+
+    Art that was fetched or revalidated within ART_FRESH_SECONDS is served
+    straight from disk, so prefetching the next track makes the change instant.
+    """
+    def __init__(self, cache_dir=ART_CACHE_DIR, timeout=5, pool_size=4,
+                 fresh_seconds=ART_FRESH_SECONDS, session=None):
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.fresh_seconds = fresh_seconds
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=1)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._validated = {}          # url -> time.monotonic() of last 200/304
+        self._inflight = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="art-prefetch")
+        self.stats = {"fresh": 0, "not_modified": 0, "downloaded": 0}
+
+    def _paths(self, url):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key + ".img"), os.path.join(self.cache_dir, key + ".json")
+
+    def _read_disk(self, url):
+        img_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(img_path, "rb") as f:
+                return f.read(), meta
+        except (OSError, ValueError):
+            return None, None
+
+    def _write_disk(self, url, data, resp):
+        img_path, meta_path = self._paths(url)
+        meta = {"url": url,
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified")}
+        # write-then-rename so a crash never leaves a torn image behind
+        for path, mode, payload in ((img_path, "wb", data), (meta_path, "w", json.dumps(meta))):
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, mode) as f:
+                f.write(payload)
+            os.replace(tmp, path)
+
+    def fetch(self, url, cancelled=None):
+        """ Return the image bytes for url, from disk when possible.
+        cancelled() is polled between chunks; FetchCancelled aborts the download.
+        """
+        data, meta = self._read_disk(url)
+        checked = self._validated.get(url)
+        if data is not None and checked is not None and time.monotonic() - checked < self.fresh_seconds:
+            self.stats["fresh"] += 1
+            return data
+
+        headers = {}
+        if data is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as resp:
+            if resp.status_code == 304 and data is not None:
+                self.stats["not_modified"] += 1
+            else:
+                resp.raise_for_status()
+                chunks = []
+                for chunk in resp.iter_content(chunk_size=16384):
+                    if cancelled is not None and cancelled():
+                        raise FetchCancelled(url)
+                    chunks.append(chunk)
+                data = b"".join(chunks)
+                self._write_disk(url, data, resp)
+                self.stats["downloaded"] += 1
+        self._validated[url] = time.monotonic()
+        return data
+
+    def prefetch(self, url, then=None):
+        """ Fetch url in the background; then(url, data) runs on success.
+        """
+        if not url:
+            return
+        with self._lock:
+            if url in self._inflight:
+                return
+            self._inflight.add(url)
+
+        def run():
+            try:
+                data = self.fetch(url)
+                if then is not None:
+                    then(url, data)
+            except Exception as e:
+                print(f"Error prefetching album art: {e}")
+            finally:
+                with self._lock:
+                    self._inflight.discard(url)
+        self._executor.submit(run)
+
+    def prefetch_next(self, zone, track_info=None, then=None):
+        """ Warm the cache with the next queue item's art as soon as a track starts.
+        """
+        self._executor.submit(lambda: self.prefetch(next_track_art_uri(zone, track_info), then))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+def zone_art(zone, art_cache, fetcher, cancelled=lambda: False):
+    """ Current track's art for zone as a cached surface; ArtWorker job body
+    shared by the multi-zone and single-app displays.
+    """
+    info = zone.get_current_track_info()
+    url = art_url(zone, info.get("album_art"))
+    if not url or cancelled():
+        return None
+    surface = art_cache.get(url)
+    if surface is None:
+        data = fetcher.fetch(url, cancelled=cancelled)
+        if cancelled():
+            raise FetchCancelled(url)
+        surface = art_cache.put(url, decode_art(data, art_cache.size))
+    fetcher.prefetch_next(zone, info, then=art_cache.warm)     # decoded ahead too, off the skip path
+    return surface
+
+class ArtWorker:
+    """ Background art loader with a single "latest request wins" slot.
+
+    submit() never blocks: it replaces whatever is waiting, and requests that
+    arrive within the coalesce window are folded into one. The job gets a
+    cancelled() callable and should give up as soon as it returns True; a
+    superseded result is dropped. Finished results are posted to the pygame
+    loop as an ART_READY event carrying .args and .surface.
+    """
+    def __init__(self, job, event_type=ART_READY, coalesce=ART_COALESCE_SECONDS):
+        self.job = job
+        self.event_type = event_type
+        self.coalesce = coalesce
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._pending = None          # (generation, args, submitted_at)
+        self._stopped = False
+        self.stats = {"submitted": 0, "completed": 0, "cancelled": 0}
+        self._thread = threading.Thread(target=self._run, name="art-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, *args):
+        with self._cond:
+            self._generation += 1
+            self._pending = (self._generation, args, time.monotonic())
+            self.stats["submitted"] += 1
+            self._cond.notify()
+
+    def is_current(self, generation):
+        """ False once a newer request has been submitted.
+        """
+        return generation == self._generation
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._generation += 1
+            self._cond.notify()
+
+    def _take(self):
+        """ Wait for a request and for the coalesce window to go quiet.
+        """
+        with self._cond:
+            while not self._stopped:
+                if self._pending is None:
+                    self._cond.wait()
+                    continue
+                generation, args, submitted = self._pending
+                quiet = submitted + self.coalesce - time.monotonic()
+                if quiet > 0:
+                    self._cond.wait(quiet)
+                    continue
+                self._pending = None
+                return generation, args
+        return None, None
+
+    def _run(self):
+        while True:
+            generation, args = self._take()
+            if generation is None:
+                return
+            cancelled = lambda: generation != self._generation
+            try:
+                surface = self.job(*args, cancelled=cancelled)
+            except FetchCancelled:
+                surface = None
+            except Exception as e:
+                print(f"Error loading album art: {e}")
+                surface = None
+            if cancelled():
+                self.stats["cancelled"] += 1
+                continue
+            self.stats["completed"] += 1
+            pygame.event.post(pygame.event.Event(self.event_type, args=args, surface=surface,
+                                                 generation=generation))
+
+_session = requests.Session()
+
+def download_art(url, timeout=5):
+    resp = _session.get(url, timeout=timeout)
+    resp.raise_for_status()
+    return resp.content
+
+class ArtCache:
+    """ LRU of ready-to-blit surfaces keyed by art URI, so a looping playlist
+    never fetches, decodes or scales the same cover twice.
+    """
+    def __init__(self, size, max_bytes=ART_CACHE_MB * 1024 * 1024, fetch=download_art):
+        self.size = tuple(size)
+        self.fetch = fetch
+        self.cache = LRUCache(max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url):
+        """ Cached surface for url, or None without fetching.
+        """
+        return self.cache.get(url)
+
+    def art(self, url):
+        """ Surface for url, fetching and decoding only on a cache miss.
+        Returns None if the art can't be fetched.
+        """
+        if not url:
+            return None
+        surf = self.cache.get(url)
+        if surf is not None:
+            self.hits += 1
+            return surf
+        self.misses += 1
+        try:
+            surf = decode_art(self.fetch(url), self.size)
+        except Exception as e:
+            print(f"Error fetching album art: {e}")
+            return None
+        return self.cache.put(url, surf)
+
+    def put(self, url, surf):
+        return self.cache.put(url, surf)
+
+    def warm(self, url, data):
+        """ Decode prefetched bytes into the cache (ArtFetcher.prefetch callback).
+        """
+        if self.cache.get(url) is None:
+            self.cache.put(url, decode_art(data, self.size))
+
+
+if __name__ == "__main__":
+    # Self-check against a local stand-in for the speaker's :1400 art server
+    import tempfile
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    body = BytesIO()
+    Image.new("RGB", (64, 64), (200, 30, 30)).save(body, "JPEG")
+    body = body.getvalue()
+    counts = {"200": 0, "304": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        def do_GET(self):
+            if self.headers.get("If-None-Match") == '"art-1"':
+                counts["304"] += 1
+                self.send_response(304)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            counts["200"] += 1
+            self.send_response(200)
+            self.send_header("ETag", '"art-1"')
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/getaa?s=1&u=track"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fetcher = ArtFetcher(cache_dir=tmp)
+        assert fetcher.fetch(url) == body           # full download
+        assert fetcher.fetch(url) == body           # fresh, no request
+        fetcher.fresh_seconds = 0
+        assert fetcher.fetch(url) == body           # conditional GET -> 304
+        assert ArtFetcher(cache_dir=tmp, fresh_seconds=0).fetch(url) == body   # disk survives restart
+        assert counts == {"200": 1, "304": 2}, counts
+        fetcher.close()
+    server.shutdown()
+    print(f"ok: {counts['200']} download(s), {counts['304']} revalidation(s), {fetcher.stats}")
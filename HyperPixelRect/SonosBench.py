@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# SonosBench.py — event-to-pixel latency of the Sonos art path against a local mock speaker
+#
+#   python3 SonosBench.py --bursts 20 --burst-size 4 --art-latency-ms 80
+#   python3 SonosBench.py --json bench.json --max-p95-ms 500    # exits 1 on regression
+#
+# The mock speaker is an HTTP art server (configurable latency and image size)
+# plus an event emitter that feeds soco-style avTransport events into the
+# subscription queue, the same way soco's event listener does. What is timed
+# is RectSonos4.py itself, run unchanged against the mock speaker: its display
+# loop, ArtWorker and zone_art path. The display runs headless on SDL's
+# dummy driver.
+
+import os
+# must set this BEFORE importing pygame
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+
+import sys, time, json, argparse, tempfile, threading, queue, runpy
+from contextlib import ExitStack
+from functools import partial
+from io import BytesIO
+from types import SimpleNamespace
+from unittest import mock
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from PIL import Image
+import requests
+
+import soco.discovery
+import SonosArt, Transitions
+from SonosArt import ArtWorker, decode_art
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "RectSonos4.py")
+
+# -----------------------
+# Mock speaker
+# -----------------------
+class ArtServer:
+    """ Stand-in for the speaker's :1400 /getaa endpoint.
+    """
+    def __init__(self, art_size, latency):
+        self.art_size = art_size
+        self.latency = latency
+        self.requests = 0
+        self._bodies = {}
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            def do_GET(self):
+                server.requests += 1
+                time.sleep(server.latency)
+                track = parse_qs(urlparse(self.path).query).get("u", ["0"])[0]
+                etag = f'"{track}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = server.body(int(track))
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.httpd.server_port
+        threading.Thread(target=self.httpd.serve_forever, name="mock-art", daemon=True).start()
+
+    def body(self, track):
+        with self._lock:
+            if track not in self._bodies:
+                img = Image.new("RGB", (self.art_size, self.art_size),
+                                ((track * 67) % 256, (track * 131) % 256, (track * 29) % 256))
+                out = BytesIO()
+                img.save(out, "JPEG", quality=90)
+                self._bodies[track] = out.getvalue()
+            return self._bodies[track]
+
+    def url(self, track):
+        return f"http://127.0.0.1:{self.port}/getaa?s=1&u={track}"
+
+    def close(self):
+        self.httpd.shutdown()
+
+class EventQueue(queue.Queue):
+    """ The subscription queue, noting when the display loop takes each
+    event off it: latency runs from the newest event the loop has seen.
+    """
+    def __init__(self):
+        super().__init__()
+        self.last_taken = None
+
+    def get(self, *args, **kwargs):
+        event = super().get(*args, **kwargs)
+        self.last_taken = event.timestamp
+        return event
+
+class MockZone:
+    """ Just enough of soco.SoCo for the art path: track info, queue and an
+    avTransport whose subscription is fed by emit().
+    """
+    def __init__(self, art, tracks, soap_latency):
+        self.player_name = "Bench"
+        self.ip_address = "127.0.0.1"
+        self.art = art
+        self.tracks = tracks
+        self.soap_latency = soap_latency
+        self.position = 0
+        self.sub = SimpleNamespace(sid="uuid:bench", events=EventQueue(), unsubscribe=lambda: None)
+        self.avTransport = SimpleNamespace(subscribe=lambda **kwargs: self.sub)
+
+    def get_current_transport_info(self):
+        time.sleep(self.soap_latency)
+        return {"current_transport_state": "PLAYING"}
+
+    def get_current_track_info(self):
+        time.sleep(self.soap_latency)
+        return {"album_art": self.art.url(self.position),
+                "playlist_position": str(self.position + 1)}
+
+    def get_queue(self, start=0, max_items=100):
+        time.sleep(self.soap_latency)
+        return [SimpleNamespace(album_art_uri=self.art.url(i % self.tracks))
+                for i in range(start, start + max_items)]
+
+    def emit(self, track):
+        """ A track change as soco would deliver it: LastChange variables on the queue.
+        """
+        self.position = track
+        meta = SimpleNamespace(album_art_uri=self.art.url(track))
+        self.sub.events.put(SimpleNamespace(
+            sid=self.sub.sid, service=self.avTransport, timestamp=time.monotonic(),
+            variables={"transport_state": "PLAYING", "current_track_meta_data": meta}))
+
+def emitter(zone, args, done):
+    """ Bursts of rapid skips through a looping playlist, with a pause after each.
+    """
+    track = 0
+    for _ in range(args.bursts):
+        for _ in range(args.burst_size):
+            track = (track + 1) % args.tracks
+            zone.emit(track)
+            time.sleep(args.skip_ms / 1000.0)
+        time.sleep(args.settle_ms / 1000.0)
+    done.set()
+
+# -----------------------
+# Benchmark
+# -----------------------
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+def uncached_art(zone, art_cache, fetcher, cancelled=lambda: False):
+    """ The original path, in place of zone_art: ask the speaker, download
+    on a new connection (no pooled session), decode and resize every time.
+    """
+    info = zone.get_current_track_info()
+    resp = requests.get(info["album_art"], timeout=5)
+    resp.raise_for_status()
+    return decode_art(resp.content, art_cache.size)
+
+def run(args, cached):
+    """ Run RectSonos4.py against a mock speaker until every burst has been
+    shown; event-to-flip latencies are taken at the first display flip of
+    each art transition.
+    """
+    art = ArtServer(args.art_size, args.art_latency_ms / 1000.0)
+    zone = MockZone(art, args.tracks, args.soap_ms / 1000.0)
+    events = zone.sub.events
+    size = tuple(int(v) for v in args.size.split("x"))
+    latencies = []
+    workers = []
+    started = []
+
+    class TimedTransition(Transitions.Transition):
+        def start(self, surface, kind=None):
+            if surface is not None:
+                started.append(True)
+            super().start(surface, kind)
+
+    set_mode, flip = pygame.display.set_mode, pygame.display.flip
+    def timed_flip():
+        flip()
+        if started and events.last_taken is not None:
+            latencies.append(time.monotonic() - events.last_taken)
+            events.last_taken = None
+        started.clear()
+
+    def make_worker(job, **kwargs):
+        worker = ArtWorker(job, coalesce=args.coalesce_ms / 1000.0)
+        workers.append(worker)
+        return worker
+
+    def stop_when_shown(done):
+        done.wait()
+        deadline = time.monotonic() + 120.0
+        while time.monotonic() < deadline and (events.last_taken is not None or not events.empty()):
+            time.sleep(0.01)
+        pygame.event.post(pygame.event.Event(pygame.QUIT))
+
+    done = threading.Event()
+    with tempfile.TemporaryDirectory() as cache_dir, ExitStack() as patches:
+        for target, name, value in (
+                (soco.discovery, "by_name", lambda name: zone),
+                (SonosArt, "ArtFetcher", partial(SonosArt.ArtFetcher, cache_dir=cache_dir)),
+                (SonosArt, "ArtWorker", make_worker),
+                (Transitions, "Transition", TimedTransition),
+                (pygame.display, "set_mode", lambda *a, **k: set_mode(size)),
+                (pygame.display, "flip", timed_flip)):
+            patches.enter_context(mock.patch.object(target, name, value))
+        if not cached:
+            patches.enter_context(mock.patch.object(SonosArt, "zone_art", uncached_art))
+        threading.Thread(target=emitter, args=(zone, args, done), daemon=True).start()
+        threading.Thread(target=stop_when_shown, args=(done,), daemon=True).start()
+        try:
+            runpy.run_path(SCRIPT, run_name="__main__")
+        except SystemExit:
+            pass            # the script exits once its loop ends
+    art.close()
+
+    ms = [1000.0 * v for v in latencies]
+    return {
+        "mode": "cached" if cached else "uncached",
+        "samples": len(ms),
+        "p50_ms": percentile(ms, 50),
+        "p90_ms": percentile(ms, 90),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+        "max_ms": max(ms) if ms else None,
+        "http_requests": art.requests,
+        "fetches": dict(workers[0].stats) if workers else {},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Sonos event-to-flip latency benchmark")
+    parser.add_argument("--tracks", type=int, default=8, help="playlist length (it loops)")
+    parser.add_argument("--bursts", type=int, default=20)
+    parser.add_argument("--burst-size", type=int, default=3, help="rapid skips per burst")
+    parser.add_argument("--skip-ms", type=float, default=40.0, help="gap between skips in a burst")
+    parser.add_argument("--settle-ms", type=float, default=600.0, help="pause after each burst")
+    parser.add_argument("--art-latency-ms", type=float, default=50.0)
+    parser.add_argument("--soap-ms", type=float, default=20.0, help="latency of speaker SOAP calls")
+    parser.add_argument("--art-size", type=int, default=600, help="square art edge in pixels")
+    parser.add_argument("--coalesce-ms", type=float, default=150.0)
+    parser.add_argument("--size", default="800x480", help="panel size")
+    parser.add_argument("--mode", choices=("both", "cached", "uncached"), default="both")
+    parser.add_argument("--json", help="write the report here")
+    parser.add_argument("--max-p95-ms", type=float, help="exit 1 if cached p95 exceeds this")
+    args = parser.parse_args()
+
+    modes = {"both": (False, True), "cached": (True,), "uncached": (False,)}[args.mode]
+    report = {"config": vars(args), "results": [run(args, cached) for cached in modes]}
+
+    for r in report["results"]:
+        print(f"{r['mode']:>9}: n={r['samples']} p50={r['p50_ms']:.1f}ms p90={r['p90_ms']:.1f}ms "
+              f"p99={r['p99_ms']:.1f}ms max={r['max_ms']:.1f}ms http={r['http_requests']}"
+              if r["samples"] else f"{r['mode']:>9}: no samples")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.max_p95_ms is not None:
+        gated = [r for r in report["results"] if r["mode"] == "cached"] or report["results"]
+        if any(r["p95_ms"] is None or r["p95_ms"] > args.max_p95_ms for r in gated):
+            print(f"FAIL: p95 above {args.max_p95_ms}ms")
+            sys.exit(1)
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# SonosZones.py
+# Watch several Sonos zones from one process and one soco event listener
+
+import time
+import queue
+from soco.discovery import by_name
+from soco.events import event_listener
+
+ZONE_POLICY_ACTIVE = "active"   # one panel that follows whichever zone started playing last
+ZONE_POLICY_TILES  = "tiles"    # one tile per zone on the same panel
+
+class ZoneMonitor:
+    """ Subscribes to avTransport on every zone through soco's shared
+    event_listener, with all subscriptions feeding one queue.
+
+    poll() returns (zone_name, variables) pairs in arrival order and keeps
+    track of each zone's transport state for the prioritization policy.
+    zones maps names to speakers already at hand, skipping discovery.
+    events replaces the queue, e.g. with an AsyncCore.AsyncQueueBridge; the
+    asyncio loop then awaits events and feeds each one to record().
+    """
+    def __init__(self, zone_names, zones=None, events=None):
+        self.events = events if events is not None else queue.Queue()
+        self.zones = {}
+        self.subs = []
+        self.states = {}
+        self.started = {}          # zone name -> monotonic time it last went to PLAYING
+        self._by_sid = {}
+        for name in zone_names:
+            zone = zones[name] if zones else by_name(name)
+            if zone is None:
+                raise RuntimeError(f"Sonos zone '{name}' not found")
+            self.zones[name] = zone
+            self.states[name] = zone.get_current_transport_info()["current_transport_state"]
+            self.started[name] = time.monotonic() if self.states[name] == "PLAYING" else 0.0
+            sub = zone.avTransport.subscribe(auto_renew=True, event_queue=self.events)
+            self.subs.append(sub)
+            self._by_sid[sub.sid] = name
+
+    def _zone_name(self, event):
+        name = self._by_sid.get(event.sid)
+        if name is None:
+            # renewals keep the sid, but fall back to the speaker behind the service
+            zone = getattr(event.service, "soco", None)
+            for key, value in self.zones.items():
+                if value is zone:
+                    return key
+        return name
+
+    def record(self, event):
+        """ Track one event's transport state; (zone_name, variables), or
+        None for an event from a zone we don't know.
+        """
+        name = self._zone_name(event)
+        if name is None:
+            return None
+        variables = event.variables
+        if "transport_state" in variables:
+            state = variables["transport_state"]
+            if state == "PLAYING" and self.states[name] != "PLAYING":
+                self.started[name] = time.monotonic()
+            self.states[name] = state
+        return name, variables
+
+    def poll(self, timeout=0.1):
+        """ Wait up to timeout for the first event, then drain the rest.
+        """
+        updates = []
+        try:
+            event = self.events.get(timeout=timeout)
+            while True:
+                update = self.record(event)
+                if update is not None:
+                    updates.append(update)
+                event = self.events.get_nowait()
+        except queue.Empty:
+            pass
+        return updates
+
+    def active_zone(self):
+        """ The playing zone that started most recently, or None.
+        """
+        playing = [name for name, state in self.states.items() if state == "PLAYING"]
+        if not playing:
+            return None
+        return max(playing, key=lambda name: self.started[name])
+
+    def unsubscribe(self):
+        """ Drop this monitor's subscriptions, leaving soco's shared event
+        listener running for another monitor.
+        """
+        for sub in self.subs:
+            try:
+                sub.unsubscribe()
+            except Exception:
+                pass
+        self.subs = []
+
+    def close(self):
+        self.unsubscribe()
+        event_listener.stop()
+
+def tile_rects(count, size):
+    """ Split the panel into a near-square grid of equal tiles.
+    """
+    w, h = size
+    cols = 1
+    while cols * cols < count:
+        cols += 1
+    rows = (count + cols - 1) // cols
+    if w < h:
+        cols, rows = rows, cols
+    tw, th = w // cols, h // rows
+    return [(i % cols * tw, i // cols * th, tw, th) for i in range(count)]
@@ -0,0 +1,163 @@
+# TapInfo.py
+# Tap a point on the map: local time, zone, sun elevation, next sunrise/sunset
+
+import math, time
+from functools import lru_cache
+from datetime import timezone
+import ephem
+import pygame
+
+from TimeScrub import SCRUB_SLOP_PX
+from TimeZoneIndex import TimeZoneIndex, xy_to_latlon
+
+TAP_MAX_SECONDS = 0.4           # longer presses aren't taps
+TAP_INFO_SECONDS = 8            # how long the card stays up
+CARD_BACKGROUND = (0, 0, 0, 190)
+CARD_PADDING = 6
+
+class TapDetector:
+    """ Press and release within SCRUB_SLOP_PX and TAP_MAX_SECONDS: a tap.
+    """
+    def __init__(self, slop=SCRUB_SLOP_PX, max_seconds=TAP_MAX_SECONDS):
+        self.slop = slop
+        self.max_seconds = max_seconds
+        self._down = None
+
+    def handle(self, ev):
+        """ Feed a pygame event; returns the tap position or None.
+        """
+        if ev.type == pygame.MOUSEBUTTONDOWN and ev.button == 1:
+            self._down = (ev.pos, time.monotonic())
+        elif ev.type == pygame.MOUSEMOTION and self._down is not None:
+            (x, y), _ = self._down
+            if abs(ev.pos[0] - x) > self.slop or abs(ev.pos[1] - y) > self.slop:
+                self._down = None
+        elif ev.type == pygame.MOUSEBUTTONUP and ev.button == 1 and self._down is not None:
+            pos, t = self._down
+            self._down = None
+            if time.monotonic() - t <= self.max_seconds:
+                return pos
+        return None
+
+@lru_cache(maxsize=256)
+def solar_info(lat, lon, minute_utc):
+    """ (elevation in degrees, next rising, next setting) for a point at a
+    whole UTC minute; rising/setting are UTC datetimes, or None when the sun
+    stays up (or down) all day. Cached, as a tap card redraws every frame.
+    """
+    obs = ephem.Observer()
+    obs.lat, obs.lon = math.radians(lat), math.radians(lon)
+    obs.date = minute_utc
+    obs.pressure = 0
+    obs.horizon = "-0:34"           # refraction at the horizon, as almanacs use
+    sun = ephem.Sun(obs)
+    elevation = math.degrees(sun.alt)
+    events = []
+    for fn in (obs.next_rising, obs.next_setting):
+        try:
+            events.append(fn(ephem.Sun()).datetime().replace(tzinfo=timezone.utc))
+        except (ephem.AlwaysUpError, ephem.NeverUpError):
+            events.append(None)
+    return elevation, events[0], events[1]
+
+class InfoCard:
+    """ The card for one tapped point, redrawn only when the minute changes.
+    """
+    def __init__(self, atlas, tz_index, lat, lon, pos, bounds):
+        self.atlas = atlas
+        self.tz_index = tz_index
+        self.lat, self.lon = lat, lon
+        self.pos = pos
+        self.bounds = bounds            # the card stays inside this screen rect
+        self.expires = time.monotonic() + TAP_INFO_SECONDS
+        self.name, self.tz = tz_index.lookup(lat, lon)
+        self.surface = None
+        self._minute = None
+
+    def lines(self, dt_utc):
+        minute = dt_utc.replace(second=0, microsecond=0)
+        elevation, rising, setting = solar_info(round(self.lat, 2), round(self.lon, 2), minute)
+        local = dt_utc.astimezone(self.tz)
+        lines = [self.name, local.strftime("%H:%M %Z"), f"Sun {elevation:+.1f}°"]
+        if rising is None and setting is None:
+            lines.append("Sun up all day" if elevation > 0 else "Sun down all day")
+        else:
+            upcoming = sorted((t, label) for t, label in ((rising, "Sunrise"), (setting, "Sunset")) if t)
+            for t, label in upcoming:
+                lines.append(f"{label} {t.astimezone(self.tz):%H:%M}")
+        return lines
+
+    def render(self, dt_utc):
+        minute = dt_utc.replace(second=0, microsecond=0)
+        if minute == self._minute and self.surface is not None:
+            return self.surface
+        self._minute = minute
+        texts = [self.atlas.render(line) for line in self.lines(dt_utc)]
+        w = max(t.get_width() for t in texts) + 2 * CARD_PADDING
+        h = sum(t.get_height() for t in texts) + 2 * CARD_PADDING
+        card = pygame.Surface((w, h), pygame.SRCALPHA)
+        card.fill(CARD_BACKGROUND)
+        y = CARD_PADDING
+        for t in texts:
+            card.blit(t, (CARD_PADDING, y))
+            y += t.get_height()
+        self.surface = card
+        return card
+
+    def draw(self, screen, dt_utc):
+        """ Draw next to the tapped point; False once the card has expired.
+        """
+        if time.monotonic() > self.expires:
+            return False
+        card = self.render(dt_utc)
+        x, y = self.pos
+        rect = card.get_rect(topleft=(x + 10, y + 10))
+        if rect.right > self.bounds.right:
+            rect.right = x - 10
+        if rect.bottom > self.bounds.bottom:
+            rect.bottom = y - 10
+        rect.clamp_ip(self.bounds)
+        pygame.draw.circle(screen, (255, 255, 255), (x, y), 3, 1)
+        screen.blit(card, rect)
+        return True
+
+class TapInfo:
+    """ Turns taps on the map into InfoCards. map_rect is where the map sits
+    on screen; the zone index can be at any resolution, and is opened on
+    the first tap (so a missing one is only reported when it's needed).
+    """
+    def __init__(self, tz_index_path, map_rect, atlas=None):
+        self.map_rect = pygame.Rect(map_rect)
+        self.tz_index_path = tz_index_path
+        self.detector = TapDetector()
+        self._atlas = atlas
+        self._tz_index = None
+        self.card = None
+
+    @property
+    def tz_index(self):
+        if self._tz_index is None:
+            self._tz_index = TimeZoneIndex(self.tz_index_path, self.map_rect.size)
+        return self._tz_index
+
+    @property
+    def atlas(self):
+        if self._atlas is None:
+            from CityLabels import GlyphAtlas
+            chars = "".join(chr(c) for c in range(32, 127)) + "°"
+            self._atlas = GlyphAtlas(chars)
+        return self._atlas
+
+    def handle(self, ev):
+        """ Feed a pygame event; True if a tap opened a card.
+        """
+        pos = self.detector.handle(ev)
+        if pos is None or not self.map_rect.collidepoint(pos):
+            return False
+        lat, lon = xy_to_latlon(pos[0] - self.map_rect.x, pos[1] - self.map_rect.y, *self.map_rect.size)
+        self.card = InfoCard(self.atlas, self.tz_index, lat, lon, pos, self.map_rect)
+        return True
+
+    def draw(self, screen, dt_utc):
+        if self.card is not None and not self.card.draw(screen, dt_utc):
+            self.card = None
@@ -0,0 +1,307 @@
+# Terminator.py
+# Day/night terminator rendering shared by DarkShadows.py and HyperPixelApp.py
+
+import math, time, threading
+from datetime import datetime, timezone
+from PIL import Image, ImageFilter, ImageDraw
+import numpy as np
+import ephem
+import pygame
+
+PREVIEW_SCALE = 4               # preview renders at 1/PREVIEW_SCALE of full resolution
+
+class RenderCancelled(Exception):
+    """ A newer request made this render pointless.
+    """
+
+def subsolar_point(dt_utc):
+    """Compute the subsolar point (lat, lon) in degrees at a given UTC datetime using PyEphem."""
+    obs = ephem.Observer()
+    obs.date = dt_utc
+    obs.lon = '0'   # Greenwich
+    obs.lat = '0'   # Equator
+    sun = ephem.Sun(obs)
+
+    # Latitude of subsolar point is just the Sun's declination
+    lat_deg = math.degrees(sun.dec)
+
+    # Subsolar longitude = RA - GMST
+    ra_deg = math.degrees(sun.ra)
+    gmst_deg = math.degrees(obs.sidereal_time())
+    lon_deg = (ra_deg - gmst_deg + 540.0) % 360.0 - 180.0
+    return lat_deg, lon_deg
+
+def sublunar_point(dt_utc: datetime):
+    """Return (lat_deg, lon_deg) of the sublunar point at UTC datetime dt_utc.
+    Uses PyEphem for the Moon's apparent geocentric RA/Dec.
+    """
+    obs = ephem.Observer()
+    obs.date = dt_utc
+    obs.lon = '0'   # Greenwich reference
+    obs.lat = '0'   # Equator
+    moon = ephem.Moon(obs)
+
+    # Latitude of sublunar point is Moon's declination
+    lat_deg = math.degrees(moon.dec)
+
+    # Sub-lunar longitude = RA - GMST
+    ra_deg = math.degrees(moon.ra)
+    gmst_deg = math.degrees(obs.sidereal_time())
+    lon_deg = (ra_deg - gmst_deg + 540.0) % 360.0 - 180.0
+    return lat_deg, lon_deg
+
+def sun_position(dt_utc):
+    """ (declination, subsolar longitude) in radians, as used by the mask.
+    """
+    obs = ephem.Observer()
+    obs.date = dt_utc
+    sun = ephem.Sun(obs)
+    decl_rad = float(sun.dec)
+    ra_rad = float(sun.ra)
+
+    # GMST
+    jd = ephem.julian_date(dt_utc)
+    gmst_deg = (280.46061837 + 360.98564736629 * (jd - 2451545.0)) % 360
+    gmst_rad = math.radians(gmst_deg)
+
+    return decl_rad, ra_rad - gmst_rad
+
+def terminator_mask(size, dt_utc, twilight_blur):
+    """ Day/night mask for a (w, h) equirectangular map as a (h, w) uint8
+    array: 255 = day, 0 = night, with twilight smoothing.
+    """
+    w, h = size
+
+    # Create arrays for lat/lon per pixel
+    x = np.linspace(-180, 180, w)
+    y = np.linspace(90, -90, h)  # top=+90°, bottom=-90°
+    lon_grid, lat_grid = np.meshgrid(x, y)
+
+    # Compute cosine of solar zenith angle using ephem subsolar point
+    decl_rad, subsolar_lon_rad = sun_position(dt_utc)
+
+    lat_rad = np.radians(lat_grid)
+    lon_rad = np.radians(lon_grid)
+    H = lon_rad - subsolar_lon_rad
+    cos_zenith = np.sin(lat_rad) * math.sin(decl_rad) + np.cos(lat_rad) * np.cos(decl_rad) * np.cos(H)
+
+    # Map cos_zenith to 0..255 with twilight smoothing
+    # Linear ramp from -0.02..+0.02
+    mask_array = np.clip((cos_zenith + 0.02) / 0.04, 0.0, 1.0) * 255
+    mask_array = mask_array.astype(np.uint8)
+
+    # Apply Gaussian blur for twilight transition
+    if twilight_blur > 0:
+        mask_img = Image.fromarray(mask_array)
+        mask_img = mask_img.filter(ImageFilter.GaussianBlur(radius=twilight_blur))
+        mask_array = np.asarray(mask_img)
+    return mask_array
+
+def generate_terminator_pil(day_img: Image.Image,
+                            night_img: Image.Image,
+                            dt_utc,
+                            twilight_blur,
+                            cancelled=None,
+                            linear=False):
+    """
+    Vectorized generation of day/night terminator for 400x800 images.
+    Returns a PIL.Image with blended day/night and twilight smoothing.
+    linear=True blends in linear light (LinearLight.py) rather than on the
+    sRGB-encoded bytes.
+    """
+    mask = terminator_mask(day_img.size, dt_utc, twilight_blur)
+    if cancelled is not None and cancelled():
+        raise RenderCancelled()
+
+    # Blend day/night images
+    day_arr = np.array(day_img, dtype=np.uint8)
+    night_arr = np.array(night_img, dtype=np.uint8)
+    mask_arr = mask.astype(np.float32) / 255.0  # normalize 0..1
+
+    if linear:
+        from LinearLight import linearize, encode
+        day_lin = linearize(day_arr).astype(np.int32)
+        night_lin = linearize(night_arr).astype(np.int32)
+        blended = (night_lin + (day_lin - night_lin) * mask_arr[..., None]).astype(np.int32)
+        return Image.fromarray(encode(blended))
+
+    blended_arr = (day_arr * mask_arr[..., None] + night_arr * (1 - mask_arr[..., None])).astype(np.uint8)
+    blended_img = Image.fromarray(blended_arr)
+    return blended_img
+
+def pil_to_pygame_surface(pil_img):
+    """ Utility: center PIL image on pygame screen
+    """
+    return pygame.image.fromstring(pil_img.tobytes(), pil_img.size, pil_img.mode)
+
+def draw_markers_on_pil(pil_img, lat, lon, color):
+    """ Draw a cross on a PIL image.
+    """
+    draw = ImageDraw.Draw(pil_img)
+    w, h = pil_img.size
+
+    x = int((lon + 180.0) / 360.0 * w)
+    y = int((90.0 - lat) / 180.0 * h)
+    size = 6
+    draw.line((x - size, y, x + size, y), fill=color, width=2)
+    draw.line((x, y - size, x, y + size), fill=color, width=2)
+    return
+
+def draw_city_crosses_on_pil(pil_img, cities):
+    """ Draw a red cross over our landmarks  on a PIL image.
+    """
+    for name, (lat, lon) in cities.items():
+        draw_markers_on_pil(pil_img, lat, lon, color=(255, 0, 0))
+    return
+
+def draw_subsolar_point_on_pil(pil_img, dt_utc, color=(255, 255, 0)):
+    """ Draw a yellow cross where the sun is directly overhead (subsolar point) on a PIL image.
+    """
+    lat, lon = subsolar_point(dt_utc)
+    draw_markers_on_pil(pil_img, lat, lon, color=(255, 255, 0))
+    return
+
+def draw_sublunar_point_on_pil(pil_img, dt_utc, color=(0, 255, 255)):
+    """Draw a cyan cross where the moon is directly overhead (sublunar point) on a PIL image.
+    """
+    lat, lon = sublunar_point(dt_utc)
+    draw_markers_on_pil(pil_img, lat, lon, color=(0, 255, 255))
+    return
+
+def latlon_to_xy(lat, lon, w, h):
+    x = int((lon + 180.0) / 360.0 * w)
+    y = int((90.0 - lat) / 180.0 * h)
+    return x, y
+
+def draw_markers_on_surface(surface, lat, lon, color):
+    """ Draw a cross on a pygame Surface (any pixel format, including RGB565).
+    """
+    w, h = surface.get_size()
+    x, y = latlon_to_xy(lat, lon, w, h)
+    size = 6
+    pygame.draw.line(surface, color, (x - size, y), (x + size, y), 2)
+    pygame.draw.line(surface, color, (x, y - size), (x, y + size), 2)
+
+def render_preview(small_day, small_night, dt_utc, out_size):
+    """ Cheap low-resolution frame for interactive use: the mask at preview
+    size with no blur (upscaling smooths the edge), scaled up to out_size.
+    """
+    mask = terminator_mask(small_day.size, dt_utc, twilight_blur=0)
+    blended = Image.composite(small_day, small_night, Image.fromarray(mask))
+    surf = pygame.transform.smoothscale(pil_to_pygame_surface(blended), out_size)
+    draw_markers_on_surface(surf, *subsolar_point(dt_utc), (255, 255, 0))
+    return surf
+
+def preview_assets(day_img, night_img, scale=PREVIEW_SCALE):
+    size = (day_img.size[0] // scale, day_img.size[1] // scale)
+    return day_img.resize(size, Image.BILINEAR), night_img.resize(size, Image.BILINEAR)
+
+def render_map(day_img, night_img, dt_utc, cities, twilight_blur, cancelled=None):
+    """ Full map frame: blended terminator plus city, subsolar and sublunar crosses.
+    """
+    pil_for_map = generate_terminator_pil(day_img, night_img, dt_utc, twilight_blur=twilight_blur,
+                                          cancelled=cancelled)
+    # draw crosses on a copy so the base day/night remains pristine
+    draw_city_crosses_on_pil(pil_for_map, cities)
+    draw_subsolar_point_on_pil(pil_for_map, dt_utc)
+    draw_sublunar_point_on_pil(pil_for_map, dt_utc)
+    return pil_for_map
+
+class TerminatorRenderer:
+    """ Renders the map on a background thread at an adjustable rate.
+
+    The latest frame and a version counter are published under a lock; the
+    display loop blits it, holding that lock, when the version changes.
+    Frames are drawn into a FrameArena, so the loop allocates nothing per
+    frame. Lowering the rate keeps a recent frame ready while something
+    else owns the panel.
+    """
+    def __init__(self, day_img, night_img, cities, fps, twilight_blur, day_source=None, clock=None,
+                 kernels=None, linear=False):
+        self.day_img = day_img
+        self.night_img = night_img
+        self.cities = cities
+        self.fps = fps
+        self.twilight_blur = twilight_blur
+        self.day_source = day_source        # e.g. MonthlyDayImagery.day_image
+        from FrameArena import FrameArena
+        from Kernels import select_kernels
+        self.arena = FrameArena(day_img.size, twilight_blur, linear=linear)
+        self.arena.set_images(day_img, night_img)
+        self.arena.kernels = kernels or select_kernels(self.arena)     # None: fastest for this CPU
+        self.clock = clock or (lambda: datetime.now(timezone.utc))
+        self.surface = None
+        self.version = 0
+        self.last_dt = None
+        self.frame_seconds = 0.0
+        self.lock = threading.Lock()
+        self._new_images = None
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="terminator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+
+    def set_fps(self, fps):
+        """ Change the render rate; raising it renders a fresh frame right away.
+        """
+        faster = fps > self.fps
+        self.fps = fps
+        if faster:
+            self._wake.set()
+
+    def set_twilight_blur(self, twilight_blur):
+        """ Change the blur radius; the render thread picks it up before its next frame.
+        """
+        self.twilight_blur = twilight_blur
+
+    def set_images(self, day_img, night_img):
+        """ New imagery of the same size; the render thread loads it into the
+        arena before its next frame.
+        """
+        if day_img.size != self.arena.size or night_img.size != self.arena.size:
+            raise ValueError(f"imagery must be {self.arena.size[0]}x{self.arena.size[1]}")
+        with self.lock:
+            self._new_images = (day_img, night_img)
+
+    def latest(self):
+        """ (surface, version); the surface is a reused buffer, so blit it
+        while holding self.lock.
+        """
+        with self.lock:
+            return self.surface, self.version
+
+    def render_once(self, now=None):
+        now = now or self.clock()
+        t0 = time.perf_counter()
+        if self.arena.twilight_blur != self.twilight_blur:
+            self.arena.set_twilight_blur(self.twilight_blur)
+        with self.lock:
+            images, self._new_images = self._new_images, None
+        if images is not None:
+            self.day_img, self.night_img = images
+            self.arena.set_images(*images)
+        if self.day_source:
+            self.arena.set_images(self.day_source(now))
+        surf = self.arena.render(now, self.cities)
+        with self.lock:
+            self.surface = surf
+            self.arena.swap()
+            self.version += 1
+            self.last_dt = now
+        self.frame_seconds = time.perf_counter() - t0
+        return surf
+
+    def _run(self):
+        while self._running:
+            self.render_once()
+            self._wake.wait(1.0 / self.fps)
+            self._wake.clear()
@@ -0,0 +1,85 @@
+# TimeScrub.py
+# Drag on the touch panel to move the map through time
+
+import time, threading
+from datetime import timedelta
+import pygame
+
+SCRUB_HOURS_PER_SCREEN = 24     # a full-width drag moves this many hours
+SCRUB_SETTLE_SECONDS = 0.15     # input quiet this long -> render at full resolution
+SCRUB_RESUME_SECONDS = 30       # untouched this long -> snap back to live time
+SCRUB_SLOP_PX = 6               # finger jitter under this isn't a drag (so taps don't scrub)
+
+class TimeScrub:
+    """ Turns touch/mouse drags into a time offset.
+
+    Every change bumps generation; renders tagged with an older generation
+    are stale and get dropped, which is how in-flight full-resolution renders
+    are cancelled once the finger moves again.
+    """
+    def __init__(self, screen_w, hours_per_screen=SCRUB_HOURS_PER_SCREEN,
+                 settle=SCRUB_SETTLE_SECONDS, resume=SCRUB_RESUME_SECONDS, slop=SCRUB_SLOP_PX):
+        self.seconds_per_px = hours_per_screen * 3600.0 / screen_w
+        self.settle = settle
+        self.resume = resume
+        self.slop = slop
+        self.offset = timedelta(0)
+        self.generation = 0
+        self.dragging = False
+        self.last_input = 0.0
+        self._anchor_x = 0
+        self._moved = False
+        self._anchor_offset = self.offset
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        """ True while the offset is non-zero or input is recent.
+        """
+        return self.dragging or self.offset != timedelta(0)
+
+    def settled(self):
+        return not self.dragging and time.monotonic() - self.last_input >= self.settle
+
+    def handle(self, ev):
+        """ Feed a pygame event; returns True if the offset changed.
+        """
+        if ev.type == pygame.MOUSEBUTTONDOWN and ev.button == 1:
+            self.dragging = True
+            self._anchor_x = ev.pos[0]
+            self._moved = False
+            self._anchor_offset = self.offset
+            self.last_input = time.monotonic()
+        elif ev.type == pygame.MOUSEMOTION and self.dragging:
+            if not self._moved and abs(ev.pos[0] - self._anchor_x) <= self.slop:
+                return False
+            self._moved = True
+            # drag right to go back in time, like pulling the map eastwards
+            seconds = (self._anchor_x - ev.pos[0]) * self.seconds_per_px
+            return self._set(self._anchor_offset + timedelta(seconds=seconds))
+        elif ev.type == pygame.MOUSEBUTTONUP and ev.button == 1 and self.dragging:
+            self.dragging = False
+            self.last_input = time.monotonic()
+            if not self._moved:
+                return False             # a tap: the offset never changed
+            with self._lock:
+                self.generation += 1     # ask for the full-resolution render
+            return True
+        return False
+
+    def tick(self):
+        """ Snap back to live time after a long idle; True if that happened.
+        """
+        if (not self.dragging and self.offset != timedelta(0)
+                and time.monotonic() - self.last_input >= self.resume):
+            return self._set(timedelta(0))
+        return False
+
+    def _set(self, offset):
+        self.last_input = time.monotonic()
+        if offset == self.offset:
+            return False
+        with self._lock:
+            self.offset = offset
+            self.generation += 1
+        return True
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# TimeZoneIndex.py — time zones as a memory-mapped uint16 raster at map resolution
+#
+#   python3 TimeZoneIndex.py build combined.json --size 800x400 --out tz_index
+#   python3 TimeZoneIndex.py query tz_index 59.33 18.07
+#
+# The build step rasterizes a time-zone boundary GeoJSON (FeatureCollection
+# with a "tzid" property, e.g. timezone-boundary-builder's combined.json)
+# into tz_index.u16, one zone number per map pixel (0 = no zone: open sea),
+# and tz_index.json with the zone names. At runtime the raster is mmapped,
+# so a lookup is one pixel read and the file costs page cache, not heap.
+
+import os, json, argparse
+from datetime import datetime, timezone, timedelta
+import numpy as np
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+
+TZ_BAND_ALPHA = 40              # shading of every other UTC-offset band
+
+def xy_to_latlon(x, y, w, h):
+    """ Inverse of Terminator.latlon_to_xy, at the pixel centre.
+    """
+    return 90.0 - (y + 0.5) / h * 180.0, (x + 0.5) / w * 360.0 - 180.0
+
+def nautical_zone(lon):
+    """ Etc/GMT zone for a point at sea (note the POSIX sign: Etc/GMT-1 is UTC+1).
+    """
+    hours = int(round(lon / 15.0))
+    return "Etc/GMT" if hours == 0 else f"Etc/GMT{-hours:+d}"
+
+# -----------------------
+# Build step
+# -----------------------
+def _rings(geometry):
+    """ [(outer ring, [hole rings])] for a Polygon or MultiPolygon.
+    """
+    if geometry["type"] == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif geometry["type"] == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        return []
+    return [(rings[0], rings[1:]) for rings in polygons if rings]
+
+def build_index(geojson_path, size, out_base):
+    """ Rasterize zones into out_base.u16 / out_base.json. Each feature is
+    drawn through its own mask, so holes punch through only that zone and
+    enclaves drawn before it survive.
+    """
+    from PIL import Image, ImageDraw
+    w, h = size
+    with open(geojson_path) as f:
+        features = json.load(f)["features"]
+    if len(features) >= 65535:
+        raise ValueError("too many zones for a uint16 index")
+
+    def xy(ring):
+        return [((lon + 180.0) / 360.0 * w, (90.0 - lat) / 180.0 * h) for lon, lat in ring]
+
+    index = Image.new("I", size, 0)
+    names = []
+    for feature in features:
+        tzid = (feature.get("properties") or {}).get("tzid")
+        polygons = _rings(feature.get("geometry") or {"type": None})
+        if not tzid or not polygons:
+            continue
+        mask = Image.new("1", size, 0)
+        draw = ImageDraw.Draw(mask)
+        for outer, holes in polygons:
+            if len(outer) >= 3:
+                draw.polygon(xy(outer), fill=1)
+            for hole in holes:
+                if len(hole) >= 3:
+                    draw.polygon(xy(hole), fill=0)
+        names.append(tzid)
+        index.paste(len(names), mask=mask)
+
+    raster = np.asarray(index, dtype=np.int64).astype("<u2")
+    with open(out_base + ".u16.tmp", "wb") as f:
+        f.write(raster.tobytes())
+    with open(out_base + ".json.tmp", "w") as f:
+        json.dump({"size": [w, h], "zones": names}, f)
+    os.replace(out_base + ".u16.tmp", out_base + ".u16")
+    os.replace(out_base + ".json.tmp", out_base + ".json")
+    return names
+
+# -----------------------
+# Runtime
+# -----------------------
+class TimeZoneIndex:
+    """ Zone lookups by map pixel from the memory-mapped raster. Without
+    the index files every point gets its nautical zone, so taps still work.
+    """
+    def __init__(self, base, size=None):
+        self.raster = None
+        self.names = [None]
+        try:
+            with open(base + ".json") as f:
+                meta = json.load(f)
+            w, h = meta["size"]
+            self.raster = np.memmap(base + ".u16", dtype="<u2", mode="r", shape=(h, w))
+            self.names += meta["zones"]
+            self.size = (w, h)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"No time zone index at {base} ({e}); using nautical zones")
+            self.size = size or (360, 180)
+        self._zones = {}
+
+    def zone_name(self, x, y):
+        """ IANA name for map pixel (x, y) in self.size coordinates.
+        """
+        w, h = self.size
+        x, y = min(max(int(x), 0), w - 1), min(max(int(y), 0), h - 1)
+        n = int(self.raster[y, x]) if self.raster is not None else 0
+        return self.names[n] if n else nautical_zone(xy_to_latlon(x, y, w, h)[1])
+
+    def zone(self, name):
+        """ tzinfo for a name, cached; a fixed offset if zoneinfo can't load it.
+        """
+        tz = self._zones.get(name)
+        if tz is None:
+            if ZoneInfo is not None:
+                try:
+                    tz = ZoneInfo(name)
+                except Exception:
+                    pass
+            if tz is None:
+                hours = -int(name[7:] or 0) if name.startswith("Etc/GMT") else 0
+                tz = timezone(timedelta(hours=hours))
+            self._zones[name] = tz
+        return tz
+
+    def lookup(self, lat, lon):
+        """ (zone name, tzinfo) for a point.
+        """
+        w, h = self.size
+        name = self.zone_name((lon + 180.0) / 360.0 * w, (90.0 - lat) / 180.0 * h)
+        return name, self.zone(name)
+
+    def offsets(self, dt_utc):
+        """ UTC offset in minutes for every zone number at dt_utc (0: none).
+        """
+        out = np.zeros(len(self.names), dtype=np.int32)
+        for n, name in enumerate(self.names[1:], 1):
+            offset = dt_utc.astimezone(self.zone(name)).utcoffset()
+            out[n] = int(offset.total_seconds() // 60) if offset is not None else 0
+        return out
+
+class TimeZoneBands:
+    """ FrameArena overlay shading every other UTC-offset band, straight
+    from the index: a per-zone lookup table applied with np.take. Rebuilt
+    hourly, which catches DST changes.
+    """
+    def __init__(self, tz_index, size, alpha=TZ_BAND_ALPHA):
+        import pygame
+        self.tz_index = tz_index
+        self.size = size
+        self.alpha = alpha
+        self.layer = pygame.Surface(size, pygame.SRCALPHA)
+        self._hour = None
+        w, h = size
+        iw, ih = tz_index.size
+        # index pixel for every map pixel (the same raster when sizes match)
+        self._rows = (np.arange(h) * ih // h)[:, None]
+        self._cols = (np.arange(w) * iw // w)[None, :]
+        self._sea = None
+
+    def update(self, dt_utc):
+        import pygame
+        hour = dt_utc.replace(minute=0, second=0, microsecond=0)
+        if hour == self._hour or self.tz_index.raster is None:
+            return False
+        self._hour = hour
+        offsets = self.tz_index.offsets(dt_utc)
+        shade = np.where((offsets // 60) % 2 == 1, self.alpha, 0).astype(np.uint8)
+        zones = self.tz_index.raster[self._rows, self._cols]
+        if self._sea is None:
+            w = self.size[0]
+            lon = (np.arange(w) + 0.5) / w * 360.0 - 180.0
+            self._sea = np.where(np.round(lon / 15.0).astype(int) % 2 == 1, self.alpha, 0).astype(np.uint8)
+        alpha = np.where(zones == 0, self._sea[None, :], np.take(shade, zones))
+        self.layer.fill((0, 0, 0, 0))
+        pixels = pygame.surfarray.pixels_alpha(self.layer)
+        pixels[...] = alpha.T
+        del pixels
+        return True
+
+    def draw(self, surface, dt_utc):
+        """ FrameArena overlay hook.
+        """
+        self.update(dt_utc)
+        surface.blit(self.layer, (0, 0))
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the time zone index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="rasterize a time zone GeoJSON")
+    b.add_argument("geojson")
+    b.add_argument("--size", default="800x400", help="map resolution")
+    b.add_argument("--out", default="tz_index", help="output base name (.u16 and .json are added)")
+    q = sub.add_parser("query")
+    q.add_argument("index")
+    q.add_argument("lat", type=float)
+    q.add_argument("lon", type=float)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        size = tuple(int(v) for v in args.size.split("x"))
+        names = build_index(args.geojson, size, args.out)
+        print(f"{len(names)} zones -> {args.out}.u16 ({size[0]}x{size[1]})")
+    else:
+        name, tz = TimeZoneIndex(args.index).lookup(args.lat, args.lon)
+        print(name, datetime.now(timezone.utc).astimezone(tz).strftime("%Y-%m-%d %H:%M %Z"))
+
+if __name__ == "__main__":
+    main()
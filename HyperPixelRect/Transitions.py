@@ -0,0 +1,118 @@
+# Transitions.py
+# Crossfade / wipe / slide between two surfaces, written in place into the display
+
+import time
+from collections import deque
+import numpy as np
+import pygame
+
+TRANSITION_SECONDS = 0.4
+TRANSITION_FPS = 60
+
+CROSSFADE = "crossfade"
+WIPE = "wipe"
+SLIDE = "slide"
+
+class Transition:
+    """ Plays a transition from whatever is on the target surface to a new
+    surface, one step per display frame.
+
+    Every buffer is allocated once per target size, and each crossfade step is
+    integer math into those buffers followed by a single copy into the target's
+    pixels, so a transition creates no per-frame images. Wipes and slides are
+    plain clipped blits, which SDL already does in place.
+    """
+    def __init__(self, target, duration=TRANSITION_SECONDS, kind=CROSSFADE):
+        self.target = target
+        self.duration = duration
+        self.kind = kind
+        w, h = target.get_size()
+        self._src = np.empty((w, h, 3), dtype=np.int16)
+        self._diff = np.empty((w, h, 3), dtype=np.int16)
+        self._out = np.empty((w, h, 3), dtype=np.int16)
+        self._src_surface = pygame.Surface((w, h), 0, target)   # same pixel format as the target
+        self._dst_surface = None
+        self._black = self._src_surface.copy()
+        self._black.fill((0, 0, 0))
+        self._numpy_ok = target.get_bitsize() in (24, 32)
+        self._started = None
+        self._step_times = deque(maxlen=1000)
+
+    @property
+    def active(self):
+        return self._started is not None
+
+    def start(self, surface, kind=None):
+        """ Begin a transition from the current target contents to surface
+        (None means black).
+        """
+        dst = surface if surface is not None else self._black
+        self._dst_surface = dst
+        if kind is not None:
+            self.kind = kind
+        if self.duration <= 0:
+            self.target.blit(dst, (0, 0))
+            self._started = None
+            return
+        self._src_surface.blit(self.target, (0, 0))
+        if self.kind == CROSSFADE and self._numpy_ok:
+            src = pygame.surfarray.pixels3d(self._src_surface)
+            new = pygame.surfarray.pixels3d(dst)
+            np.copyto(self._src, src)
+            np.subtract(new, src, out=self._diff, dtype=np.int16)
+            del src, new    # release the surface locks
+        self._started = time.monotonic()
+
+    def step(self, now=None):
+        """ Draw the frame for now into the target. Returns False once done.
+        """
+        if self._started is None:
+            return False
+        t0 = time.perf_counter()
+        now = time.monotonic() if now is None else now
+        t = min(1.0, (now - self._started) / self.duration)
+        w, h = self.target.get_size()
+        dst = self._dst_surface
+
+        if t >= 1.0:
+            self.target.blit(dst, (0, 0))
+        elif self.kind == WIPE:
+            x = int(w * t)
+            self.target.blit(dst, (0, 0), (0, 0, x, h))
+            self.target.blit(self._src_surface, (x, 0), (x, 0, w - x, h))
+        elif self.kind == SLIDE:
+            x = int(w * t)
+            self.target.blit(self._src_surface, (-x, 0))
+            self.target.blit(dst, (w - x, 0))
+        elif self._numpy_ok:
+            # out = src + diff * k / 128, k in 0..128 keeps diff * k inside int16
+            k = int(t * 128)
+            np.multiply(self._diff, k, out=self._out)
+            np.right_shift(self._out, 7, out=self._out)
+            np.add(self._out, self._src, out=self._out)
+            pixels = pygame.surfarray.pixels3d(self.target)
+            np.copyto(pixels, self._out, casting="unsafe")
+            del pixels
+        else:
+            # 16-bit targets: let SDL blend with per-surface alpha, still in place
+            self.target.blit(self._src_surface, (0, 0))
+            dst.set_alpha(int(t * 255))
+            self.target.blit(dst, (0, 0))
+            dst.set_alpha(None)
+
+        self._step_times.append(time.perf_counter() - t0)
+        if t >= 1.0:
+            self._started = None
+            self._dst_surface = None
+            return False
+        return True
+
+    def frame_stats(self, reset=True):
+        """ (mean_ms, max_ms, steps) of step() cost since the last call.
+        """
+        times = list(self._step_times)
+        if reset:
+            self._step_times.clear()
+        if not times:
+            return 0.0, 0.0, 0
+        return 1000.0 * sum(times) / len(times), 1000.0 * max(times), len(times)